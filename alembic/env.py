@@ -6,7 +6,7 @@ from sqlalchemy import pool
 from alembic import context
 
 # Import your models here - this is important for Alembic to detect model changes
-from app.model import SQLModel, Post, User, Vote  # Add all your model classes
+from app.model import SQLModel  # Importing the module registers every table
 # Import your database configuration
 from app.database import DATABASE_URL
 from app.config import settings
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -10,6 +11,82 @@ class Settings(BaseSettings):
     algorithm: str
     access_token_expire_minutes: int
     
+    # Media storage: "local" keeps every file under the first root, "sharded"
+    # spreads files over all roots (e.g. STORAGE_ROOTS='["/mnt/a", "/mnt/b"]')
+    storage_backend: str = "local"
+    storage_roots: list[str] = ["uploads/media"]
+    # Partial resumable uploads; outside "uploads", which is served as-is at
+    # /uploads, and on the same filesystem as the first storage root
+    upload_sessions_dir: str = "upload_sessions"
+    # Prepended to media URLs handed to clients
+    media_base_url: str = "//social-media-platform-jgf2.onrender.com"
+    
+    # Overrides the Postgres settings above, e.g. "sqlite:///local.db" for local tests
+    database_url: Optional[str] = None
+    # Run background jobs in the API processes; set to false when dedicated
+    # `python -m app.worker` processes run them
+    job_worker_in_app: bool = True
+    # The daily media garbage collection only reports what it would delete
+    # until this is set; check a report (app/services/media_gc.py) first
+    media_gc_delete: bool = False
+    
+    # Logging level of the app's loggers; SQL statement logging is very
+    # verbose and slows every query, so it is off unless asked for
+    log_level: str = "INFO"
+    sql_echo: bool = False
+    # Directory where workers share their metrics under gunicorn; empty it on start
+    metrics_dir: Optional[str] = None
+    # When set, /metrics requires "Authorization: Bearer <token>"
+    metrics_token: Optional[str] = None
+    # SQL statement budgets of the routes: "off", "warn" or "raise" (tests);
+    # strict loading makes lazy relationship loads raise
+    query_budget_mode: str = "off"
+    strict_loading: bool = False
+    # Request profiling: requests with an X-Profile header signed with this
+    # secret (python -m app.services.profiler --sign 600), plus this fraction
+    # of all requests, are sampled every profile_interval seconds and
+    # written to profile_dir as speedscope files
+    profile_secret: Optional[str] = None
+    profile_sample_rate: float = 0.0
+    profile_interval: float = 0.005
+    profile_dir: str = "profiles"
+    # Traffic capture for benchmarks/replay.py: this fraction of requests is
+    # recorded to capture_dir, in gzip files rotated past capture_file_bytes
+    capture_dir: Optional[str] = None
+    capture_sample_rate: float = 0.01
+    capture_body_limit: int = 4096
+    capture_file_bytes: int = 64 * 1024 * 1024
+    capture_keep_files: int = 20
+    # Admission control (app/services/admission.py): concurrency limits of the
+    # read and bulk classes move between these bounds; they are cut when pool
+    # waits exceed the target or latency exceeds latency_factor x its baseline
+    admission_control: bool = True
+    admission_max_concurrency: int = 100
+    admission_min_concurrency: int = 2
+    admission_pool_wait_target: float = 0.05
+    admission_latency_factor: float = 3.0
+    admission_retry_after: int = 2
+    # Rate limits (app/services/rate_limit.py): buckets are kept per worker in
+    # rate_limit_shards shards, or shared by the workers of the host in a
+    # memory-mapped file at rate_limit_shared_path
+    rate_limit_enabled: bool = True
+    rate_limit_shards: int = 16
+    rate_limit_max_keys: int = 100_000
+    rate_limit_shared_path: Optional[str] = None
+    rate_limit_shared_slots: int = 65536
+    # Coalescing of identical hot reads (app/services/single_flight.py); the
+    # window also shares finished results for that many seconds, 0 = in flight only
+    single_flight: bool = True
+    single_flight_window: float = 0.0
+    # Serving (app/serve.py): gunicorn workers, default one per available CPU,
+    # and the warm-up each worker does before accepting connections
+    web_concurrency: Optional[int] = None
+    # Proxies whose X-Forwarded-For header gives the client IP, comma separated
+    # or "*". Behind a load balancer (e.g. Render) this must include it, or
+    # every client appears as the proxy and shares its per-IP rate limits
+    forwarded_allow_ips: str = "127.0.0.1"
+    warmup_connections: int = 5
+    warmup_timeout: float = 30.0
     
     # This configures the settings to read from .env file
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
@@ -1,27 +1,36 @@
+import logging
 from sqlmodel import Session, create_engine, SQLModel
 from sqlalchemy.exc import SQLAlchemyError
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
 # Import all models to ensure they're registered with SQLModel
-DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
-engine = create_engine(DATABASE_URL, echo=True)
+DATABASE_URL = settings.database_url or f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+# SQLite connections are shared with the background worker threads
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, echo=settings.sql_echo, connect_args=connect_args)
 
 # Function to create tables based on defined models
 def create_db_and_tables():
     try:
         # Creating tables from all models
-        print("Creating tables...")
+        logger.info("Creating tables...")
         SQLModel.metadata.create_all(engine)
-        print("Tables created successfully!")
+        logger.info("Tables created successfully!")
+
+        # create_all never alters existing tables; add the newer columns and indexes
+        from app.services.schema_upgrade import upgrade_schema
+        upgrade_schema(engine)
         
         # Debug: Print all created tables
         from sqlalchemy import inspect
         inspector = inspect(engine)
         tables = inspector.get_table_names()
-        print(f"Available tables: {tables}")
+        logger.debug("Available tables: %s", tables)
         
     except SQLAlchemyError as e:
-        print(f"Error while creating tables: {e}")
+        logger.error("Error while creating tables: %s", e)
 
 # Create a session for use as a dependency
 def get_session():
@@ -15,10 +15,26 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 from app.routes.reel_vote import router as reel_vote_router
+from app.routes.reel_upload import router as reel_upload_router
+from app.routes.media import router as media_router
+from app.routes.realtime import router as realtime_router
+from app.services.realtime import realtime_hub
+from app.services.image_variants import image_variants
+from app.services.file_upload import delete_queue
+from app.services.jobs import job_worker
+from app import tasks  # noqa: F401  (registers the background tasks)
+from app.routes.metrics import router as metrics_router
+from app.routes.health import router as health_router
+from app.services.metrics import MetricsMiddleware, metrics_exporter
+from app.services.profiler import ProfilerMiddleware
+from app.services.traffic_capture import TrafficCaptureMiddleware, traffic_recorder
+from app.services.admission import AdmissionMiddleware
+from app.services.rate_limit import RateLimitMiddleware
+from app.services.readiness import readiness
 app = FastAPI()
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=settings.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
 
 # Add CORS middleware
@@ -33,18 +49,30 @@ origins = [
     "https://mayoengin.github.io"
   
 ]
+# Load shedding when the database falls behind; innermost, so shed 503s still get CORS headers
+app.add_middleware(AdmissionMiddleware)
+# Rate limits checked before the body is read, ahead of admission
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Upload-Offset", "Content-Range", "ETag", "Retry-After"],  # Comment cursors, resumable upload offsets, media ranges, load shedding
 )
+# Opt-in request profiling; a pass-through unless PROFILE_SECRET or PROFILE_SAMPLE_RATE is set
+app.add_middleware(ProfilerMiddleware)
+# Sampled traffic capture for replay; a pass-through unless CAPTURE_DIR is set
+app.add_middleware(TrafficCaptureMiddleware)
+# Request counts and latencies for /metrics; added last so it also times the CORS layer
+app.add_middleware(MetricsMiddleware)
 
 # Mount static files directory for serving uploaded files
+# Older uploads are still served from here; new media goes through /media
+os.makedirs("uploads", exist_ok=True)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 os.makedirs("static", exist_ok=True)
-os.makedirs("static/profile_pictures", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 # Include routers
 app.include_router(posts_router)
@@ -54,6 +82,11 @@ app.include_router(follow_router)
 app.include_router(comment_router)
 app.include_router(reels_router)  
 app.include_router(reel_vote_router)
+app.include_router(reel_upload_router)
+app.include_router(realtime_router)
+app.include_router(media_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
 @app.get("/")
 def root():
     return {"message": "Hello World"}
@@ -61,4 +94,60 @@ def root():
 # Optional: Initialize database on startup
 @app.on_event("startup")
 def on_startup():
-    create_db_and_tables()
\ No newline at end of file
+    create_db_and_tables()
+
+@app.on_event("startup")
+async def warm_up():
+    # Fills the pool and caches before the server accepts connections;
+    # /ready stays 503 (and warm-up is retried) if the database is down
+    await readiness.warm_up()
+
+@app.on_event("startup")
+async def start_realtime():
+    await realtime_hub.start()
+
+@app.on_event("startup")
+async def start_metrics_exporter():
+    # Shares this worker's metrics with the others when METRICS_DIR is set
+    metrics_exporter.start()
+
+@app.on_event("startup")
+async def start_traffic_recorder():
+    traffic_recorder.start()
+
+@app.on_event("startup")
+def start_job_worker():
+    # Purges, media garbage collection, counter repairs and other periodic
+    # work; dedicated workers take over when this is switched off
+    if settings.job_worker_in_app:
+        job_worker.start()
+
+@app.on_event("shutdown")
+async def stop_warm_up():
+    await readiness.stop()
+
+@app.on_event("shutdown")
+async def stop_realtime():
+    await realtime_hub.stop()
+
+@app.on_event("shutdown")
+async def stop_metrics_exporter():
+    await metrics_exporter.stop()
+
+@app.on_event("shutdown")
+async def stop_traffic_recorder():
+    await traffic_recorder.stop()
+
+@app.on_event("shutdown")
+def stop_image_variants():
+    image_variants.shutdown()
+
+@app.on_event("shutdown")
+def stop_job_worker():
+    # Jobs still running are taken over by another worker once their lease expires
+    job_worker.stop()
+
+@app.on_event("shutdown")
+def drain_media_deletes():
+    # Whatever is left after this is reclaimed by the media garbage collector
+    delete_queue.drain()
@@ -2,6 +2,7 @@ from sqlmodel import Relationship, SQLModel, Field
 from datetime import datetime
 from typing import Optional, List
 from pydantic import EmailStr, field_validator, ValidationInfo
+from sqlalchemy import Column, Index, JSON, func
 
 import re
 class PostBase(SQLModel):
@@ -17,6 +18,10 @@ class Post(PostBase, table=True):
     # created_at is automatically set to the current time (UTC)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     owner_id: int = Field(foreign_key="user.id", nullable=False)
+    # Maintained on write by the comment routes so listings never have to count
+    comment_count: int = Field(default=0)
+    # Set on delete: the post is hidden at once and removed by the purger
+    deleted_at: Optional[datetime] = None
     owner: Optional["User"] = Relationship(back_populates="posts")
     
     # Updated votes relationship to use the unified Vote model
@@ -41,6 +46,7 @@ class PostResponse(PostBase):
     created_at: datetime
     owner_id : int
     votes: int = 0
+    comment_count: int = 0
 
 
 class UserBase(SQLModel):
@@ -53,6 +59,13 @@ class User(UserBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     password: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Resized copies of the pictures, {"thumbnail": url, "medium": url, "full": url},
+    # filled in by the image variant pipeline after each upload
+    profile_picture_variants: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    background_image_variants: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    # Set on delete: the user and everything they own is hidden at once and
+    # removed by the purger
+    deleted_at: Optional[datetime] = None
     
     # Relationships
     posts: List["Post"] = Relationship(back_populates="owner")
@@ -61,6 +74,14 @@ class User(UserBase, table=True):
     comments: List["Comment"] = Relationship(back_populates="user")
     reels: List["Reel"] = Relationship(back_populates="owner")
 
+# Case-insensitive prefix search for username autocomplete; text_pattern_ops
+# lets Postgres use the index for LIKE 'prefix%' under any collation
+Index(
+    "ix_user_username_lower_prefix",
+    func.lower(User.username).label("username_lower"),
+    postgresql_ops={"username_lower": "text_pattern_ops"}
+)
+
 class UserCreate(UserBase):
     password: str
     password_confirm: str
@@ -97,6 +118,9 @@ class UserCreate(UserBase):
 class UserResponse(UserBase):
     id: int
     created_at: datetime
+    # None until the variants have been generated; clients use the original meanwhile
+    profile_picture_variants: Optional[dict[str, str]] = None
+    background_image_variants: Optional[dict[str, str]] = None
 
 class UserInfo(SQLModel):
     id: int
@@ -121,11 +145,19 @@ class ReelBase(SQLModel):
     video_url: str  # URL to the stored video file
     thumbnail_url: Optional[str] = None  # URL to thumbnail image
     duration: int  # Duration in seconds (max of 110 seconds = 1:50 mins)
+    # Read from the video's header when it is uploaded
+    width: Optional[int] = None
+    height: Optional[int] = None
+    codec: Optional[str] = None  # e.g. "avc1", "hvc1"
 
 class Reel(ReelBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     owner_id: int = Field(foreign_key="user.id", nullable=False)
+    # Maintained on write by the comment routes so listings never have to count
+    comment_count: int = Field(default=0)
+    # Set on delete: the reel is hidden at once and removed by the purger
+    deleted_at: Optional[datetime] = None
     owner: Optional["User"] = Relationship(back_populates="reels")
     
     # Relationships using existing models
@@ -150,11 +182,80 @@ class ReelResponse(ReelBase):
     created_at: datetime
     owner_id: int
     votes: int = 0
+    comment_count: int = 0
 
 class ReelWithOwnerResponse(ReelResponse):
     owner: UserInfo
+
+# Resumable reel uploads
+class ReelUploadCreate(SQLModel):
+    filename: str
+    size: int  # Total size of the video in bytes
+
+class ReelUploadStatus(SQLModel):
+    upload_id: str
+    offset: int  # Number of bytes received so far; the next chunk starts here
+    size: int
+# Content-addressed media: one row per stored file, shared by every upload
+# of the same bytes
+class MediaBlob(SQLModel, table=True):
+    sha256: str = Field(primary_key=True, max_length=64)
+    extension: str = ""  # Extension of the first upload, e.g. ".mp4"
+    size: int
+    ref_count: int = Field(default=0)  # Rows pointing at this blob; the file is removed at zero
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Background removal of a deleted user, post or reel and the rows that
+# depend on it; one row per delete, advanced one batch at a time
+class PurgeTask(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_purgetask_pending", "finished_at", "updated_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    entity: str  # "user", "post" or "reel"
+    entity_id: int
+    step: str  # Purge step in progress, e.g. "post_votes"
+    deleted_rows: int = Field(default=0)
+    failures: int = Field(default=0)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+# Background jobs: enqueued in the caller's transaction, claimed by workers
+# with FOR UPDATE SKIP LOCKED (or a conditional update on SQLite)
+class Job(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_job_claim", "status", "priority", "run_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task: str  # Name of a registered task, e.g. "purge"
+    payload: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    priority: int = Field(default=0)  # Higher runs first
+    status: str = Field(default="queued")  # queued, running, done or failed
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=5)
+    # Set for jobs that must be enqueued only once, e.g. one per period
+    dedupe_key: Optional[str] = Field(default=None, unique=True)
+    run_at: datetime = Field(default_factory=datetime.utcnow)  # Not claimed before this
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # A running job whose lease has expired is claimed again: its worker died
+    lease_expires_at: Optional[datetime] = None
+    worker: Optional[str] = None
+    last_error: Optional[str] = None
+
 # New models for Follow functionality
 class Follow(SQLModel, table=True):
+    # The primary key covers lookups by follower; the reverse index covers
+    # "who follows me" lookups used by the relationships endpoint
+    __table_args__ = (
+        Index("ix_follow_following_id_follower_id", "following_id", "follower_id"),
+    )
+
     follower_id: int = Field(ondelete="CASCADE", primary_key=True, foreign_key="user.id")
     following_id: int = Field(ondelete="CASCADE", primary_key=True, foreign_key="user.id")
 
@@ -164,11 +265,23 @@ class FollowResponse(SQLModel):
     follower: UserInfo
     following: UserInfo
 
+class RelationshipResponse(SQLModel):
+    user_id: int
+    follows: bool  # The current user follows this user
+    followed_by: bool  # This user follows the current user
+
 # New models for Comment functionality
 class CommentBase(SQLModel):
     content: str
 
 class Comment(CommentBase, table=True):
+    # Keyset pagination indexes: top-level comments per item, replies per thread
+    __table_args__ = (
+        Index("ix_comment_post_thread", "post_id", "parent_id", "created_at", "id"),
+        Index("ix_comment_reel_thread", "reel_id", "parent_id", "created_at", "id"),
+        Index("ix_comment_parent_created", "parent_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     user_id: int = Field(foreign_key="user.id", nullable=False)
@@ -176,6 +289,11 @@ class Comment(CommentBase, table=True):
     # Make post_id optional to allow comments on either posts or reels
     post_id: Optional[int] = Field(default=None, foreign_key="post.id", ondelete="CASCADE", nullable=True)
     reel_id: Optional[int] = Field(default=None, foreign_key="reel.id", ondelete="CASCADE", nullable=True)
+
+    # Threading: replies point at a top-level comment on the same post or reel
+    parent_id: Optional[int] = Field(default=None, foreign_key="comment.id", ondelete="CASCADE", nullable=True)
+    # Maintained on write so thread listings never have to count
+    reply_count: int = Field(default=0)
     
     # Relationships
     user: Optional["User"] = Relationship(back_populates="comments")
@@ -191,7 +309,7 @@ class Comment(CommentBase, table=True):
         return v
 
 class CommentCreate(CommentBase):
-    pass
+    parent_id: Optional[int] = None  # Set to reply to an existing comment
 
 class CommentResponse(CommentBase):
     id: int
@@ -199,6 +317,8 @@ class CommentResponse(CommentBase):
     user_id: int
     post_id: Optional[int] = None
     reel_id: Optional[int] = None
+    parent_id: Optional[int] = None
+    reply_count: int = 0
     user: UserInfo
 
 from pydantic import BaseModel, field_validator, ValidationInfo
@@ -34,7 +34,8 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def get_user_by_username(username: str, session: Session):
-    statement = select(User).where(User.username == username)
+    # Deleted users can neither log in nor use their existing tokens
+    statement = select(User).where(User.username == username, User.deleted_at.is_(None))
     return session.exec(statement).first()
 
 def authenticate_user(username: str, password: str, session: Session):
@@ -43,18 +44,22 @@ def authenticate_user(username: str, password: str, session: Session):
         return False
     return user
 
+def decode_access_token(token: str) -> Union[str, None]:
+    """Return the username in a valid access token, or None"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
 def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    username = decode_access_token(token)
+    if username is None:
         raise credentials_exception
 
     user = get_user_by_username(username, session)
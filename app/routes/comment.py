@@ -1,13 +1,136 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlmodel import Session, select
+from sqlalchemy import and_, or_, tuple_, update
+from sqlalchemy.orm import aliased
+from typing import Optional
 from app.database import get_session
 from app.model import Post, Reel, Comment, CommentCreate, CommentResponse, User, UserInfo
 from app.routes.auth import get_current_user
+from app.services.pagination import encode_cursor, decode_cursor
+from app.services.export import ndjson_response
+from app.services.realtime import realtime_hub, post_topic, reel_topic
+from app.services.soft_delete import get_visible_post, get_visible_reel
+from app.services.query_budget import query_budget
+from app.services.admission import admission_class
 
 router = APIRouter(
     tags=["comments"]
 )
 
+# Page size limits for comment and reply listings
+DEFAULT_COMMENT_PAGE_SIZE = 20
+MAX_COMMENT_PAGE_SIZE = 100
+
+# Response header carrying the cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _to_response(comment: Comment, username: str) -> CommentResponse:
+    return CommentResponse(
+        id=comment.id,
+        content=comment.content,
+        created_at=comment.created_at,
+        user_id=comment.user_id,
+        post_id=comment.post_id,
+        reel_id=comment.reel_id,
+        parent_id=comment.parent_id,
+        reply_count=comment.reply_count,
+        user=UserInfo(id=comment.user_id, username=username)
+    )
+
+
+def _create_comment(
+    session: Session,
+    current_user: User,
+    comment: CommentCreate,
+    post_id: Optional[int] = None,
+    reel_id: Optional[int] = None
+) -> CommentResponse:
+    parent_id = comment.parent_id
+
+    if parent_id is not None:
+        # The parent must belong to the same post or reel
+        parent = session.get(Comment, parent_id)
+        if not parent or parent.post_id != post_id or parent.reel_id != reel_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Comment with ID {parent_id} not found"
+            )
+        # Threads are one level deep: replying to a reply joins the same thread
+        if parent.parent_id is not None:
+            parent_id = parent.parent_id
+
+    new_comment = Comment(
+        content=comment.content,
+        post_id=post_id,
+        reel_id=reel_id,
+        parent_id=parent_id,
+        user_id=current_user.id
+    )
+    session.add(new_comment)
+
+    # Keep the denormalized counters in step, in the same transaction
+    if post_id is not None:
+        session.exec(update(Post).where(Post.id == post_id).values(comment_count=Post.comment_count + 1))
+    else:
+        session.exec(update(Reel).where(Reel.id == reel_id).values(comment_count=Reel.comment_count + 1))
+    if parent_id is not None:
+        session.exec(update(Comment).where(Comment.id == parent_id).values(reply_count=Comment.reply_count + 1))
+
+    session.commit()
+    session.refresh(new_comment)
+
+    response = _to_response(new_comment, current_user.username)
+
+    # Push the new comment to clients watching this post or reel
+    topic = post_topic(post_id) if post_id is not None else reel_topic(reel_id)
+    realtime_hub.publish(topic, {
+        "type": "comment_created",
+        "coalesce_key": new_comment.id,
+        "comment": response.model_dump(mode="json")
+    })
+
+    return response
+
+
+def _list_comments(session: Session, response: Response, condition, limit: int, cursor: Optional[str]):
+    # Join the author in the same query instead of loading users one by one;
+    # comments of deleted users are hidden until the purger removes them
+    query = select(Comment, User.username).join(User, User.id == Comment.user_id).where(
+        condition, User.deleted_at.is_(None)
+    )
+
+    if cursor:
+        try:
+            created_at, comment_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        query = query.where(tuple_(Comment.created_at, Comment.id) > tuple_(created_at, comment_id))
+
+    # Fetch one extra row to know whether another page exists
+    query = query.order_by(Comment.created_at, Comment.id).limit(limit + 1)
+    rows = session.exec(query).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
+
+    return [_to_response(comment, username) for comment, username in rows]
+
+
+def _export_comments(condition, filename: str):
+    # Every comment including replies, in insertion order
+    query = select(Comment, User.username).join(User, User.id == Comment.user_id).where(
+        condition, User.deleted_at.is_(None)
+    ).order_by(Comment.id)
+    return ndjson_response(
+        query,
+        lambda row: _to_response(row[0], row[1]).model_dump_json(),
+        filename=filename
+    )
+
+
 # Post comments
 @router.post("/posts/{post_id}/comment", response_model=CommentResponse, status_code=status.HTTP_201_CREATED)
 def create_post_comment(
@@ -17,77 +140,51 @@ def create_post_comment(
     current_user: User = Depends(get_current_user)
 ):
     # Check if post exists
-    post = session.get(Post, post_id)
+    post = get_visible_post(session, post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post with ID {post_id} not found"
         )
-    
-    # Create new comment
-    new_comment = Comment(
-        content=comment.content,
-        post_id=post_id,
-        user_id=current_user.id
-    )
-    
-    session.add(new_comment)
-    session.commit()
-    session.refresh(new_comment)
-    
-    # Create UserInfo for response
-    user_info = UserInfo(id=current_user.id, username=current_user.username)
-    
-    # Create CommentResponse
-    comment_response = CommentResponse(
-        id=new_comment.id,
-        content=new_comment.content,
-        created_at=new_comment.created_at,
-        user_id=new_comment.user_id,
-        post_id=new_comment.post_id,
-        reel_id=None,
-        user=user_info
-    )
-    
-    return comment_response
 
-@router.get("/posts/{post_id}/comments", response_model=list[CommentResponse])
+    return _create_comment(session, current_user, comment, post_id=post_id)
+
+@router.get("/posts/{post_id}/comments", response_model=list[CommentResponse], dependencies=[query_budget(3), admission_class("bulk")])
 def get_post_comments(
     post_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_COMMENT_PAGE_SIZE, ge=1, le=MAX_COMMENT_PAGE_SIZE),
+    cursor: Optional[str] = None,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     # Check if post exists
-    post = session.get(Post, post_id)
+    post = get_visible_post(session, post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post with ID {post_id} not found"
         )
-    
-    # Get comments for the post
-    query = select(Comment).where(Comment.post_id == post_id).order_by(Comment.created_at)
-    comments = session.exec(query).all()
-    
-    # Create response with user info
-    comments_response = []
-    for comment in comments:
-        user = session.get(User, comment.user_id)
-        user_info = UserInfo(id=user.id, username=user.username)
-        
-        comment_response = CommentResponse(
-            id=comment.id,
-            content=comment.content,
-            created_at=comment.created_at,
-            user_id=comment.user_id,
-            post_id=comment.post_id,
-            reel_id=None,
-            user=user_info
+
+    # Top-level comments only; replies are fetched per thread
+    condition = (Comment.post_id == post_id) & (Comment.parent_id.is_(None))
+    return _list_comments(session, response, condition, limit, cursor)
+
+@router.get("/posts/{post_id}/comments/export", dependencies=[admission_class("bulk")])
+def export_post_comments(
+    post_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    # Check if post exists
+    post = get_visible_post(session, post_id)
+    if not post:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Post with ID {post_id} not found"
         )
-        
-        comments_response.append(comment_response)
-    
-    return comments_response
+
+    return _export_comments(Comment.post_id == post_id, f"post_{post_id}_comments.ndjson")
 
 # Reel comments
 @router.post("/reels/{reel_id}/comment", response_model=CommentResponse, status_code=status.HTTP_201_CREATED)
@@ -98,74 +195,84 @@ def create_reel_comment(
     current_user: User = Depends(get_current_user)
 ):
     # Check if reel exists
-    reel = session.get(Reel, reel_id)
+    reel = get_visible_reel(session, reel_id)
     if not reel:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Reel with ID {reel_id} not found"
         )
-    
-    # Create new comment
-    new_comment = Comment(
-        content=comment.content,
-        reel_id=reel_id,
-        user_id=current_user.id
-    )
-    
-    session.add(new_comment)
-    session.commit()
-    session.refresh(new_comment)
-    
-    # Create UserInfo for response
-    user_info = UserInfo(id=current_user.id, username=current_user.username)
-    
-    # Create CommentResponse
-    comment_response = CommentResponse(
-        id=new_comment.id,
-        content=new_comment.content,
-        created_at=new_comment.created_at,
-        user_id=new_comment.user_id,
-        post_id=None,
-        reel_id=new_comment.reel_id,
-        user=user_info
-    )
-    
-    return comment_response
 
-@router.get("/reels/{reel_id}/comments", response_model=list[CommentResponse])
+    return _create_comment(session, current_user, comment, reel_id=reel_id)
+
+@router.get("/reels/{reel_id}/comments", response_model=list[CommentResponse], dependencies=[query_budget(3), admission_class("bulk")])
 def get_reel_comments(
     reel_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_COMMENT_PAGE_SIZE, ge=1, le=MAX_COMMENT_PAGE_SIZE),
+    cursor: Optional[str] = None,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     # Check if reel exists
-    reel = session.get(Reel, reel_id)
+    reel = get_visible_reel(session, reel_id)
     if not reel:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Reel with ID {reel_id} not found"
         )
-    
-    # Get comments for the reel
-    query = select(Comment).where(Comment.reel_id == reel_id).order_by(Comment.created_at)
-    comments = session.exec(query).all()
-    
-    # Create response with user info
-    comments_response = []
-    for comment in comments:
-        user = session.get(User, comment.user_id)
-        user_info = UserInfo(id=user.id, username=user.username)
-        
-        comment_response = CommentResponse(
-            id=comment.id,
-            content=comment.content,
-            created_at=comment.created_at,
-            user_id=comment.user_id,
-            post_id=None,
-            reel_id=comment.reel_id,
-            user=user_info
+
+    # Top-level comments only; replies are fetched per thread
+    condition = (Comment.reel_id == reel_id) & (Comment.parent_id.is_(None))
+    return _list_comments(session, response, condition, limit, cursor)
+
+@router.get("/reels/{reel_id}/comments/export", dependencies=[admission_class("bulk")])
+def export_reel_comments(
+    reel_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    # Check if reel exists
+    reel = get_visible_reel(session, reel_id)
+    if not reel:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Reel with ID {reel_id} not found"
         )
-        
-        comments_response.append(comment_response)
-    
-    return comments_response
\ No newline at end of file
+
+    return _export_comments(Comment.reel_id == reel_id, f"reel_{reel_id}_comments.ndjson")
+
+# Replies
+@router.get("/comments/{comment_id}/replies", response_model=list[CommentResponse], dependencies=[query_budget(3), admission_class("bulk")])
+def get_comment_replies(
+    comment_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_COMMENT_PAGE_SIZE, ge=1, le=MAX_COMMENT_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    # Check that the comment exists and that the post or reel it belongs to,
+    # and its owner, are not deleted; one statement, like get_visible_post
+    post_owner = aliased(User)
+    reel_owner = aliased(User)
+    query = (
+        select(Comment.id)
+        .outerjoin(Post, Post.id == Comment.post_id)
+        .outerjoin(post_owner, post_owner.id == Post.owner_id)
+        .outerjoin(Reel, Reel.id == Comment.reel_id)
+        .outerjoin(reel_owner, reel_owner.id == Reel.owner_id)
+        .where(
+            Comment.id == comment_id,
+            or_(
+                and_(Post.id.is_not(None), Post.deleted_at.is_(None), post_owner.deleted_at.is_(None)),
+                and_(Reel.id.is_not(None), Reel.deleted_at.is_(None), reel_owner.deleted_at.is_(None))
+            )
+        )
+    )
+    if session.exec(query).first() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Comment with ID {comment_id} not found"
+        )
+
+    return _list_comments(session, response, Comment.parent_id == comment_id, limit, cursor)
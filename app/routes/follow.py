@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlmodel import Session, select
+from sqlalchemy import and_, case, or_
 from app.database import get_session
-from app.model import User, Follow, UserInfo, FollowResponse
+from app.model import User, Follow, UserInfo, FollowResponse, RelationshipResponse
 from app.routes.auth import get_current_user
+from app.services.relationship_cache import relationship_cache
+from app.services.soft_delete import get_visible_user
+from app.services.query_budget import query_budget
+from app.services.admission import admission_class
+
+# Maximum number of user ids accepted by /users/relationships
+MAX_RELATIONSHIP_IDS = 500
 
 # Corrected: Use a simple prefix that matches the expected URLs
 router = APIRouter(
@@ -17,7 +25,7 @@ def follow_user(
     current_user: User = Depends(get_current_user)
 ):
     # Check if the user exists
-    user_to_follow = session.get(User, user_id)
+    user_to_follow = get_visible_user(session, user_id)
     if not user_to_follow:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -49,6 +57,7 @@ def follow_user(
     new_follow = Follow(follower_id=current_user.id, following_id=user_id)
     session.add(new_follow)
     session.commit()
+    relationship_cache.invalidate(current_user.id, user_id)
 
     return {"message": f"You are now following user with ID {user_id}"}
 
@@ -59,7 +68,7 @@ def unfollow_user(
     current_user: User = Depends(get_current_user)
 ):
     # Check if the user exists
-    user_to_unfollow = session.get(User, user_id)
+    user_to_unfollow = get_visible_user(session, user_id)
     if not user_to_unfollow:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -83,10 +92,11 @@ def unfollow_user(
     # Remove the follow relationship
     session.delete(follow)
     session.commit()
+    relationship_cache.invalidate(current_user.id, user_id)
 
     return {"message": f"You have unfollowed user with ID {user_id}"}
 
-@router.get("/followers", response_model=list[UserInfo])
+@router.get("/followers", response_model=list[UserInfo], dependencies=[query_budget(2), admission_class("bulk")])
 def get_followers(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
@@ -96,13 +106,13 @@ def get_followers(
         Follow, 
         (Follow.follower_id == User.id) & 
         (Follow.following_id == current_user.id)
-    )
+    ).where(User.deleted_at.is_(None))
     
     followers = session.exec(query).all()
     
     return [UserInfo(id=follower.id, username=follower.username) for follower in followers]
 
-@router.get("/following", response_model=list[UserInfo])
+@router.get("/following", response_model=list[UserInfo], dependencies=[query_budget(2), admission_class("bulk")])
 def get_following(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
@@ -112,8 +122,65 @@ def get_following(
         Follow, 
         (Follow.following_id == User.id) & 
         (Follow.follower_id == current_user.id)
-    )
+    ).where(User.deleted_at.is_(None))
     
     following = session.exec(query).all()
     
-    return [UserInfo(id=user.id, username=user.username) for user in following]
\ No newline at end of file
+    return [UserInfo(id=user.id, username=user.username) for user in following]
+
+@router.get("/relationships", response_model=list[RelationshipResponse])
+def get_relationships(
+    ids: str = Query(..., description="Comma-separated user ids"),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    # Parse and de-duplicate the requested ids, keeping their order
+    try:
+        user_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma-separated list of integers"
+        )
+
+    if len(user_ids) > MAX_RELATIONSHIP_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_RELATIONSHIP_IDS} ids can be requested at once"
+        )
+
+    # Serve what we can from the per-user cache
+    states, missing = relationship_cache.get_many(current_user.id, user_ids)
+
+    if missing:
+        # One query covers both directions: the primary key answers
+        # "do I follow them" and the reverse index answers "do they follow me"
+        # Deleted users keep their follows until the purge, so they are
+        # joined in and left out, as in the follower and following lists
+        other_id = case((Follow.follower_id == current_user.id, Follow.following_id), else_=Follow.follower_id)
+        query = select(Follow.follower_id, Follow.following_id).join(User, User.id == other_id).where(
+            or_(
+                and_(Follow.follower_id == current_user.id, Follow.following_id.in_(missing)),
+                and_(Follow.following_id == current_user.id, Follow.follower_id.in_(missing))
+            ),
+            User.deleted_at.is_(None)
+        )
+
+        fetched = {user_id: (False, False) for user_id in missing}
+        for follower_id, following_id in session.exec(query).all():
+            if follower_id == current_user.id:
+                other_id = following_id
+                follows, followed_by = fetched[other_id]
+                fetched[other_id] = (True, followed_by)
+            if following_id == current_user.id:
+                other_id = follower_id
+                follows, followed_by = fetched[other_id]
+                fetched[other_id] = (follows, True)
+
+        relationship_cache.set_many(current_user.id, fetched)
+        states.update(fetched)
+
+    return [
+        RelationshipResponse(user_id=user_id, follows=states[user_id][0], followed_by=states[user_id][1])
+        for user_id in user_ids
+    ]
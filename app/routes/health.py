@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response, status
+
+from app.services.admission import admission_class
+from app.services.readiness import readiness
+
+router = APIRouter(tags=["health"])
+
+
+# For load balancers and orchestrators: 503 while warming up or draining.
+# Never shed, like /metrics, or an overloaded worker would look dead.
+@router.get("/ready", include_in_schema=False, dependencies=[admission_class("critical")])
+async def ready(response: Response):
+    if not readiness.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": readiness.state, "detail": readiness.detail}
@@ -0,0 +1,73 @@
+import mimetypes
+import os
+import re
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.admission import admission_class
+from app.services.file_upload import media_path
+from app.services.media_delivery import MediaFileResponse, IMMUTABLE_CACHE_CONTROL
+
+# Serves the content-addressed media store (reel videos, thumbnails,
+# pictures) with byte ranges, immutable caching and sha-based ETags
+router = APIRouter(
+    prefix="/media",
+    tags=["media"]
+)
+
+# Only the exact layout written by the media store is accepted:
+# <sha[0:2]>/<sha[2:4]>/<sha><ext>, so no path can escape the storage roots
+_MEDIA_PATH = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/(([0-9a-f]{64})(\.[a-z0-9]{1,8})?)$")
+
+# Types mimetypes does not know on every platform
+_MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".mov": "video/quicktime",
+    ".avi": "video/x-msvideo",
+    ".webp": "image/webp",
+}
+
+
+def _media_type(extension: str) -> str:
+    return (
+        _MEDIA_TYPES.get(extension)
+        or mimetypes.guess_type(f"file{extension}")[0]
+        or "application/octet-stream"
+    )
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" matches "x"
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+# Files only, no database: never shed by admission control
+@router.api_route("/{path:path}", methods=["GET", "HEAD"], include_in_schema=False, dependencies=[admission_class("exempt")])
+async def get_media(path: str, request: Request):
+    match = _MEDIA_PATH.match(path)
+    if not match or match.group(4)[:2] != match.group(1) or match.group(4)[2:4] != match.group(2):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media not found")
+    sha256 = match.group(4)
+    extension = match.group(5) or ""
+    etag = f'"{sha256}"'
+
+    # The name is the content hash, so a matching ETag never needs a disk access
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        )
+
+    file_path = media_path(sha256, extension)
+    try:
+        stat_result = await run_in_threadpool(os.stat, file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media not found")
+
+    # Range, If-Range and HEAD are handled by the response itself
+    return MediaFileResponse(file_path, sha256, stat_result, media_type=_media_type(extension))
@@ -0,0 +1,49 @@
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.services.admission import admission_class
+from app.services.jobs import queue_metrics
+from app.services.metrics import CONTENT_TYPE, local_state, metrics_exporter, render, render_gauge
+
+logger = logging.getLogger(__name__)
+
+# Prometheus scrape endpoint: request and job metrics of every worker,
+# plus the job queue depth read from the database
+router = APIRouter(
+    tags=["metrics"]
+)
+
+
+def _render(own_state: dict) -> str:
+    merged = metrics_exporter.collect(own_state)
+    try:
+        queues = queue_metrics()
+    except Exception:
+        logger.exception("Failed to read job queue depth")
+        queues = {}
+    extra = "".join((
+        render_gauge("jobs_queued", "Jobs waiting to run", ("task",),
+                     {(name, ): depth["queued"] for name, depth in queues.items()}),
+        render_gauge("jobs_running", "Jobs claimed by a worker", ("task",),
+                     {(name, ): depth["running"] for name, depth in queues.items()}),
+        render_gauge("jobs_dead", "Failed jobs kept for inspection", ("task",),
+                     {(name, ): depth["failed"] for name, depth in queues.items()}),
+        render_gauge("jobs_oldest_due_seconds", "How long the oldest due job has waited", ("task",),
+                     {(name, ): depth["oldest_due_seconds"] for name, depth in queues.items()}),
+    ))
+    return render(merged, extra)
+
+
+# Scrapes are never shed: they are how an overload gets noticed
+@router.get("/metrics", include_in_schema=False, dependencies=[admission_class("critical")])
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if settings.metrics_token and authorization != f"Bearer {settings.metrics_token}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    # Copy this worker's state on the event loop, where it is updated, then
+    # read the other workers' snapshots and the database off the loop
+    own_state = local_state()
+    return Response(await run_in_threadpool(_render, own_state), media_type=CONTENT_TYPE)
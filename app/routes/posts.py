@@ -3,6 +3,11 @@ from sqlmodel import Session, select
 from app.database import get_session
 from app.model import Post, PostCreate, PostResponse, User, PostWithOwnerResponse, PostVote, UserInfo  # Changed Vote to PostVote
 from app.routes.auth import get_current_user
+from app.services.soft_delete import mark_deleted, get_visible_post
+from app.services.query_budget import query_budget
+from app.services.admission import admission_class
+from app.services.rate_limit import rate_limit
+from app.services.single_flight import single_flight
 from typing import Optional
 from sqlalchemy import func
 
@@ -12,7 +17,12 @@ router = APIRouter(
     tags=["posts"]
 )
 
-@router.get("/", response_model=list[PostWithOwnerResponse])
+# Authentication plus one query, whatever the page size
+# Title searches scan the table, so they are rate limited; plain listings are not
+@router.get(
+    "/", response_model=list[PostWithOwnerResponse],
+    dependencies=[query_budget(3), admission_class("bulk"), rate_limit("search", rate=1, burst=20, query_param="search")]
+)
 def get_posts(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user),
@@ -22,8 +32,10 @@ def get_posts(
 ):
     # Join Post with User and count votes
     # FIXED: Removed the incorrect reel_id condition
+    # The owner's username comes from the join, not a lookup per post
     query = select(
         Post, 
+        User.username,
         func.count(PostVote.post_id).label("PostVote")
     ).join(
         User, 
@@ -33,6 +45,10 @@ def get_posts(
         PostVote, 
         PostVote.post_id == Post.id, 
         isouter=True  # Left outer join as posts might not have votes
+    ).where(
+        # Deleted posts, and posts of deleted users, are hidden until purged
+        Post.deleted_at.is_(None),
+        User.deleted_at.is_(None)
     ).group_by(
         Post.id, User.id
     )
@@ -45,10 +61,8 @@ def get_posts(
     
     # Format the results
     posts_with_details = []
-    for post, votes in results:
-        # Get the owner separately to ensure we get the right structure
-        owner = session.get(User, post.owner_id)
-        owner_info = UserInfo(id=owner.id, username=owner.username)
+    for post, owner_username, votes in results:
+        owner_info = UserInfo(id=post.owner_id, username=owner_username)
         
         # Create the response object
         post_response = PostWithOwnerResponse(
@@ -59,6 +73,7 @@ def get_posts(
             created_at=post.created_at,
             owner_id=post.owner_id,
             votes=votes,
+            comment_count=post.comment_count,
             owner=owner_info
         )
         
@@ -93,7 +108,7 @@ def create_post(
     
     return post_response
 
-@router.get("/latest", response_model=PostWithOwnerResponse)
+@router.get("/latest", response_model=PostWithOwnerResponse, dependencies=[query_budget(3)])
 def get_latest_post(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
@@ -101,41 +116,51 @@ def get_latest_post(
     # Query that joins Post with Vote to count votes for the latest post
     query = select(
         Post, 
+        User.username,
         func.count(PostVote.post_id).label("votes")
+    ).join(
+        User,
+        Post.owner_id == User.id
     ).join(
         PostVote, 
         PostVote.post_id == Post.id, 
         isouter=True
+    ).where(
+        Post.deleted_at.is_(None),
+        User.deleted_at.is_(None)
     ).group_by(
-        Post.id
+        Post.id, User.id
     ).order_by(Post.id.desc()).limit(1)
     
-    result = session.exec(query).first()
-    
-    if not result:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No posts found")
-    
-    post, votes = result
+    def load_post():
+        result = session.exec(query).first()
+        if not result:
+            return None
+        post, owner_username, votes = result
+        owner_info = UserInfo(id=post.owner_id, username=owner_username)
+        
+        # Create the response with owner and votes
+        return PostWithOwnerResponse(
+            id=post.id,
+            title=post.title,
+            content=post.content,
+            published=post.published,
+            created_at=post.created_at,
+            owner_id=post.owner_id,
+            votes=votes,
+            comment_count=post.comment_count,
+            owner=owner_info
+        )
     
-    # Get the owner
-    owner = session.get(User, post.owner_id)
-    owner_info = UserInfo(id=owner.id, username=owner.username)
+    # Concurrent requests for the same post share one query and its response
+    post_response = single_flight.do("get_latest_post", (), load_post)
     
-    # Create the response with owner and votes
-    post_response = PostWithOwnerResponse(
-        id=post.id,
-        title=post.title,
-        content=post.content,
-        published=post.published,
-        created_at=post.created_at,
-        owner_id=post.owner_id,
-        votes=votes,
-        owner=owner_info
-    )
+    if post_response is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No posts found")
     
     return post_response
 
-@router.get("/{id}", response_model=PostWithOwnerResponse)
+@router.get("/{id}", response_model=PostWithOwnerResponse, dependencies=[query_budget(3)])
 def get_post_by_id(
     id: int,
     session: Session = Depends(get_session),
@@ -144,35 +169,46 @@ def get_post_by_id(
     # Query that joins Post with Vote to count votes for the specific post
     query = select(
         Post, 
+        User.username,
         func.count(PostVote.post_id).label("votes")
+    ).join(
+        User,
+        Post.owner_id == User.id
     ).join(
         PostVote, 
         PostVote.post_id == Post.id, 
         isouter=True
-    ).filter(Post.id == id).group_by(Post.id)
-    
-    result = session.exec(query).first()
+    ).filter(
+        Post.id == id,
+        Post.deleted_at.is_(None),
+        User.deleted_at.is_(None)
+    ).group_by(Post.id, User.id)
     
-    if not result:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No post with ID {id}")
-    
-    post, votes = result
+    def load_post():
+        result = session.exec(query).first()
+        if not result:
+            return None
+        post, owner_username, votes = result
+        owner_info = UserInfo(id=post.owner_id, username=owner_username)
+        
+        # Create the response with owner and votes
+        return PostWithOwnerResponse(
+            id=post.id,
+            title=post.title,
+            content=post.content,
+            published=post.published,
+            created_at=post.created_at,
+            owner_id=post.owner_id,
+            votes=votes,
+            comment_count=post.comment_count,
+            owner=owner_info
+        )
     
-    # Get the owner
-    owner = session.get(User, post.owner_id)
-    owner_info = UserInfo(id=owner.id, username=owner.username)
+    # Concurrent requests for the same post share one query and its response
+    post_response = single_flight.do("get_post_by_id", (id,), load_post)
     
-    # Create the response with owner and votes
-    post_response = PostWithOwnerResponse(
-        id=post.id,
-        title=post.title,
-        content=post.content,
-        published=post.published,
-        created_at=post.created_at,
-        owner_id=post.owner_id,
-        votes=votes,
-        owner=owner_info
-    )
+    if post_response is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No post with ID {id}")
     
     return post_response
 
@@ -183,7 +219,7 @@ def delete_post(
     current_user: User = Depends(get_current_user)
 ):
     # Retrieve post by ID
-    post = session.get(Post, id)
+    post = get_visible_post(session, id)
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post with ID {id} not found")
     
@@ -191,7 +227,8 @@ def delete_post(
     if post.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this post")
     
-    session.delete(post)
+    # Hide the post now; its votes and comments are removed in the background
+    mark_deleted(session, post)
     session.commit()
     return
 
@@ -203,7 +240,7 @@ def update_post(
     current_user: User = Depends(get_current_user)
 ):
     # Retrieve post by ID
-    post = session.get(Post, id)
+    post = get_visible_post(session, id)
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post with ID {id} not found")
     
@@ -232,7 +269,8 @@ def update_post(
         published=post.published,
         created_at=post.created_at,
         owner_id=post.owner_id,
-        votes=vote_count or 0
+        votes=vote_count or 0,
+        comment_count=post.comment_count
     )
     
     return response
\ No newline at end of file
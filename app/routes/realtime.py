@@ -0,0 +1,60 @@
+import re
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+
+from app.database import engine
+from app.routes.auth import decode_access_token, get_user_by_username
+from app.services.realtime import realtime_hub
+
+router = APIRouter(
+    tags=["realtime"]
+)
+
+# Topics clients may subscribe to: "post:<id>" or "reel:<id>"
+TOPIC_PATTERN = re.compile(r"^(post|reel):\d+$")
+
+
+def _user_exists(username: str) -> bool:
+    # Short-lived session: a connection must not hold a pooled DB connection
+    with Session(engine) as session:
+        return get_user_by_username(username, session) is not None
+
+
+@router.websocket("/ws")
+async def realtime_gateway(websocket: WebSocket, token: str = Query(...)):
+    """
+    Push comment and vote events for subscribed posts and reels.
+
+    Client messages: {"action": "subscribe" | "unsubscribe", "topic": "post:1"}
+    Server messages: {"events": [...]}, flushed at most once per tick
+    """
+    # Browsers cannot set an Authorization header on WebSockets, so the
+    # access token comes in the query string
+    username = decode_access_token(token)
+    if username is None or not await run_in_threadpool(_user_exists, username):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    connection = realtime_hub.connect(websocket)
+    try:
+        while True:
+            message = await websocket.receive_json()
+            action = message.get("action") if isinstance(message, dict) else None
+            topic = message.get("topic") if isinstance(message, dict) else None
+
+            if not isinstance(topic, str) or not TOPIC_PATTERN.match(topic):
+                await websocket.send_json({"error": "Invalid topic"})
+            elif action == "subscribe":
+                if not realtime_hub.subscribe(connection, topic):
+                    await websocket.send_json({"error": "Too many subscriptions", "topic": topic})
+            elif action == "unsubscribe":
+                realtime_hub.unsubscribe(connection, topic)
+            else:
+                await websocket.send_json({"error": "Unknown action"})
+    except (WebSocketDisconnect, ValueError):
+        # ValueError: the client sent something that is not JSON
+        pass
+    finally:
+        realtime_hub.disconnect(connection)
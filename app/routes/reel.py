@@ -2,31 +2,63 @@ from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File,
 from sqlmodel import Session, select
 from typing import Optional
 from sqlalchemy import func
-import os
-import shutil
-import uuid
+from fastapi.concurrency import run_in_threadpool
 
 from app.database import get_session
 from app.model import User, Reel, ReelCreate, ReelResponse, ReelWithOwnerResponse, UserInfo, ReelVote, Comment, CommentCreate, CommentResponse
 from app.routes.auth import get_current_user
+from app.services.file_upload import store_upload, FileTooLargeError
+from app.services.soft_delete import mark_deleted, get_visible_reel
+from app.services.query_budget import query_budget
+from app.services.admission import admission_class
+from app.services.rate_limit import rate_limit
+from app.services.video_metadata import VideoMetadata, VideoMetadataError, probe_video
 
 router = APIRouter(
     prefix="/reels",
     tags=["reels"]
 )
 
-# Configure file storage
-UPLOAD_DIR = "uploads/reels"
+# Upload limits; files go to the media store (app/services/file_upload.py)
 MAX_VIDEO_SIZE = 50 * 1024 * 1024  # 50MB limit (adjust as needed)
+MAX_THUMBNAIL_SIZE = 5 * 1024 * 1024  # 5MB limit for thumbnails
 ALLOWED_EXTENSIONS = {"mp4", "mov", "avi"}
-
-# Helper to ensure upload directory exists
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+MAX_REEL_DURATION = 110  # 1:50 mins
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@router.post("/", response_model=ReelResponse, status_code=status.HTTP_201_CREATED)
+def invalid_video(reason: str):
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f"Invalid video: {reason}"
+    )
+
+def check_video_duration(metadata: VideoMetadata):
+    """Reject videos longer than MAX_REEL_DURATION"""
+    if metadata.duration > MAX_REEL_DURATION:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Video is {metadata.duration:.1f} seconds long; reels can be at most {MAX_REEL_DURATION} seconds"
+        )
+
+def read_video_metadata(file) -> VideoMetadata:
+    """
+    Read and validate the metadata of a complete video file object.
+
+    Only the header boxes are read, then the file is rewound for storing.
+    """
+    try:
+        metadata = probe_video(file)
+    except VideoMetadataError as e:
+        raise invalid_video(str(e))
+    finally:
+        file.seek(0)
+    check_video_duration(metadata)
+    return metadata
+
+# Uploads share the "upload" limit with resumable uploads (reel_upload.py)
+@router.post("/", response_model=ReelResponse, status_code=status.HTTP_201_CREATED, dependencies=[rate_limit("upload", rate=1 / 60, burst=10)])
 async def create_reel(
     title: str = Form(...),
     description: Optional[str] = Form(None),
@@ -42,14 +74,19 @@ async def create_reel(
             detail="Invalid video format. Allowed formats: mp4, mov, avi"
         )
     
-    # Create unique filename
-    video_filename = f"{uuid.uuid4()}_{video_file.filename}"
-    video_path = os.path.join(UPLOAD_DIR, video_filename)
+    # Read duration, dimensions and codec from the header boxes and reject
+    # over-length videos before anything is stored
+    metadata = await run_in_threadpool(read_video_metadata, video_file.file)
     
-    # Save video file
+    # Save video file to the media store in chunks off the event loop,
+    # enforcing the size limit. Identical uploads share one stored file.
     try:
-        with open(video_path, "wb") as buffer:
-            shutil.copyfileobj(video_file.file, buffer)
+        video = await store_upload(session, video_file, max_size=MAX_VIDEO_SIZE)
+    except FileTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Video exceeds the maximum size of {MAX_VIDEO_SIZE // (1024 * 1024)}MB"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -57,25 +94,42 @@ async def create_reel(
         )
     
     # Handle thumbnail if provided
-    thumbnail_url = None
-    if thumbnail:
-        thumbnail_filename = f"{uuid.uuid4()}_{thumbnail.filename}"
-        thumbnail_path = os.path.join(UPLOAD_DIR, thumbnail_filename)
-        try:
-            with open(thumbnail_path, "wb") as buffer:
-                shutil.copyfileobj(thumbnail.file, buffer)
-            thumbnail_url = f"/uploads/reels/{thumbnail_filename}"
-        except Exception:
-            # Continue even if thumbnail upload fails
-            pass
+    thumbnail_url = await save_thumbnail(session, thumbnail)
     
+    return create_reel_record(session, current_user, title, description, video.url, thumbnail_url, metadata)
+
+
+async def save_thumbnail(session: Session, thumbnail: Optional[UploadFile]) -> Optional[str]:
+    """Store an optional thumbnail and return its URL; failures are ignored"""
+    if not thumbnail:
+        return None
+    try:
+        return (await store_upload(session, thumbnail, max_size=MAX_THUMBNAIL_SIZE)).url
+    except Exception:
+        # Continue even if thumbnail upload fails
+        return None
+
+
+def create_reel_record(
+    session: Session,
+    current_user: User,
+    title: str,
+    description: Optional[str],
+    video_url: str,
+    thumbnail_url: Optional[str],
+    metadata: VideoMetadata
+) -> ReelResponse:
+    """Insert the Reel row for a stored video and commit, together with the media references"""
     # Create new reel record
     new_reel = Reel(
         title=title,
         description=description,
-        video_url=f"/uploads/reels/{video_filename}",
+        video_url=video_url,
         thumbnail_url=thumbnail_url,
-        duration=110,  # Set a default of 1:50 (110 seconds) - ideally this would be extracted from the video
+        duration=round(metadata.duration),
+        width=metadata.width,
+        height=metadata.height,
+        codec=metadata.codec,
         owner_id=current_user.id
     )
     
@@ -91,6 +145,9 @@ async def create_reel(
         video_url=new_reel.video_url,
         thumbnail_url=new_reel.thumbnail_url,
         duration=new_reel.duration,
+        width=new_reel.width,
+        height=new_reel.height,
+        codec=new_reel.codec,
         created_at=new_reel.created_at,
         owner_id=new_reel.owner_id,
         votes=0
@@ -99,7 +156,12 @@ async def create_reel(
     return reel_response
 
 
-@router.get("/", response_model=list[ReelWithOwnerResponse])
+# Authentication plus one query, whatever the page size
+# Title searches scan the table, so they are rate limited; plain listings are not
+@router.get(
+    "/", response_model=list[ReelWithOwnerResponse],
+    dependencies=[query_budget(3), admission_class("bulk"), rate_limit("search", rate=1, burst=20, query_param="search")]
+)
 def get_reels(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user),
@@ -107,9 +169,11 @@ def get_reels(
     skip: int = 0,
     search: Optional[str] = ""
 ):
-    # Join Reel with User and count votes
+    # Join Reel with User and count votes; the owner's username comes from
+    # the join, not a lookup per reel
     query = select(
         Reel, 
+        User.username,
         func.count(ReelVote.reel_id).label("votes")
     ).join(
         User, 
@@ -119,6 +183,10 @@ def get_reels(
         ReelVote, 
         ReelVote.reel_id == Reel.id, 
         isouter=True
+    ).where(
+        # Deleted reels, and reels of deleted users, are hidden until purged
+        Reel.deleted_at.is_(None),
+        User.deleted_at.is_(None)
     ).group_by(
         Reel.id, User.id
     )
@@ -131,10 +199,8 @@ def get_reels(
     
     # Format the results
     reels_with_details = []
-    for reel, votes in results:
-        # Get the owner
-        owner = session.get(User, reel.owner_id)
-        owner_info = UserInfo(id=owner.id, username=owner.username)
+    for reel, owner_username, votes in results:
+        owner_info = UserInfo(id=reel.owner_id, username=owner_username)
         
         # Create the response object
         reel_response = ReelWithOwnerResponse(
@@ -144,9 +210,13 @@ def get_reels(
             video_url=reel.video_url,
             thumbnail_url=reel.thumbnail_url,
             duration=reel.duration,
+            width=reel.width,
+            height=reel.height,
+            codec=reel.codec,
             created_at=reel.created_at,
             owner_id=reel.owner_id,
             votes=votes,
+            comment_count=reel.comment_count,
             owner=owner_info
         )
         
@@ -154,7 +224,7 @@ def get_reels(
     
     return reels_with_details
 
-@router.get("/{id}", response_model=ReelWithOwnerResponse)
+@router.get("/{id}", response_model=ReelWithOwnerResponse, dependencies=[query_budget(3)])
 def get_reel_by_id(
     id: int,
     session: Session = Depends(get_session),
@@ -163,23 +233,28 @@ def get_reel_by_id(
     # Query that joins Reel with ReelVote to count votes
     query = select(
         Reel, 
+        User.username,
         func.count(ReelVote.reel_id).label("votes")
+    ).join(
+        User,
+        Reel.owner_id == User.id
     ).join(
         ReelVote, 
         ReelVote.reel_id == Reel.id, 
         isouter=True
-    ).filter(Reel.id == id).group_by(Reel.id)
+    ).filter(
+        Reel.id == id,
+        Reel.deleted_at.is_(None),
+        User.deleted_at.is_(None)
+    ).group_by(Reel.id, User.id)
     
     result = session.exec(query).first()
     
     if not result:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No reel with ID {id}")
     
-    reel, votes = result
-    
-    # Get the owner
-    owner = session.get(User, reel.owner_id)
-    owner_info = UserInfo(id=owner.id, username=owner.username)
+    reel, owner_username, votes = result
+    owner_info = UserInfo(id=reel.owner_id, username=owner_username)
     
     # Create the response with owner and votes
     reel_response = ReelWithOwnerResponse(
@@ -189,9 +264,13 @@ def get_reel_by_id(
         video_url=reel.video_url,
         thumbnail_url=reel.thumbnail_url,
         duration=reel.duration,
+        width=reel.width,
+        height=reel.height,
+        codec=reel.codec,
         created_at=reel.created_at,
         owner_id=reel.owner_id,
         votes=votes,
+        comment_count=reel.comment_count,
         owner=owner_info
     )
     
@@ -204,7 +283,7 @@ def delete_reel(
     current_user: User = Depends(get_current_user)
 ):
     # Retrieve reel by ID
-    reel = session.get(Reel, id)
+    reel = get_visible_reel(session, id)
     if not reel:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Reel with ID {id} not found")
     
@@ -212,24 +291,8 @@ def delete_reel(
     if reel.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this reel")
     
-    # Delete associated files
-    if reel.video_url:
-        try:
-            video_path = os.path.join(os.getcwd(), reel.video_url.lstrip('/'))
-            if os.path.exists(video_path):
-                os.remove(video_path)
-        except Exception:
-            # Continue with deletion even if file removal fails
-            pass
-            
-    if reel.thumbnail_url:
-        try:
-            thumbnail_path = os.path.join(os.getcwd(), reel.thumbnail_url.lstrip('/'))
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
-        except Exception:
-            pass
-    
-    session.delete(reel)
+    # Hide the reel now; the purger removes its votes and comments and
+    # releases its files in the background
+    mark_deleted(session, reel)
     session.commit()
     return
\ No newline at end of file
@@ -0,0 +1,212 @@
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+from starlette.requests import ClientDisconnect
+from typing import Optional
+
+from app.database import get_session
+from app.model import User, ReelResponse, ReelUploadCreate, ReelUploadStatus
+from app.routes.auth import get_current_user
+from app.routes.reel import (
+    allowed_file,
+    invalid_video,
+    check_video_duration,
+    save_thumbnail,
+    create_reel_record,
+    MAX_VIDEO_SIZE
+)
+from app.services.file_upload import commit_file, FileTooLargeError
+from app.services.rate_limit import rate_limit
+from app.services import resumable_upload
+from app.services.resumable_upload import (
+    ChunkWriter,
+    UploadNotFoundError,
+    UploadBusyError,
+    OffsetMismatchError,
+    UploadIncompleteError
+)
+from app.services.video_metadata import VideoMetadataError, probe_video_path
+
+# Resumable upload protocol for large reels:
+#   POST   /reels/uploads                      create a session
+#   PUT    /reels/uploads/{upload_id}?offset=  append raw bytes at offset
+#   GET    /reels/uploads/{upload_id}          query the current offset
+#   POST   /reels/uploads/{upload_id}/finalize create the reel
+#   DELETE /reels/uploads/{upload_id}          abandon the upload
+router = APIRouter(
+    prefix="/reels/uploads",
+    tags=["reel_uploads"]
+)
+
+
+def _not_found(upload_id: str):
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Upload {upload_id} not found"
+    )
+
+
+def _busy(upload_id: str):
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"Upload {upload_id} is being written or finalized by another request"
+    )
+
+
+@router.post(
+    "", response_model=ReelUploadStatus, status_code=status.HTTP_201_CREATED,
+    dependencies=[rate_limit("upload", rate=1 / 60, burst=10)]
+)
+def create_upload(
+    upload: ReelUploadCreate,
+    current_user: User = Depends(get_current_user)
+):
+    # Validate file size and type before any data is sent
+    if not allowed_file(upload.filename):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid video format. Allowed formats: mp4, mov, avi"
+        )
+    if upload.size <= 0 or upload.size > MAX_VIDEO_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Video must be between 1 byte and {MAX_VIDEO_SIZE // (1024 * 1024)}MB"
+        )
+
+    upload_id = resumable_upload.create_session(current_user.id, upload.filename, upload.size)
+    return ReelUploadStatus(upload_id=upload_id, offset=0, size=upload.size)
+
+
+@router.get("/{upload_id}", response_model=ReelUploadStatus)
+def get_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        meta = resumable_upload.get_session(upload_id, current_user.id)
+    except UploadNotFoundError:
+        raise _not_found(upload_id)
+    return ReelUploadStatus(upload_id=upload_id, offset=meta["offset"], size=meta["size"])
+
+
+@router.put("/{upload_id}", response_model=ReelUploadStatus)
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        writer = await run_in_threadpool(ChunkWriter, upload_id, current_user.id, offset)
+    except UploadNotFoundError:
+        raise _not_found(upload_id)
+    except UploadBusyError:
+        raise _busy(upload_id)
+    except OffsetMismatchError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Expected offset {e.offset}",
+            headers={"Upload-Offset": str(e.offset)}
+        )
+
+    # Stream the body to disk; disk writes run in the threadpool
+    too_large = False
+    try:
+        async for data in request.stream():
+            block = writer.add(data)
+            if block:
+                await run_in_threadpool(writer.write, block)
+    except FileTooLargeError:
+        too_large = True
+    except ClientDisconnect:
+        # Keep what arrived; the client resumes from the stored offset
+        pass
+    finally:
+        new_offset = await run_in_threadpool(writer.close)
+
+    if too_large:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Chunk goes past the declared size of {writer.size} bytes",
+            headers={"Upload-Offset": str(new_offset)}
+        )
+
+    # The header is probed as chunks arrive, so over-length or unreadable
+    # videos are refused without receiving the rest of the file
+    try:
+        if writer.video_error:
+            raise invalid_video(writer.video_error)
+        if writer.video is not None:
+            check_video_duration(writer.video)
+    except HTTPException:
+        await run_in_threadpool(resumable_upload.delete_session, upload_id)
+        raise
+
+    return ReelUploadStatus(upload_id=upload_id, offset=new_offset, size=writer.size)
+
+
+@router.post("/{upload_id}/finalize", response_model=ReelResponse, status_code=status.HTTP_201_CREATED)
+async def finalize_upload(
+    upload_id: str,
+    title: str = Form(...),
+    description: Optional[str] = Form(None),
+    thumbnail: Optional[UploadFile] = File(None),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        data_path, size, sha256, filename, video = await run_in_threadpool(
+            resumable_upload.claim_for_finalize, upload_id, current_user.id
+        )
+    except UploadNotFoundError:
+        raise _not_found(upload_id)
+    except UploadBusyError:
+        raise _busy(upload_id)
+    except UploadIncompleteError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload incomplete: received {e.offset} of {e.size} bytes",
+            headers={"Upload-Offset": str(e.offset)}
+        )
+
+    # Normally recorded by the last chunk; read it now if that did not happen
+    try:
+        if video is None:
+            try:
+                video = await run_in_threadpool(probe_video_path, data_path)
+            except VideoMetadataError as e:
+                raise invalid_video(str(e))
+        check_video_duration(video)
+    except HTTPException:
+        # Retrying cannot fix the video, so drop the upload
+        await run_in_threadpool(resumable_upload.delete_session, upload_id)
+        raise
+
+    try:
+        # The assembled file is renamed into the media store, not copied
+        stored = commit_file(session, data_path, sha256, size, filename)
+        thumbnail_url = await save_thumbnail(session, thumbnail)
+        reel_response = create_reel_record(
+            session, current_user, title, description, stored.url, thumbnail_url, video
+        )
+    except Exception:
+        session.rollback()
+        # Let the client retry finalize if the data has not been moved yet
+        await run_in_threadpool(resumable_upload.release_claim, upload_id)
+        raise
+
+    await run_in_threadpool(resumable_upload.delete_session, upload_id)
+    return reel_response
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        resumable_upload.get_session(upload_id, current_user.id)
+    except UploadNotFoundError:
+        raise _not_found(upload_id)
+    resumable_upload.delete_session(upload_id)
+    return
@@ -3,6 +3,9 @@ from sqlmodel import Session, select, SQLModel
 from app.database import get_session
 from app.model import Reel, ReelVote, User
 from app.routes.auth import get_current_user
+from app.services.realtime import realtime_hub, reel_topic
+from app.services.soft_delete import get_visible_reel
+from app.services.rate_limit import rate_limit
 from typing import Optional
 
 router = APIRouter(
@@ -14,14 +17,15 @@ class ReelVoteRequest(SQLModel):
     reel_id: int
 from sqlalchemy import func
 
-@router.post("/like", status_code=status.HTTP_201_CREATED)
+# Shares the "vote" limit with the post vote toggle
+@router.post("/like", status_code=status.HTTP_201_CREATED, dependencies=[rate_limit("vote", rate=2, burst=30)])
 def vote_reel(
     vote_request: ReelVoteRequest,
     db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     # Check if reel exists
-    reel = db.get(Reel, vote_request.reel_id)
+    reel = get_visible_reel(db, vote_request.reel_id)
     if not reel:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reel not found")
        
@@ -45,6 +49,9 @@ def vote_reel(
     vote_count = db.exec(
         select(func.count()).where(ReelVote.reel_id == vote_request.reel_id)
     ).one()
+
+    # Push the new total to clients watching this reel
+    realtime_hub.publish(reel_topic(vote_request.reel_id), {"type": "vote_count", "votes": vote_count})
     
     # Determine if current user has liked the reel
     user_vote = db.exec(
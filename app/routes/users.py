@@ -2,17 +2,21 @@ from fastapi import (
     APIRouter, 
     Depends, 
     HTTPException, 
+    Query,
     status, 
     File, 
     UploadFile
 )
 from sqlmodel import Session, select
+from sqlalchemy import func
 from app.database import get_session
+from app.config import settings
 from app.model import (
     User, 
     UserCreate, 
     UserResponse, 
-    UserUpdateRequest
+    UserUpdateRequest,
+    UserInfo
 )
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordRequestForm
@@ -20,10 +24,21 @@ from .auth import authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MI
 from datetime import timedelta
 import re
 import os
-import uuid
-import shutil
+import logging
 # Import the file upload service
-from app.services.file_upload import save_uploaded_file, get_file_url
+from app.services.file_upload import store_file, release_media, FileTooLargeError
+from app.services.export import ndjson_response
+from app.services.username_index import username_index
+from app.services.relationship_cache import relationship_cache
+from app.services.image_variants import image_variants
+from app.services.soft_delete import mark_deleted, get_visible_user
+from app.services.admission import admission_class
+from app.services.rate_limit import rate_limit
+
+logger = logging.getLogger(__name__)
+
+# Maximum size of profile pictures and background images
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -36,7 +51,7 @@ router = APIRouter(
 @router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 def create_user(user: UserCreate, session: Session = Depends(get_session)):
     # Check if email already exists
-    existing_user = session.exec(select(User).where(User.email == user.email)).first()
+    existing_user = session.exec(select(User).where(User.email == user.email, User.deleted_at.is_(None))).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -55,14 +70,45 @@ def create_user(user: UserCreate, session: Session = Depends(get_session)):
     session.add(new_user)
     session.commit()
     session.refresh(new_user)
+    username_index.add(new_user.id, new_user.username)
     
     return new_user
 
-@router.get("/", response_model=list[UserResponse])
+@router.get("/", response_model=list[UserResponse], dependencies=[admission_class("bulk")])
 def get_users(session: Session = Depends(get_session)):
-    users = session.exec(select(User)).all()
+    users = session.exec(select(User).where(User.deleted_at.is_(None))).all()
     return users
 
+@router.get("/export", dependencies=[admission_class("bulk")])
+def export_users(current_user: User = Depends(get_current_user)):
+    """Stream every user as NDJSON, one UserResponse per line"""
+    query = select(User).where(User.deleted_at.is_(None)).order_by(User.id)
+    return ndjson_response(
+        query,
+        lambda user: UserResponse.model_validate(user).model_dump_json(),
+        filename="users.ndjson"
+    )
+
+@router.get("/autocomplete", response_model=list[UserInfo], dependencies=[admission_class("bulk")])
+def autocomplete_users(
+    prefix: str = Query(..., min_length=1, max_length=50),
+    limit: int = Query(10, ge=1, le=50),
+    session: Session = Depends(get_session)
+):
+    """Case-insensitive username prefix search for mention pickers"""
+    matches = username_index.search(session, prefix, limit)
+
+    if matches is None:
+        # Index still loading: use the lower(username) text_pattern_ops index
+        pattern = prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = select(User.id, User.username).where(
+            func.lower(User.username).like(pattern, escape="\\"),
+            User.deleted_at.is_(None)
+        ).order_by(func.lower(User.username)).limit(limit)
+        matches = session.exec(query).all()
+
+    return [UserInfo(id=user_id, username=username) for user_id, username in matches]
+
 @router.get("/me", response_model=UserResponse)
 def get_current_user_profile(current_user: User = Depends(get_current_user)):
     """Get the current user's profile"""
@@ -79,7 +125,7 @@ def update_current_user_profile(
         if user_update.email:
             # Check if email is already taken by another user
             existing_email_user = session.exec(
-                select(User).where(User.email == user_update.email)
+                select(User).where(User.email == user_update.email, User.deleted_at.is_(None))
             ).first()
             
             if existing_email_user and existing_email_user.id != current_user.id:
@@ -94,7 +140,7 @@ def update_current_user_profile(
         if user_update.phone_number is not None:
             # Check if phone number is already taken by another user
             existing_phone_user = session.exec(
-                select(User).where(User.phone_number == user_update.phone_number)
+                select(User).where(User.phone_number == user_update.phone_number, User.deleted_at.is_(None))
             ).first()
             
             if existing_phone_user and existing_phone_user.id != current_user.id:
@@ -138,7 +184,7 @@ def update_current_user_profile(
         # Rollback in case of any unexpected errors
         session.rollback()
         # Log the error for debugging
-        print(f"Unexpected error during profile update: {e}")
+        logger.exception("Unexpected error during profile update: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred while updating profile"
@@ -146,14 +192,14 @@ def update_current_user_profile(
 
 @router.get("/id/{user_id}", response_model=UserResponse)
 def get_user(user_id: int, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+    user = get_visible_user(session, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with ID {user_id} not found")
     return user
 
 @router.get("/username/{username}", response_model=UserResponse)
 def get_user_by_name(username: str, session: Session = Depends(get_session)):
-    statement = select(User).where(User.username == username)
+    statement = select(User).where(User.username == username, User.deleted_at.is_(None))
     user = session.exec(statement).first()
     
     if not user:
@@ -163,13 +209,13 @@ def get_user_by_name(username: str, session: Session = Depends(get_session)):
 
 @router.put("/{user_id}", response_model=UserResponse)
 def update_user(user_id: int, user_data: UserCreate, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+    user = get_visible_user(session, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with ID {user_id} not found")
     
     # Check if email already exists and belongs to a different user
     if user_data.email != user.email:
-        existing_user = session.exec(select(User).where(User.email == user_data.email)).first()
+        existing_user = session.exec(select(User).where(User.email == user_data.email, User.deleted_at.is_(None))).first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -177,36 +223,50 @@ def update_user(user_id: int, user_data: UserCreate, session: Session = Depends(
             )
     
     # Update user data
+    old_username = user.username
     user.username = user_data.username
     user.email = user_data.email
     user.password = pwd_context.hash(user_data.password)
     
     session.commit()
     session.refresh(user)
+    if user.username != old_username:
+        username_index.rename(user.id, old_username, user.username)
     return user
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_user(user_id: int, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+    user = get_visible_user(session, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with ID {user_id} not found")
-    session.delete(user)
+    # Hide the user and their content now; the purger removes their posts,
+    # reels, comments, votes and follows in the background
+    mark_deleted(session, user)
     session.commit()
+    username_index.remove(user_id, user.username)
+    relationship_cache.forget_target(user_id)
     return
 
-@router.post("/login")
+# Every attempt costs a bcrypt check. Guessing one account is limited per
+# client IP and username, so clients behind one proxy do not share that
+# bucket; the looser per-IP bucket stops one address spraying guesses over
+# all accounts, and is checked before the form is read
+@router.post("/login", dependencies=[
+    rate_limit("login_ip", rate=1, burst=50, key="ip"),
+    rate_limit("login", rate=0.2, burst=10, key="ip", form_field="username"),
+])
 def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
-    print(f"Login attempt for username: {form_data.username}")
+    logger.debug("Login attempt for username: %s", form_data.username)
     user = authenticate_user(form_data.username, form_data.password, session)
     if not user:
-        print(f"Authentication failed for username: {form_data.username}")
+        logger.warning("Authentication failed for username: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
-    print(f"Successful login for username: {form_data.username}")
+    logger.info("Successful login for username: %s", form_data.username)
     return {"access_token": access_token, "token_type": "bearer"}
 @router.post("/upload-profile-picture", response_model=UserResponse)
 def upload_profile_picture(
@@ -223,46 +283,45 @@ def upload_profile_picture(
                 detail="Invalid file type. Only JPEG, PNG, and GIF are allowed."
             )
        
-        # Define upload directory - make absolute path
-        upload_dir = os.path.join(os.getcwd(), "static", "profile_pictures")
-       
-        # Ensure directory exists
-        os.makedirs(upload_dir, exist_ok=True)
-       
-        # Generate a unique filename
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(upload_dir, unique_filename)
-       
-        # Log the file path for debugging
-        print(f"Saving file to: {file_path}")
-       
-        # Save the file directly
+        # Save the file to the content-addressed media store
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            stored = store_file(session, file.file, file.filename, max_size=MAX_IMAGE_SIZE)
         except Exception as save_error:
-            print(f"File save error: {save_error}")
+            logger.warning("File save error: %s", save_error)
             raise
            
         # Generate file URL with full domain
-        # Replace with your actual backend URL or use config
-        backend_url = "//social-media-platform-jgf2.onrender.com"  # Update this to your actual URL
-        file_url = f"{backend_url}/static/profile_pictures/{unique_filename}"
-        print(f"File URL: {file_url}")
+        file_url = f"{settings.media_base_url}{stored.url}"
+        logger.debug("File URL: %s", file_url)
        
-        # Update user's profile picture
+        # Update user's profile picture, releasing the previous one and its variants
+        release_media(session, current_user.profile_picture)
+        for variant_url in (current_user.profile_picture_variants or {}).values():
+            release_media(session, variant_url)
         current_user.profile_picture = file_url
+        current_user.profile_picture_variants = None
         session.commit()
         session.refresh(current_user)
+        
+        # Resized variants are generated in the background; until they are
+        # ready clients use the original
+        image_variants.submit(current_user.id, "profile_picture", file_url, stored.path, settings.media_base_url)
        
         return current_user
    
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    
+    except FileTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image exceeds the maximum size of {MAX_IMAGE_SIZE // (1024 * 1024)}MB"
+        )
+    
     except Exception as e:
         # Log the full error for debugging
-        import traceback
-        print(f"Error uploading profile picture: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error uploading profile picture: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload profile picture: {str(e)}"
@@ -283,41 +342,43 @@ def upload_background_image(
                 detail="Invalid file type. Only JPEG, PNG, and GIF are allowed."
             )
        
-        # Define upload directory - make absolute path
-        upload_dir = os.path.join(os.getcwd(), "static", "background_images")
-       
-        # Ensure directory exists
-        os.makedirs(upload_dir, exist_ok=True)
-       
-        # Generate a unique filename
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(upload_dir, unique_filename)
-       
-        # Save the file directly
+        # Save the file to the content-addressed media store
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            stored = store_file(session, file.file, file.filename, max_size=MAX_IMAGE_SIZE)
         except Exception as save_error:
-            print(f"File save error: {save_error}")
+            logger.warning("File save error: %s", save_error)
             raise
            
         # Generate file URL with full domain
-        # Replace with your actual backend URL or use config
-        backend_url = "//social-media-platform-jgf2.onrender.com"  # Update this to your actual URL
-        file_url = f"{backend_url}/static/background_images/{unique_filename}"
+        file_url = f"{settings.media_base_url}{stored.url}"
        
-        # Update user's background image
+        # Update user's background image, releasing the previous one and its variants
+        release_media(session, current_user.background_image)
+        for variant_url in (current_user.background_image_variants or {}).values():
+            release_media(session, variant_url)
         current_user.background_image = file_url
+        current_user.background_image_variants = None
         session.commit()
         session.refresh(current_user)
+        
+        # Resized variants are generated in the background; until they are
+        # ready clients use the original
+        image_variants.submit(current_user.id, "background_image", file_url, stored.path, settings.media_base_url)
        
         return current_user
    
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    
+    except FileTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image exceeds the maximum size of {MAX_IMAGE_SIZE // (1024 * 1024)}MB"
+        )
+    
     except Exception as e:
-        import traceback
-        print(f"Error uploading background image: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error uploading background image: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload background image: {str(e)}"
@@ -3,7 +3,11 @@ from sqlmodel import Session, select, SQLModel
 from app.database import get_session
 from app.model import Post, Reel, PostVote, ReelVote, User  # Import the new models
 from app.routes.auth import get_current_user
+from app.services.realtime import realtime_hub, post_topic, reel_topic
+from app.services.soft_delete import get_visible_post, get_visible_reel
+from app.services.rate_limit import rate_limit
 from typing import Optional
+from sqlalchemy import func
 
 router = APIRouter(
     prefix="/vote",
@@ -14,7 +18,20 @@ class VoteRequest(SQLModel):
     post_id: Optional[int] = None
     reel_id: Optional[int] = None
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
+def publish_post_votes(db: Session, post_id: int):
+    # Only count when some client can receive the new total
+    topic = post_topic(post_id)
+    if realtime_hub.is_watched(topic):
+        votes = db.exec(select(func.count()).where(PostVote.post_id == post_id)).one()
+        realtime_hub.publish(topic, {"type": "vote_count", "votes": votes})
+
+def publish_reel_votes(db: Session, reel_id: int):
+    topic = reel_topic(reel_id)
+    if realtime_hub.is_watched(topic):
+        votes = db.exec(select(func.count()).where(ReelVote.reel_id == reel_id)).one()
+        realtime_hub.publish(topic, {"type": "vote_count", "votes": votes})
+
+@router.post("/", status_code=status.HTTP_201_CREATED, dependencies=[rate_limit("vote", rate=2, burst=30)])
 def vote(
     vote_request: VoteRequest,
     db: Session = Depends(get_session),
@@ -33,7 +50,7 @@ def vote(
         post_id = vote_request.post_id
        
         # Check if post exists
-        post = db.get(Post, post_id)
+        post = get_visible_post(db, post_id)
         if not post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
            
@@ -46,12 +63,14 @@ def vote(
             # Remove vote if it exists
             db.delete(existing_vote)
             db.commit()
+            publish_post_votes(db, post_id)
             return {"message": "Vote removed from post"}
         else:
             # Add new vote
             new_vote = PostVote(post_id=post_id, user_id=current_user.id)
             db.add(new_vote)
             db.commit()
+            publish_post_votes(db, post_id)
             return {"message": "Vote added to post"}
    
     # Handle reel vote
@@ -59,7 +78,7 @@ def vote(
         reel_id = vote_request.reel_id
        
         # Check if reel exists
-        reel = db.get(Reel, reel_id)
+        reel = get_visible_reel(db, reel_id)
         if not reel:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reel not found")
            
@@ -72,10 +91,12 @@ def vote(
             # Remove vote if it exists
             db.delete(existing_vote)
             db.commit()
+            publish_reel_votes(db, reel_id)
             return {"message": "Vote removed from reel"}
         else:
             # Add new vote
             new_vote = ReelVote(reel_id=reel_id, user_id=current_user.id)
             db.add(new_vote)
             db.commit()
+            publish_reel_votes(db, reel_id)
             return {"message": "Vote added to reel"}
\ No newline at end of file
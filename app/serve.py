@@ -0,0 +1,177 @@
+# app/serve.py
+"""
+Production server: gunicorn managing Uvicorn workers.
+
+    python -m app.serve --bind 0.0.0.0:8000
+    python -m app.serve --workers 8 --drain-delay 10 --graceful-timeout 60
+
+Runs one worker per CPU available to the process (affinity mask and
+cgroup quota), unless --workers or WEB_CONCURRENCY is set. Each worker is
+an event loop, and sync routes already run in its threadpool. Workers use
+uvloop and httptools. The app is imported once in the master and the
+workers are forked from it, so they share its code and module data
+copy-on-write. gc.freeze keeps the collector from writing to, and thereby
+copying, those pages. Each worker fills its database pool and caches
+before it accepts connections; GET /ready reports its state.
+
+On SIGTERM a worker keeps serving for --drain-delay seconds while /ready
+answers 503, so load balancers stop routing to it. It then stops
+accepting, finishes in-flight requests and runs the shutdown handlers,
+all within --graceful-timeout seconds.
+
+Client IPs are taken from X-Forwarded-For only when the connection comes
+from an address in --forwarded-allow-ips (FORWARDED_ALLOW_IPS). Behind a
+load balancer, set it to the balancer's addresses, or "*" when only the
+balancer can reach the workers. Left at the default, every request seems
+to come from the balancer, and per-IP rate limits apply to all clients
+together.
+"""
+import argparse
+import gc
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.arbiter import Arbiter
+from uvicorn.server import Server
+from uvicorn.workers import UvicornWorker
+
+from app.config import settings
+from app.services.readiness import readiness
+
+logger = logging.getLogger(__name__)
+
+# Seconds of the graceful timeout kept for the shutdown handlers
+SHUTDOWN_SECONDS = 5
+
+
+def available_cpus() -> int:
+    """CPUs this process may use, counting the affinity mask and a cgroup v2 quota"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            count = min(count, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, count)
+
+
+class DrainingServer(Server):
+    """Uvicorn server that reports draining on /ready for a while before it stops accepting"""
+
+    def __init__(self, config, drain_delay: float):
+        super().__init__(config)
+        self.drain_delay = drain_delay
+        self._drain_timer = None
+
+    def handle_exit(self, sig, frame):
+        readiness.start_draining()
+        if sig != signal.SIGTERM or self.drain_delay <= 0 or self._drain_timer is not None:
+            if self._drain_timer is not None:
+                self._drain_timer.cancel()
+            super().handle_exit(sig, frame)
+            return
+        logger.info("Draining: still serving for %ss", self.drain_delay)
+        self._drain_timer = threading.Timer(self.drain_delay, super().handle_exit, (sig, frame))
+        self._drain_timer.daemon = True
+        self._drain_timer.start()
+
+
+class AppWorker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+    drain_delay = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # In-flight requests get what is left of gunicorn's graceful timeout
+        # after the drain delay, minus time for the shutdown handlers
+        self.config.timeout_graceful_shutdown = max(
+            1, int(self.cfg.graceful_timeout - self.drain_delay - SHUTDOWN_SECONDS)
+        )
+
+    async def _serve(self):
+        # UvicornWorker._serve with the draining server
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config, drain_delay=self.drain_delay)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+
+def _pre_fork(server, worker):
+    # Objects loaded so far are left alone by the collector, so the pages
+    # holding them stay shared with the workers
+    gc.freeze()
+
+
+def _post_fork(server, worker):
+    from app.database import engine
+
+    # Connections opened by the master must not be shared with the workers
+    engine.dispose(close=False)
+
+
+class Application(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from sqlalchemy.orm import configure_mappers
+
+        from app.main import app
+
+        # Done once here instead of on the first query of every worker
+        configure_mappers()
+        gc.collect()
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bind", default="0.0.0.0:8000", help="address or unix:PATH")
+    parser.add_argument("--workers", type=int, default=settings.web_concurrency or available_cpus())
+    parser.add_argument("--drain-delay", type=float, default=5, help="seconds reported as draining before closing")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds from SIGTERM to forced exit")
+    parser.add_argument("--timeout", type=int, default=30, help="restart a worker silent for this long")
+    parser.add_argument("--keepalive", type=int, default=5, help="idle seconds before closing a keep-alive connection")
+    parser.add_argument("--max-requests", type=int, default=0, help="recycle workers after this many requests")
+    parser.add_argument("--forwarded-allow-ips", default=settings.forwarded_allow_ips, help="proxies trusted for X-Forwarded-*")
+    parser.add_argument("--access-log", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    AppWorker.drain_delay = args.drain_delay
+    Application({
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": AppWorker,
+        "preload_app": True,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "keepalive": args.keepalive,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "forwarded_allow_ips": args.forwarded_allow_ips,
+        "accesslog": "-" if args.access_log else None,
+        "loglevel": settings.log_level.lower(),
+        "pre_fork": _pre_fork,
+        "post_fork": _post_fork,
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
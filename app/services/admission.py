@@ -0,0 +1,289 @@
+# app/services/admission.py
+"""
+Admission control: shed low-priority requests before the database pool
+saturates.
+
+Requests fall into three classes:
+
+- ``critical``: writes and authentication (any method but GET/HEAD), never shed
+- ``read``: single-item GETs
+- ``bulk``: listings, search and exports, marked on the route with
+  ``dependencies=[admission_class("bulk")]``
+
+File serving (the /media route, marked ``admission_class("exempt")``, and
+the /uploads and /static mounts) never touches the database, so it is
+neither limited nor counted in the route latencies.
+
+Each sheddable class has a concurrency limit. Every ADJUST_SECONDS the
+controller checks two congestion signals: the time requests wait for a
+pooled connection, and the latency of each route against its own recent
+baseline (per route, as logins and vote toggles differ a hundredfold).
+Under congestion it cuts the bulk limit, and the read limit only once
+bulk is at its minimum. Without congestion it raises them again, read
+first. A request over its class limit gets an immediate 503 with
+Retry-After instead of queueing on get_session. That keeps the backlog
+from outliving the slowdown.
+"""
+import json
+import threading
+import time
+
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+from starlette.routing import Match, Mount
+
+from app.config import settings
+from app.services.metrics import LATENCY_BUCKETS, Histogram, register_collector
+
+CLASSES = ("critical", "read", "bulk")
+# Not admission controlled at all
+EXEMPT = "exempt"
+# Cut first when congested, restored last
+SHED_ORDER = ("bulk", "read")
+ADJUST_SECONDS = 0.5
+DECREASE_FACTOR = 0.7
+INCREASE_FRACTION = 0.1
+# Weight of a new sample in the moving averages
+EWMA_ALPHA = 0.1
+# How fast the latency baseline follows latency upwards
+BASELINE_DRIFT = 0.01
+
+
+def admission_class(name: str):
+    """
+    Route dependency placing the route in an admission class.
+
+    Args:
+        name: One of CLASSES, or EXEMPT for routes that do not use the
+            database; routes without it are "read" for GET and HEAD and
+            "critical" otherwise
+
+    Returns:
+        A dependency for the route's ``dependencies`` list
+    """
+    if name not in CLASSES and name != EXEMPT:
+        raise ValueError(f"Unknown admission class {name!r}")
+
+    async def admission_marker():
+        pass
+
+    admission_marker.admission_class = name
+    return Depends(admission_marker)
+
+
+class ClassState:
+    __slots__ = ("limit", "in_flight", "shed")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.shed = 0
+
+
+class RouteLatency:
+    """Moving average of a route's latency and the lowest it has recently been"""
+
+    __slots__ = ("latency", "baseline", "samples")
+
+    def __init__(self, elapsed: float):
+        self.latency = elapsed
+        self.baseline = elapsed
+        self.samples = 0
+
+    def observe(self, elapsed: float):
+        self.latency += EWMA_ALPHA * (elapsed - self.latency)
+        if self.latency < self.baseline:
+            self.baseline = self.latency
+        else:
+            self.baseline += BASELINE_DRIFT * (self.latency - self.baseline)
+        self.samples += 1
+
+
+class AdmissionController:
+    """
+    Adaptive per-class concurrency limits.
+
+    Admission and release run on the event loop; pool waits are reported
+    from the threads that check out connections.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int, pool_wait_target: float, latency_factor: float):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.pool_wait_target = pool_wait_target
+        self.latency_factor = latency_factor
+        self.classes = {name: ClassState(max_concurrency) for name in CLASSES}
+        self.routes = {}
+        self.pool_wait = 0.0
+        self.pool_wait_samples = 0
+        self.pool_wait_histogram = Histogram(LATENCY_BUCKETS)
+        self._adjusted_at = time.monotonic()
+
+    def try_acquire(self, name: str) -> bool:
+        self._maybe_adjust()
+        state = self.classes[name]
+        if name != "critical" and state.in_flight >= state.limit:
+            state.shed += 1
+            return False
+        state.in_flight += 1
+        return True
+
+    def release(self, name: str, route: str, elapsed: float):
+        self.classes[name].in_flight -= 1
+        latency = self.routes.get(route)
+        if latency is None:
+            self.routes[route] = RouteLatency(elapsed)
+        else:
+            latency.observe(elapsed)
+
+    def observe_pool_wait(self, seconds: float):
+        self.pool_wait += EWMA_ALPHA * (seconds - self.pool_wait)
+        self.pool_wait_samples += 1
+        self.pool_wait_histogram.observe(seconds)
+
+    def congested(self) -> bool:
+        if self.pool_wait > self.pool_wait_target:
+            return True
+        # Most of the routes that served traffic lately are well above their baseline
+        active = [latency for latency in self.routes.values() if latency.samples]
+        slow = sum(latency.latency > self.latency_factor * latency.baseline for latency in active)
+        return bool(active) and slow * 2 > len(active)
+
+    def _maybe_adjust(self):
+        now = time.monotonic()
+        if now - self._adjusted_at < ADJUST_SECONDS:
+            return
+        self._adjusted_at = now
+        congested = self.congested()
+
+        # Signals without fresh samples fade, so an idle period ends the congestion
+        if not self.pool_wait_samples:
+            self.pool_wait /= 2
+        self.pool_wait_samples = 0
+        for latency in self.routes.values():
+            if not latency.samples:
+                latency.latency += 0.5 * (latency.baseline - latency.latency)
+            latency.samples = 0
+
+        if congested:
+            for name in SHED_ORDER:
+                state = self.classes[name]
+                if state.limit > self.min_concurrency:
+                    state.limit = max(self.min_concurrency, int(state.limit * DECREASE_FACTOR))
+                    return
+        else:
+            for name in reversed(SHED_ORDER):
+                state = self.classes[name]
+                if state.limit < self.max_concurrency:
+                    step = max(1, int(state.limit * INCREASE_FRACTION))
+                    state.limit = min(self.max_concurrency, state.limit + step)
+                    return
+
+    def metrics_state(self) -> dict:
+        return {
+            "admission_limit": [[[name], state.limit] for name, state in self.classes.items()],
+            "admission_in_flight": [[[name], state.in_flight] for name, state in self.classes.items()],
+            "admission_shed_total": [[[name], state.shed] for name, state in self.classes.items()],
+            "db_pool_wait_seconds": [[[], self.pool_wait_histogram.state()]],
+        }
+
+
+admission_controller = AdmissionController(
+    settings.admission_max_concurrency,
+    settings.admission_min_concurrency,
+    settings.admission_pool_wait_target,
+    settings.admission_latency_factor,
+)
+
+register_collector({
+    "admission_limit": ("gauge", ("class",), "Concurrency limit of the admission class"),
+    "admission_in_flight": ("gauge", ("class",), "Requests of the admission class being handled"),
+    "admission_shed_total": ("counter", ("class",), "Requests rejected with 503 by admission control"),
+    "db_pool_wait_seconds": ("histogram", (), "Time spent waiting for a pooled connection", LATENCY_BUCKETS),
+}, admission_controller.metrics_state)
+
+
+# Pool wait: from the start of a session's transaction, which comes just
+# before it asks the pool for a connection, to the checkout
+_waiting = threading.local()
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _transaction_created(session, transaction):
+    if transaction.parent is None:
+        _waiting.since = time.perf_counter()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _transaction_ended(session, transaction):
+    if transaction.parent is None:
+        _waiting.since = None
+
+
+@event.listens_for(Pool, "checkout")
+def _connection_checked_out(dbapi_connection, connection_record, connection_proxy):
+    since = getattr(_waiting, "since", None)
+    if since is not None:
+        _waiting.since = None
+        admission_controller.observe_pool_wait(time.perf_counter() - since)
+
+
+def _route_class(scope, cache: dict) -> tuple[str, str]:
+    """The admission class of a request and the route it matches"""
+    default = "read" if scope["method"] in ("GET", "HEAD") else "critical"
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match != Match.FULL:
+            continue
+        if isinstance(route, Mount):
+            return EXEMPT, f"{scope['method']} {route.path}"
+        # Routes compare by value and are unhashable; they live as long as the app
+        name = cache.get(id(route))
+        if name is None:
+            name = cache[id(route)] = next((
+                dependency.dependency.admission_class
+                for dependency in getattr(route, "dependencies", ())
+                if hasattr(dependency.dependency, "admission_class")
+            ), "")
+        return name or default, f"{scope['method']} {route.path}"
+    return default, "unmatched"
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the admission controller to HTTP requests"""
+
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+        self._classes = {}
+
+    async def __call__(self, scope, receive, send):
+        if not settings.admission_control or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        name, route = _route_class(scope, self._classes)
+        if name == EXEMPT:
+            await self.app(scope, receive, send)
+            return
+        if not self.controller.try_acquire(name):
+            body = json.dumps({"detail": "Server is busy, please retry later"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(settings.admission_retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name, route, time.perf_counter() - started)
@@ -0,0 +1,54 @@
+# app/services/counters.py
+from sqlalchemy import func, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.model import Comment, Post, Reel
+
+# Rows checked per transaction
+REPAIR_BATCH_SIZE = 1000
+
+
+def _counters():
+    replies = aliased(Comment)
+    return (
+        ("post.comment_count", Post, Post.comment_count,
+         select(func.count(Comment.id)).where(Comment.post_id == Post.id).correlate(Post).scalar_subquery()),
+        ("reel.comment_count", Reel, Reel.comment_count,
+         select(func.count(Comment.id)).where(Comment.reel_id == Reel.id).correlate(Reel).scalar_subquery()),
+        ("comment.reply_count", Comment, Comment.reply_count,
+         select(func.count(replies.id)).where(replies.parent_id == Comment.id).correlate(Comment).scalar_subquery()),
+    )
+
+
+def repair_comment_counts(batch_size: int = REPAIR_BATCH_SIZE) -> dict:
+    """
+    Recompute the denormalized comment counters that have drifted.
+
+    The comment routes keep comment_count and reply_count in step on every
+    write; this corrects rows left wrong by interrupted writes or manual
+    changes. Rows are walked in id ranges, one short transaction each, and
+    only mismatched rows are written.
+
+    Args:
+        batch_size: Width of each id range
+
+    Returns:
+        The number of rows corrected per counter
+    """
+    report = {}
+    with Session(engine) as session:
+        for name, model, column, count in _counters():
+            corrected = 0
+            max_id = session.exec(select(func.max(model.id))).one() or 0
+            for low in range(0, max_id + 1, batch_size):
+                corrected += session.exec(
+                    update(model)
+                    .where(model.id >= low, model.id < low + batch_size, column != count)
+                    .values({column.key: count})
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                session.commit()
+            report[name] = corrected
+    return report
@@ -0,0 +1,46 @@
+# app/services/export.py
+from typing import Callable
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from app.database import engine
+
+# Rows fetched per server-side cursor round trip, and written per chunk
+EXPORT_BATCH_SIZE = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def iter_ndjson(statement, serialize: Callable[[object], str], batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Run a query and yield its rows as NDJSON chunks.
+
+    The query runs in its own session because the request session is closed
+    before a streaming response body is sent. ``yield_per`` makes the
+    Postgres driver use a server-side cursor, so only one batch of rows is
+    held in memory at a time.
+
+    Args:
+        statement: The select statement to export
+        serialize: Turns one result row into a JSON string
+        batch_size: Number of rows fetched and written per chunk
+    """
+    with Session(engine) as session:
+        result = session.exec(statement.execution_options(yield_per=batch_size))
+        lines = []
+        for row in result:
+            lines.append(serialize(row))
+            if len(lines) >= batch_size:
+                lines.append("")
+                yield "\n".join(lines).encode()
+                lines = []
+        if lines:
+            lines.append("")
+            yield "\n".join(lines).encode()
+
+
+def ndjson_response(statement, serialize: Callable[[object], str], filename: str = None) -> StreamingResponse:
+    """Build a streaming NDJSON response for a query."""
+    headers = {}
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(iter_ndjson(statement, serialize), media_type=NDJSON_MEDIA_TYPE, headers=headers)
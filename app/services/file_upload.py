@@ -1,63 +1,494 @@
 # app/services/file_upload.py
 import os
-import uuid
-from fastapi import UploadFile
-import urllib.parse
+import re
+import bisect
+import errno
+import hashlib
+import logging
 import shutil
-def generate_unique_filename(filename):
-    """Generate a unique filename to prevent overwriting"""
-    ext = os.path.splitext(filename)[1]
-    unique_filename = f"{uuid.uuid4()}{ext}"
-    return unique_filename
+import tempfile
+import threading
+from collections import deque
+from typing import Iterable, NamedTuple, Optional
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.database import engine
+from app.model import MediaBlob
+
+logger = logging.getLogger(__name__)
+
+# Size of the reads and writes used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Content-addressed media store: files live at
+# <root>/<sha[0:2]>/<sha[2:4]>/<sha><ext> on the configured storage backend
+# and are served from MEDIA_URL_PREFIX by app/routes/media.py. Older URLs
+# under /uploads/media keep working through the static mount.
+MEDIA_ROOT = os.path.join("uploads", "media")
+MEDIA_URL_PREFIX = "/media"
+TEMP_DIR_NAME = ".tmp"
+
+# Points per root on the consistent hash ring of the sharded backend
+VIRTUAL_NODES = 128
+# Released files are deleted by a background thread this many at a time
+DELETE_BATCH_SIZE = 500
+DELETE_INTERVAL_SECONDS = 1.0
+
+_MEDIA_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,8})?$")
+_EXTENSION = re.compile(r"^\.[a-z0-9]{1,8}$")
+
+
+class FileTooLargeError(Exception):
+    """Raised when an upload goes over its size limit"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds the maximum size of {max_size} bytes")
+        self.max_size = max_size
+
+
+class StoredMedia(NamedTuple):
+    url: str
+    path: str
+    size: int
+    sha256: str
+
+
+def _blob_path(root: str, sha256: str, extension: str) -> str:
+    # Two directory levels keep every directory small, even with millions of blobs
+    return os.path.join(root, sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+
+class LocalStorage:
+    """
+    Storage backend keeping every blob under a single local directory.
+    """
+
+    def __init__(self, root: str = MEDIA_ROOT):
+        self.roots = [root]
+
+    def root_for(self, sha256: str) -> str:
+        """The root new copies of a blob are written to"""
+        return self.roots[0]
+
+    def path(self, sha256: str, extension: str = "") -> str:
+        """Path a blob is written to"""
+        return _blob_path(self.root_for(sha256), sha256, extension)
+
+    def locate(self, sha256: str, extension: str = "") -> Optional[str]:
+        """
+        Path of a stored blob, or None if it is not on disk.
+
+        Other roots are checked too, so blobs written before a root was
+        added are still found.
+        """
+        primary = self.path(sha256, extension)
+        if os.path.exists(primary):
+            return primary
+        for root in self.roots:
+            candidate = _blob_path(root, sha256, extension)
+            if candidate != primary and os.path.exists(candidate):
+                return candidate
+        return None
+
+    def temp_dir(self, sha256: Optional[str] = None) -> str:
+        """Directory for files being written, on the same filesystem as their root"""
+        root = self.root_for(sha256) if sha256 else self.roots[0]
+        return os.path.join(root, TEMP_DIR_NAME)
+
+    def place(self, temp_path: str, sha256: str, extension: str = "") -> str:
+        """
+        Move a finished temporary file to its final location.
+
+        Returns:
+            The final path
+        """
+        final_path = self.path(sha256, extension)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        try:
+            os.replace(temp_path, final_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Another mount: copy next to the destination, then rename so
+            # readers never see a partial file
+            temp_dir = self.temp_dir(sha256)
+            os.makedirs(temp_dir, exist_ok=True)
+            fd, local_temp = tempfile.mkstemp(dir=temp_dir, prefix="move-", suffix=".part")
+            os.close(fd)
+            try:
+                shutil.copyfile(temp_path, local_temp)
+                os.replace(local_temp, final_path)
+            except BaseException:
+                _remove_quietly(local_temp)
+                raise
+            _remove_quietly(temp_path)
+        return final_path
+
+    def delete(self, path: str):
+        _remove_quietly(path)
+
+
+def _ring_position(key: str) -> int:
+    return int(hashlib.sha256(key.encode()).hexdigest()[:16], 16)
 
-def save_uploaded_file(file: UploadFile, upload_dir: str) -> str:
+
+class ShardedLocalStorage(LocalStorage):
+    """
+    Storage backend spreading blobs over several local mount points.
+
+    Every root owns VIRTUAL_NODES points on a hash ring, and a blob belongs
+    to the root owning the first point after its SHA-256. Adding a mount
+    therefore reassigns only about 1/N of the blobs, and those are still
+    found on their old root by ``locate``. Roots are identified by their
+    path, so keep the configured paths stable.
+    """
+
+    def __init__(self, roots: list[str], virtual_nodes: int = VIRTUAL_NODES):
+        if not roots:
+            raise ValueError("The sharded storage backend needs at least one root")
+        self.roots = list(roots)
+        ring = sorted(
+            (_ring_position(f"{root}#{index}"), root)
+            for root in self.roots
+            for index in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [root for _, root in ring]
+
+    def root_for(self, sha256: str) -> str:
+        index = bisect.bisect_left(self._points, int(sha256[:16], 16))
+        return self._owners[index % len(self._owners)]
+
+
+def create_storage(backend: str, roots: list[str]) -> LocalStorage:
     """
-    Save an uploaded file to the specified directory with a unique filename.
-    
+    Build the storage backend named in the settings.
+
     Args:
-        file: The uploaded file
-        upload_dir: The directory to save the file in
-        
+        backend: "local" (first root only) or "sharded" (all roots)
+        roots: Directories, ideally on separate mount points
+
+    Raises:
+        ValueError: For an unknown backend
+    """
+    roots = roots or [MEDIA_ROOT]
+    if backend == "local":
+        return LocalStorage(roots[0])
+    if backend == "sharded":
+        return ShardedLocalStorage(roots)
+    raise ValueError(f"Unknown storage backend {backend!r}")
+
+
+storage = create_storage(settings.storage_backend, settings.storage_roots)
+
+
+def media_path(sha256: str, extension: str = "") -> str:
+    """Local path of a stored blob (where it would be written if it is missing)"""
+    return storage.locate(sha256, extension) or storage.path(sha256, extension)
+
+
+def media_url(sha256: str, extension: str = "") -> str:
+    """URL path of a stored blob"""
+    return f"{MEDIA_URL_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def parse_media_url(url: Optional[str]) -> Optional[str]:
+    """Return the SHA-256 of a media store URL, or None for any other URL"""
+    if not url:
+        return None
+    match = _MEDIA_NAME.match(url.rsplit("/", 1)[-1])
+    return match.group(1) if match else None
+
+
+def _extension(filename: Optional[str]) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if _EXTENSION.match(extension) else ""
+
+
+def _copy_to_temp(source, directory: str, max_size: Optional[int] = None):
+    """
+    Copy a file object to a temporary file in chunks, hashing it on the way.
+
     Returns:
-        The unique filename (without the directory)
-    """
-    # Create directory if it doesn't exist
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    # Generate a unique filename with UUID to prevent overwriting
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    
-    # Full path to save the file
-    file_path = os.path.join(upload_dir, unique_filename)
-    
-    # Save the file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Return just the unique filename, not the full path
-    return unique_filename
-
-
-def get_file_url(filename: str, upload_dir: str = None) -> str:
-    """
-    Get the URL path for an uploaded file.
-    
+        A tuple (temp_path, size, sha256 hex digest)
+
+    Raises:
+        FileTooLargeError: If the source is larger than max_size
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix="upload-", suffix=".part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise FileTooLargeError(max_size)
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+
+    return temp_path, size, digest.hexdigest()
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _add_reference(session: Session, sha256: str, extension: str, size: int) -> MediaBlob:
+    # Bump an existing blob first; insert only when it is new. A concurrent
+    # insert of the same blob fails on the primary key and is retried as a bump.
+    for _ in range(2):
+        result = session.exec(
+            update(MediaBlob).where(MediaBlob.sha256 == sha256).values(ref_count=MediaBlob.ref_count + 1)
+        )
+        if result.rowcount:
+            return session.get(MediaBlob, sha256, populate_existing=True)
+        try:
+            with session.begin_nested():
+                blob = MediaBlob(sha256=sha256, extension=extension, size=size, ref_count=1)
+                session.add(blob)
+            return blob
+        except IntegrityError:
+            continue
+    raise RuntimeError(f"Could not record a reference to media {sha256}")
+
+
+def claim_blob(session: Session, sha256: str, max_ref_count: int = 0) -> bool:
+    """
+    Take the blob row lock that allows deleting a blob's file.
+
+    Deletes the blob row if its reference count is at most max_ref_count,
+    or briefly inserts and deletes a placeholder if there is no row. Either
+    way the row stays locked until the session commits, and commit_file
+    bumps the row before it looks for the file, so no upload can count a
+    reference to the file while it is being deleted. Delete the file
+    before committing.
+
     Args:
-        filename: The unique filename
-        upload_dir: The directory where the file is saved (optional)
-        
+        session: Session whose transaction holds the lock
+        sha256: Blob to claim
+        max_ref_count: Highest reference count that may be dropped; -1
+            when only a missing row may be claimed
+
     Returns:
-        The URL path to access the file
-    """
-    # If upload_dir is provided, use it; otherwise, just use the filename
-    # Important: Make sure we return a consistent format starting with '/'
-    if upload_dir:
-        # Ensure we don't have double slashes
-        if upload_dir.startswith('/'):
-            return f"{upload_dir}/{filename}"
+        True if the file may be deleted, False if the blob is referenced
+    """
+    result = session.exec(
+        delete(MediaBlob).where(MediaBlob.sha256 == sha256, MediaBlob.ref_count <= max_ref_count)
+    )
+    if result.rowcount:
+        return True
+    try:
+        with session.begin_nested():
+            # Fails, after waiting for it to commit, if an upload inserted the row
+            session.add(MediaBlob(sha256=sha256, size=0, ref_count=0))
+    except IntegrityError:
+        return False
+    session.exec(delete(MediaBlob).where(MediaBlob.sha256 == sha256))
+    return True
+
+
+def commit_file(session: Session, temp_path: str, sha256: str, size: int, filename: Optional[str] = None) -> StoredMedia:
+    """
+    Move a fully written and hashed temporary file into the media store.
+
+    If the same content is already stored, the temporary file is discarded
+    and the existing blob gains a reference. The reference count change is
+    part of the caller's transaction.
+    """
+    # Count the reference first: the update (or insert) locks the blob row,
+    # so a concurrent delete either finished before it, and the file is put
+    # back below, or waits and then sees the reference (see claim_blob)
+    try:
+        blob = _add_reference(session, sha256, _extension(filename), size)
+        final_path = storage.locate(sha256, blob.extension)
+        if final_path is not None:
+            # Identical content is already stored. Refresh its mtime so the
+            # garbage collector's grace period covers the new reference.
+            _remove_quietly(temp_path)
+            os.utime(final_path)
         else:
-            return f"/{upload_dir}/{filename}"
-    else:
-        # If no directory specified, just return the filename with leading slash
-        return f"/{filename}"
\ No newline at end of file
+            final_path = storage.place(temp_path, sha256, blob.extension)
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+
+    return StoredMedia(url=media_url(blob.sha256, blob.extension), path=final_path, size=blob.size, sha256=blob.sha256)
+
+
+def store_file(session: Session, source, filename: Optional[str] = None, max_size: Optional[int] = None) -> StoredMedia:
+    """
+    Store a file object in the content-addressed media store.
+
+    Every upload path goes through this function (or store_upload), so
+    identical files share one blob on disk.
+
+    Args:
+        session: Session whose transaction records the new reference
+        source: A binary file object to read from
+        filename: Original filename, used only for its extension
+        max_size: Maximum number of bytes accepted (optional)
+
+    Returns:
+        The URL, local path, size and SHA-256 of the stored blob
+
+    Raises:
+        FileTooLargeError: If the source is larger than max_size
+    """
+    temp_path, size, sha256 = _copy_to_temp(source, storage.temp_dir(), max_size)
+    return commit_file(session, temp_path, sha256, size, filename)
+
+
+async def store_upload(session: Session, file: UploadFile, max_size: Optional[int] = None) -> StoredMedia:
+    """
+    Store an UploadFile from an async route without blocking the event loop.
+
+    The chunked copy runs in the threadpool. Uploads whose size is already
+    known to be over the limit are rejected before any data is copied.
+
+    Raises:
+        FileTooLargeError: If the upload is larger than max_size
+    """
+    if max_size is not None and file.size is not None and file.size > max_size:
+        raise FileTooLargeError(max_size)
+    temp_path, size, sha256 = await run_in_threadpool(_copy_to_temp, file.file, storage.temp_dir(), max_size)
+    return commit_file(session, temp_path, sha256, size, file.filename)
+
+
+def release_media(session: Session, url: Optional[str]):
+    """
+    Drop one reference to the blob behind a media URL.
+
+    When the last reference goes, the blob row is deleted and its file is
+    queued for deletion once the session commits. Files stored before the
+    media store existed are queued directly if they live under uploads/.
+    """
+    sha256 = parse_media_url(url)
+    if sha256 is None:
+        if url and url.startswith("/uploads/"):
+            _pending_deletes(session).append(url.lstrip("/"))
+        return
+
+    session.exec(
+        update(MediaBlob).where(MediaBlob.sha256 == sha256).values(ref_count=MediaBlob.ref_count - 1)
+    )
+    blob = session.exec(select(MediaBlob).where(MediaBlob.sha256 == sha256)).first()
+    if blob is not None and blob.ref_count <= 0:
+        session.exec(delete(MediaBlob).where(MediaBlob.sha256 == sha256, MediaBlob.ref_count <= 0))
+        session.expunge(blob)
+        _pending_deletes(session).append(media_path(blob.sha256, blob.extension))
+
+
+def _pending_deletes(session: Session) -> list:
+    return session.info.setdefault("media_pending_deletes", [])
+
+
+class DeleteQueue:
+    """
+    Deletes released media files in the background, in batches.
+
+    Requests only append paths, so a delete never waits on the disk. A
+    daemon thread removes up to ``batch_size`` files at a time, skipping
+    blobs that were uploaded again after being released. Paths still
+    queued when the process exits are left for the media garbage collector.
+    """
+
+    def __init__(self, batch_size: int = DELETE_BATCH_SIZE, interval: float = DELETE_INTERVAL_SECONDS):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, paths: Iterable[str]):
+        self._pending.extend(paths)
+        self._start()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def drain(self) -> int:
+        """
+        Delete everything queued so far.
+
+        Returns:
+            The number of files removed
+        """
+        removed = 0
+        with self._drain_lock:
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popleft())
+                try:
+                    removed += self._delete_batch(batch)
+                except BaseException:
+                    # Keep the batch for the next attempt
+                    self._pending.extendleft(reversed(batch))
+                    raise
+        return removed
+
+    def _delete_batch(self, paths: list[str]) -> int:
+        # One transaction per batch: blobs referenced again are skipped, and
+        # the claimed ones stay locked until their files are gone
+        removed = 0
+        with Session(engine) as session:
+            for path in paths:
+                match = _MEDIA_NAME.match(os.path.basename(path))
+                if match and not claim_blob(session, match.group(1)):
+                    continue
+                storage.delete(path)
+                removed += 1
+            session.commit()
+        return removed
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="media-delete", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Failed to delete released media files")
+
+
+delete_queue = DeleteQueue()
+
+
+@event.listens_for(Session, "after_commit")
+def _delete_released_files(session):
+    # Files are only deleted once the reference drop is durable
+    paths = session.info.pop("media_pending_deletes", None)
+    if paths:
+        delete_queue.put(paths)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_released_files(session):
+    session.info.pop("media_pending_deletes", None)
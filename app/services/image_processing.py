@@ -0,0 +1,91 @@
+# app/services/image_processing.py
+# Image decoding and re-encoding. Worker processes import this module, so it
+# must not pull in settings, the database or other app state.
+import hashlib
+import io
+import os
+import tempfile
+from typing import NamedTuple
+
+from PIL import Image, ImageOps, features
+
+# Variants per picture field as (name, longest side in pixels), largest first
+# so every variant is resized from the previous one
+VARIANT_SPECS = {
+    "profile_picture": (("full", 1024), ("medium", 320), ("thumbnail", 96)),
+    "background_image": (("full", 1920), ("medium", 1080), ("thumbnail", 480)),
+}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+class RenderedVariant(NamedTuple):
+    name: str
+    temp_path: str
+    size: int
+    sha256: str
+    extension: str
+
+
+def _encode(image: Image.Image, webp: bool):
+    """Encode an image, returning (bytes, extension)"""
+    buffer = io.BytesIO()
+    if webp:
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+        return buffer.getvalue(), ".webp"
+    if image.mode in ("RGBA", "LA"):
+        image.save(buffer, "PNG", optimize=True)
+        return buffer.getvalue(), ".png"
+    image.convert("RGB").save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue(), ".jpg"
+
+
+def render_variants(source_path: str, specs, temp_dir: str) -> list[RenderedVariant]:
+    """
+    Decode an image once and write resized, re-encoded copies to temp_dir.
+
+    Runs in a worker process. Images are never scaled up, EXIF orientation
+    is applied, and metadata is dropped. WebP is used when this Pillow
+    build supports it, otherwise JPEG (PNG for images with transparency).
+
+    Args:
+        source_path: Path of the original image
+        specs: Sequence of (name, longest side) pairs, largest first
+        temp_dir: Directory for the output files, on the media store's filesystem
+
+    Returns:
+        One RenderedVariant per spec, in the same order
+    """
+    webp = features.check("webp")
+    largest = specs[0][1]
+    os.makedirs(temp_dir, exist_ok=True)
+
+    with Image.open(source_path) as original:
+        # Let the JPEG decoder downscale by powers of two while decoding
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        variants = []
+        try:
+            for name, longest_side in specs:
+                image.thumbnail((longest_side, longest_side), Image.Resampling.LANCZOS)
+                data, extension = _encode(image, webp)
+                fd, temp_path = tempfile.mkstemp(dir=temp_dir, prefix="variant-", suffix=".part")
+                with os.fdopen(fd, "wb") as output:
+                    output.write(data)
+                variants.append(RenderedVariant(name, temp_path, len(data), hashlib.sha256(data).hexdigest(), extension))
+        except BaseException:
+            discard_variants(variants)
+            raise
+    return variants
+
+
+def discard_variants(variants):
+    """Remove the temporary files of rendered variants"""
+    for variant in variants:
+        try:
+            os.remove(variant.temp_path)
+        except OSError:
+            pass
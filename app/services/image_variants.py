@@ -0,0 +1,138 @@
+# app/services/image_variants.py
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from sqlmodel import Session
+
+from app.database import engine
+from app.model import User
+from app.services.file_upload import commit_file, release_media, storage
+from app.services.image_processing import VARIANT_SPECS, RenderedVariant, discard_variants, render_variants
+
+logger = logging.getLogger(__name__)
+
+# Jobs queued or running; uploads beyond this keep only their original
+MAX_PENDING_JOBS = 64
+
+
+class _Job(NamedTuple):
+    user_id: int
+    field: str
+    source_url: str
+    source_path: str
+    url_prefix: str
+
+
+class ImageVariantProcessor:
+    """
+    Generates picture variants after upload, off the request path.
+
+    Decoding and encoding run in a process pool so they neither hold the
+    GIL nor compete with request handling; a small thread pool waits for
+    each result and records the variant URLs on the user. At most
+    ``max_pending`` jobs are queued or running at once. Further uploads
+    are still accepted, but keep only their original until the next one.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: int = MAX_PENDING_JOBS):
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 1) - 1))
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._processes = None
+        self._threads = None
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0, "stale": 0}
+
+    def _start(self):
+        with self._lock:
+            if self._processes is None:
+                # spawn: forking a process that holds DB connections and threads is unsafe
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-variants")
+
+    def submit(self, user_id: int, field: str, source_url: str, source_path: str, url_prefix: str = "") -> bool:
+        """
+        Queue variant generation for a user's picture.
+
+        Args:
+            user_id: Owner of the picture
+            field: "profile_picture" or "background_image"
+            source_url: The URL stored on the user; variants are discarded
+                if it has changed by the time they are ready
+            source_path: Local path of the original in the media store
+            url_prefix: Prepended to the variant URLs, like the original's
+
+        Returns:
+            False if the queue was full and the job was dropped
+        """
+        if not self._slots.acquire(blocking=False):
+            self.stats["dropped"] += 1
+            logger.warning("Image variant queue full, skipping %s of user %d", field, user_id)
+            return False
+        try:
+            self._start()
+            self._threads.submit(self._run, _Job(user_id, field, source_url, source_path, url_prefix))
+        except BaseException:
+            self._slots.release()
+            raise
+        self.stats["submitted"] += 1
+        return True
+
+    def _run(self, job: _Job):
+        try:
+            variants = self._processes.submit(
+                render_variants, job.source_path, VARIANT_SPECS[job.field], storage.temp_dir()
+            ).result()
+            if self._apply(job, variants):
+                self.stats["completed"] += 1
+            else:
+                self.stats["stale"] += 1
+        except FileNotFoundError:
+            # The picture was replaced and released before we got to it
+            self.stats["stale"] += 1
+        except Exception:
+            self.stats["failed"] += 1
+            logger.exception("Failed to generate %s variants for user %d", job.field, job.user_id)
+        finally:
+            self._slots.release()
+
+    def _apply(self, job: _Job, variants: list[RenderedVariant]) -> bool:
+        """Record the variants on the user; False if the picture changed meanwhile"""
+        variants_field = f"{job.field}_variants"
+        with Session(engine) as session:
+            # Lock the row so a concurrent upload cannot slip in between the check and the write
+            user = session.get(User, job.user_id, with_for_update=True)
+            if user is None or user.deleted_at is not None or getattr(user, job.field) != job.source_url:
+                discard_variants(variants)
+                return False
+            try:
+                urls = {}
+                for variant in variants:
+                    stored = commit_file(session, variant.temp_path, variant.sha256, variant.size, f"variant{variant.extension}")
+                    urls[variant.name] = f"{job.url_prefix}{stored.url}"
+                for url in (getattr(user, variants_field) or {}).values():
+                    release_media(session, url)
+                setattr(user, variants_field, urls)
+                session.commit()
+                return True
+            except BaseException:
+                session.rollback()
+                discard_variants(variants[len(urls):])
+                raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._processes is not None:
+                self._processes.shutdown(wait=False, cancel_futures=True)
+                self._threads.shutdown(wait=False, cancel_futures=True)
+                self._processes = self._threads = None
+
+
+image_variants = ImageVariantProcessor()
@@ -0,0 +1,474 @@
+# app/services/jobs.py
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import and_, delete, event, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.model import Job
+from app.services.metrics import Histogram, register_collector
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+# How long a claimed job may run before another worker may take it over
+DEFAULT_TIMEOUT_SECONDS = 5 * 60
+# Retry delays double from the base up to the cap, with jitter so jobs that
+# failed together do not retry in lockstep
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60 * 60
+# Idle workers look for new jobs this often; jobs enqueued by this process
+# wake them immediately
+POLL_SECONDS = 1.0
+# Candidates fetched per claim attempt when row locks are not available
+CLAIM_CANDIDATES = 10
+# Periodic tasks are checked this often
+SCHEDULE_CHECK_SECONDS = 30
+# Finished and failed jobs are kept this long for inspection
+RETENTION_SECONDS = 7 * 24 * 60 * 60
+PRUNE_BATCH_SIZE = 1000
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800)
+
+
+class Task(NamedTuple):
+    name: str
+    function: Callable
+    priority: int
+    max_attempts: int
+    timeout: float
+    every: Optional[float]  # Seconds between periodic runs, or None
+
+
+# Registered tasks by name; see app/tasks.py
+TASKS: dict[str, Task] = {}
+
+
+def task(
+    name: str,
+    priority: int = 0,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    every: Optional[float] = None
+):
+    """
+    Register a function as a background task.
+
+    The function is called with the job's payload as keyword arguments.
+    Raising an exception fails the attempt; it is retried with backoff
+    until ``max_attempts`` is reached.
+
+    Args:
+        name: Name used to enqueue the task
+        priority: Default priority of its jobs; higher runs first
+        max_attempts: Attempts before a job is marked failed
+        timeout: Lease of a running job; past it the job is run again
+        every: Run the task once per this many seconds across all workers
+    """
+    def register(function: Callable) -> Callable:
+        TASKS[name] = Task(name, function, priority, max_attempts, timeout, every)
+        return function
+    return register
+
+
+def enqueue(
+    session: Session,
+    name: str,
+    payload: Optional[dict] = None,
+    priority: Optional[int] = None,
+    delay: float = 0,
+    dedupe_key: Optional[str] = None
+) -> Job:
+    """
+    Add a job to the session.
+
+    Workers only see the job once the caller commits, so work is never
+    queued for a write that was rolled back. The commit also wakes this
+    process's worker.
+
+    Args:
+        session: The caller's session
+        name: A registered task name
+        payload: Keyword arguments for the task; must be JSON serializable
+        priority: Overrides the task's default priority
+        delay: Seconds before the job may run
+        dedupe_key: Unique key; a second job with the same key fails to commit
+
+    Returns:
+        The pending Job
+    """
+    registered = TASKS.get(name)
+    if priority is None:
+        priority = registered.priority if registered else 0
+    job = Job(
+        task=name,
+        payload=payload or {},
+        priority=priority,
+        max_attempts=registered.max_attempts if registered else DEFAULT_MAX_ATTEMPTS,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        dedupe_key=dedupe_key
+    )
+    session.add(job)
+    session.info["jobs_enqueued"] = True
+    return job
+
+
+def submit(name: str, payload: Optional[dict] = None, dedupe_key: Optional[str] = None, **options) -> bool:
+    """
+    Enqueue a job in its own transaction.
+
+    Returns:
+        False if a job with the same dedupe key already exists
+    """
+    with Session(engine) as session:
+        enqueue(session, name, payload, dedupe_key=dedupe_key, **options)
+        try:
+            session.commit()
+        except IntegrityError:
+            if dedupe_key is None:
+                raise
+            return False
+    return True
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class ClaimedJob(NamedTuple):
+    id: int
+    task: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    started_at: datetime
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(Job.status == "queued", Job.run_at <= now),
+        # Running past its lease: the worker that claimed it is gone
+        and_(Job.status == "running", Job.lease_expires_at < now, Job.attempts < Job.max_attempts)
+    )
+
+
+def claim(worker_id: str, tasks) -> Optional[ClaimedJob]:
+    """
+    Claim the most urgent runnable job among ``tasks``.
+
+    On Postgres the candidate row is locked with FOR UPDATE SKIP LOCKED, so
+    concurrent workers never wait on each other. Other databases fall back
+    to a conditional update that only succeeds while the job is still
+    claimable; losing that race just moves on to the next candidate.
+    """
+    now = datetime.utcnow()
+    query = select(Job).where(_claimable(now), Job.task.in_(list(tasks))).order_by(
+        Job.priority.desc(), Job.run_at, Job.id
+    )
+    with Session(engine) as session:
+        if engine.dialect.name == "postgresql":
+            candidates = session.exec(query.limit(1).with_for_update(skip_locked=True)).all()
+        else:
+            candidates = session.exec(query.limit(CLAIM_CANDIDATES)).all()
+        for job in candidates:
+            claimed_job = ClaimedJob(
+                job.id, job.task, job.payload or {}, job.attempts + 1, job.max_attempts, job.run_at, now
+            )
+            registered = TASKS.get(job.task)
+            timeout = registered.timeout if registered else DEFAULT_TIMEOUT_SECONDS
+            claimed = session.exec(
+                update(Job).where(Job.id == job.id, _claimable(now)).values(
+                    status="running",
+                    attempts=Job.attempts + 1,
+                    started_at=now,
+                    lease_expires_at=now + timedelta(seconds=timeout),
+                    worker=worker_id
+                ).execution_options(synchronize_session=False)
+            ).rowcount
+            if claimed:
+                session.commit()
+                return claimed_job
+        session.rollback()
+    return None
+
+
+def _finish(job: ClaimedJob, worker_id: str, **values) -> bool:
+    # Only the worker holding the claim may finish the job: one whose lease
+    # expired may have been claimed by someone else since
+    with Session(engine) as session:
+        finished = session.exec(
+            update(Job).where(Job.id == job.id, Job.worker == worker_id, Job.status == "running").values(**values)
+        ).rowcount
+        session.commit()
+    return bool(finished)
+
+
+def complete(job: ClaimedJob, worker_id: str) -> bool:
+    return _finish(job, worker_id, status="done", finished_at=datetime.utcnow(), lease_expires_at=None)
+
+
+def fail(job: ClaimedJob, worker_id: str, error: BaseException) -> str:
+    """
+    Record a failed attempt: retry later, or give up after max_attempts.
+
+    Returns:
+        The job's new status
+    """
+    now = datetime.utcnow()
+    message = repr(error)[:1000]
+    if job.attempts >= job.max_attempts:
+        _finish(job, worker_id, status="failed", finished_at=now, lease_expires_at=None, last_error=message)
+        return "failed"
+    _finish(
+        job, worker_id,
+        status="queued",
+        run_at=now + timedelta(seconds=backoff_seconds(job.attempts)),
+        lease_expires_at=None,
+        last_error=message
+    )
+    return "queued"
+
+
+def prune_jobs(retention_seconds: float = RETENTION_SECONDS, batch_size: int = PRUNE_BATCH_SIZE) -> dict:
+    """
+    Delete finished jobs past the retention period, in batches, and fail
+    jobs whose last attempt died with its worker.
+
+    Returns:
+        The number of jobs deleted and failed
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=retention_seconds)
+    report = {"deleted": 0, "abandoned": 0}
+    with Session(engine) as session:
+        report["abandoned"] = session.exec(
+            update(Job).where(
+                Job.status == "running", Job.lease_expires_at < now, Job.attempts >= Job.max_attempts
+            ).values(status="failed", finished_at=now, last_error="Lease expired on the last attempt")
+        ).rowcount
+        session.commit()
+        while True:
+            ids = session.exec(
+                select(Job.id).where(Job.status.in_(("done", "failed")), Job.finished_at < cutoff).limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            session.exec(delete(Job).where(Job.id.in_(ids)))
+            session.commit()
+            report["deleted"] += len(ids)
+    return report
+
+
+class _TaskStats:
+    def __init__(self):
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.wait = Histogram(LATENCY_BUCKETS)  # Due time to start
+        self.run = Histogram(LATENCY_BUCKETS)  # Start to finish
+
+    def snapshot(self) -> dict:
+        return {
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "wait_seconds": self.wait.snapshot(),
+            "run_seconds": self.run.snapshot(),
+        }
+
+
+class JobWorker:
+    """
+    Runs registered tasks from the jobs table in background threads.
+
+    Each of ``concurrency`` threads claims one job at a time, runs it and
+    records the outcome; a failed attempt is retried with exponential
+    backoff. A scheduler thread enqueues periodic tasks, using a per-period
+    dedupe key so each period runs once across all workers. Runs inside the
+    API processes or standalone via ``python -m app.worker``.
+    """
+
+    def __init__(self, concurrency: int = 2, poll_seconds: float = POLL_SECONDS, schedule: bool = True):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.schedule = schedule
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._scheduled = {}
+        self._lock = threading.Lock()
+        self._stats: dict[str, _TaskStats] = {}
+
+    def start(self):
+        """Start the worker threads once"""
+        with self._lock:
+            if self._threads:
+                return
+            # Forked processes inherit the parent's identity; take our own
+            self.name = f"{socket.gethostname()}:{os.getpid()}"
+            self._stopping.clear()
+            for slot in range(self.concurrency):
+                thread = threading.Thread(target=self._run, args=(f"{self.name}/{slot}",), name=f"jobs-{slot}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self.schedule:
+                thread = threading.Thread(target=self._run_scheduler, name="jobs-scheduler", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 10):
+        """Stop claiming jobs and wait up to ``timeout`` seconds for running ones"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stopping.set()
+        self.wake()
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+    def wake(self):
+        with self._wake:
+            self._wake.notify_all()
+
+    def run_one(self, worker_id: Optional[str] = None) -> bool:
+        """
+        Claim and run one job.
+
+        Returns:
+            False if no job was runnable
+        """
+        worker_id = worker_id or f"{self.name}/{threading.get_ident()}"
+        job = claim(worker_id, TASKS)
+        if job is None:
+            return False
+        stats = self._task_stats(job.task)
+        stats.wait.observe(max(0.0, (job.started_at - job.run_at).total_seconds()))
+        started = time.monotonic()
+        try:
+            TASKS[job.task].function(**job.payload)
+        except Exception as error:
+            stats.run.observe(time.monotonic() - started)
+            status = fail(job, worker_id, error)
+            if status == "failed":
+                stats.failed += 1
+                logger.exception("Job %d (%s) failed after %d attempts", job.id, job.task, job.attempts)
+            else:
+                stats.retried += 1
+                logger.warning("Job %d (%s) failed, will retry: %r", job.id, job.task, error)
+            return True
+        stats.run.observe(time.monotonic() - started)
+        complete(job, worker_id)
+        stats.completed += 1
+        return True
+
+    def _task_stats(self, name: str) -> _TaskStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats.setdefault(name, _TaskStats())
+        return stats
+
+    @property
+    def stats(self) -> dict:
+        return {name: stats.snapshot() for name, stats in list(self._stats.items())}
+
+    def _run(self, worker_id: str):
+        while not self._stopping.is_set():
+            try:
+                if self.run_one(worker_id):
+                    continue
+            except Exception:
+                # Usually the database being unreachable; back off like an idle poll
+                logger.exception("Job worker %s failed to claim a job", worker_id)
+            with self._wake:
+                self._wake.wait(self.poll_seconds)
+
+    def schedule_due(self):
+        """Enqueue the current period's run of every periodic task, once"""
+        now = time.time()
+        for registered in list(TASKS.values()):
+            if registered.every is None:
+                continue
+            period = int(now // registered.every)
+            if self._scheduled.get(registered.name) == period:
+                continue
+            try:
+                submit(registered.name, dedupe_key=f"{registered.name}@{period}")
+            except Exception:
+                logger.exception("Failed to schedule %s", registered.name)
+                continue
+            self._scheduled[registered.name] = period
+
+    def _run_scheduler(self):
+        while not self._stopping.is_set():
+            self.schedule_due()
+            self._stopping.wait(SCHEDULE_CHECK_SECONDS)
+
+
+job_worker = JobWorker()
+
+
+_JOB_FAMILIES = {
+    "jobs_completed_total": ("counter", ("task",), "Jobs that succeeded"),
+    "jobs_retried_total": ("counter", ("task",), "Failed job attempts that will be retried"),
+    "jobs_failed_total": ("counter", ("task",), "Jobs that failed their last attempt"),
+    "job_wait_seconds": ("histogram", ("task",), "Time from a job being due to it starting", LATENCY_BUCKETS),
+    "job_run_seconds": ("histogram", ("task",), "Job run time", LATENCY_BUCKETS),
+}
+
+
+def _collect_job_metrics() -> dict:
+    state = {name: [] for name in _JOB_FAMILIES}
+    for name, stats in list(job_worker._stats.items()):
+        state["jobs_completed_total"].append([[name], stats.completed])
+        state["jobs_retried_total"].append([[name], stats.retried])
+        state["jobs_failed_total"].append([[name], stats.failed])
+        state["job_wait_seconds"].append([[name], stats.wait.state()])
+        state["job_run_seconds"].append([[name], stats.run.state()])
+    return state
+
+
+register_collector(_JOB_FAMILIES, _collect_job_metrics)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_worker(session):
+    if session.info.pop("jobs_enqueued", False):
+        job_worker.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def queue_metrics() -> dict:
+    """
+    Jobs per task and status, and the age of the oldest due job per task.
+
+    Returns:
+        ``{task: {"queued": n, "running": n, "failed": n, "oldest_due_seconds": s}}``
+    """
+    now = datetime.utcnow()
+    query = select(Job.task, Job.status, func.count(), func.min(Job.run_at)).where(
+        Job.status.in_(("queued", "running", "failed"))
+    ).group_by(Job.task, Job.status)
+    metrics = {}
+    with Session(engine) as session:
+        for name, status, count, oldest in session.exec(query):
+            entry = metrics.setdefault(name, {"queued": 0, "running": 0, "failed": 0, "oldest_due_seconds": 0.0})
+            entry[status] = count
+            if status == "queued":
+                # Retries scheduled in the future are not late yet
+                entry["oldest_due_seconds"] = round(max(0.0, (now - oldest).total_seconds()), 3)
+    return metrics
@@ -0,0 +1,70 @@
+# app/services/media_delivery.py
+import os
+
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+# Content-addressed files never change, so clients and CDNs may cache them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Larger reads mean fewer threadpool hops per GB when zero-copy is unavailable
+MEDIA_CHUNK_SIZE = 1024 * 1024
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+PATHSEND_EXTENSION = "http.response.pathsend"
+
+
+class MediaFileResponse(FileResponse):
+    """
+    FileResponse for content-addressed media.
+
+    Range handling comes from Starlette. On top of that it sends a
+    precomputed ETag (the SHA-256 in the file name) and immutable cache
+    headers, and uses the ASGI zero-copy extensions when the server offers
+    them: ``zerocopysend`` (sendfile from an open descriptor, also for
+    single ranges) or ``pathsend`` (whole files). Servers without either
+    fall back to 1 MB chunked reads.
+    """
+
+    chunk_size = MEDIA_CHUNK_SIZE
+
+    def __init__(self, path: str, sha256: str, stat_result: os.stat_result, media_type: str = None):
+        super().__init__(path, media_type=media_type, stat_result=stat_result)
+        # Replace the mtime-based ETag Starlette derives from stat
+        self.headers["etag"] = f'"{sha256}"'
+        self.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        self._extensions = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self._extensions = scope.get("extensions") or {}
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        if ZEROCOPY_EXTENSION in self._extensions:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await self._zerocopy(send, 0, self.stat_result.st_size)
+        elif PATHSEND_EXTENSION in self._extensions:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": PATHSEND_EXTENSION, "path": os.path.abspath(self.path)})
+        else:
+            await super()._handle_simple(send, send_header_only)
+
+    async def _handle_single_range(self, send: Send, start: int, end: int, file_size: int, send_header_only: bool) -> None:
+        if send_header_only or ZEROCOPY_EXTENSION not in self._extensions:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        await self._zerocopy(send, start, end - start)
+
+    async def _zerocopy(self, send: Send, offset: int, count: int):
+        # The server sendfile()s straight from the page cache to the socket
+        with open(self.path, "rb") as file:
+            await send({
+                "type": ZEROCOPY_EXTENSION,
+                "file": file,
+                "offset": offset,
+                "count": count,
+                "more_body": False,
+            })
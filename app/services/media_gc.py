@@ -0,0 +1,370 @@
+# app/services/media_gc.py
+import argparse
+import json
+import logging
+import os
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.model import MediaBlob, Reel, User
+from app.services.file_upload import TEMP_DIR_NAME, claim_blob, parse_media_url, storage
+from app.services.resumable_upload import UPLOAD_SESSIONS_DIR
+
+logger = logging.getLogger(__name__)
+
+# Files younger than this are never collected: their reference may not be
+# committed yet
+GRACE_SECONDS = 24 * 60 * 60
+DELETE_BATCH_SIZE = 500
+MAX_DELETES_PER_SECOND = 200
+SCAN_THREADS = 8
+# Directories uploads were written to before the media store, walked for
+# legacy files; the rest of uploads/ and static/ is never touched
+LEGACY_ROOTS = (
+    os.path.join("uploads", "reels"),
+    os.path.join("static", "profile_pictures"),
+    os.path.join("static", "background_images"),
+)
+REFERENCE_BATCH_SIZE = 10_000
+
+_URL_COLUMNS = (User.profile_picture, User.background_image, Reel.video_url, Reel.thumbnail_url)
+_VARIANT_COLUMNS = (User.profile_picture_variants, User.background_image_variants)
+
+
+class _File(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    sha256: Optional[str]  # None for legacy files
+
+
+def _hash_key(sha256: str) -> int:
+    # 64 bits are plenty: a collision only keeps an orphan around
+    return int(sha256[:16], 16)
+
+
+def _legacy_path(url: str) -> Optional[str]:
+    """Relative path of a pre-media-store upload URL, e.g. "uploads/reels/x.mp4" """
+    for marker in ("/uploads/", "/static/"):
+        position = url.find(marker)
+        if position >= 0:
+            return os.path.normpath(url[position + 1:])
+    return None
+
+
+class ReferenceSet:
+    """
+    Every media URL stored in the database, kept compact.
+
+    Content-addressed blobs are stored as sorted 64-bit hash prefixes in
+    an array (8 bytes each); the few legacy files as relative paths.
+    """
+
+    def __init__(self):
+        self._hashes = array("Q")
+        self.paths = set()
+
+    def __len__(self):
+        return len(self._hashes) + len(self.paths)
+
+    def add_url(self, url: Optional[str]):
+        if not url:
+            return
+        sha256 = parse_media_url(url)
+        if sha256 is not None:
+            self._hashes.append(_hash_key(sha256))
+            return
+        path = _legacy_path(url)
+        if path is not None:
+            self.paths.add(path)
+
+    def freeze(self):
+        self._hashes = array("Q", sorted(set(self._hashes)))
+
+    def has_blob(self, sha256: str) -> bool:
+        key = _hash_key(sha256)
+        position = bisect_left(self._hashes, key)
+        return position < len(self._hashes) and self._hashes[position] == key
+
+    def has_path(self, path: str) -> bool:
+        return os.path.normpath(path) in self.paths
+
+
+class BlobCounts:
+    """
+    Reference counts of the blob rows when the collection started, kept
+    compact as sorted 64-bit hash prefixes with a parallel array of counts.
+    """
+
+    def __init__(self):
+        self._hashes = array("Q")
+        self._counts = array("q")
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def get(self, sha256: str) -> int:
+        """The count of a blob, or -1 if it had no row"""
+        key = _hash_key(sha256)
+        position = bisect_left(self._hashes, key)
+        if position < len(self._hashes) and self._hashes[position] == key:
+            return self._counts[position]
+        return -1
+
+
+def load_blob_counts() -> BlobCounts:
+    """Read the reference count of every blob row"""
+    rows = {}
+    with Session(engine) as session:
+        query = select(MediaBlob.sha256, MediaBlob.ref_count).execution_options(yield_per=REFERENCE_BATCH_SIZE)
+        for sha256, ref_count in session.exec(query):
+            key = _hash_key(sha256)
+            # On a prefix collision the higher count wins, which only keeps an orphan
+            rows[key] = max(ref_count, rows.get(key, ref_count))
+    counts = BlobCounts()
+    for key in sorted(rows):
+        counts._hashes.append(key)
+        counts._counts.append(rows[key])
+    return counts
+
+
+def load_references() -> ReferenceSet:
+    """Stream every media URL column into a ReferenceSet"""
+    references = ReferenceSet()
+    with Session(engine) as session:
+        for column in _URL_COLUMNS:
+            query = select(column).where(column.is_not(None)).execution_options(yield_per=REFERENCE_BATCH_SIZE)
+            for url in session.exec(query):
+                references.add_url(url)
+        for column in _VARIANT_COLUMNS:
+            query = select(column).where(column.is_not(None)).execution_options(yield_per=REFERENCE_BATCH_SIZE)
+            for variants in session.exec(query):
+                for url in (variants or {}).values():
+                    references.add_url(url)
+    references.freeze()
+    return references
+
+
+def _scan(directory: str, skip: frozenset, blobs: bool) -> list[_File]:
+    """Recursively list the files under directory with os.scandir"""
+    files = []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                # Lock files and the like
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entry.path) not in skip:
+                        stack.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            # Blobs are matched by hash wherever they are found, so a root
+            # dropped from the settings is never mistaken for legacy files
+            sha256 = parse_media_url(entry.name)
+            if blobs and sha256 is None:
+                # Not written by the media store; leave it alone
+                continue
+            files.append(_File(entry.path, stat.st_size, stat.st_mtime, sha256))
+    return files
+
+
+def _scan_jobs(skip: frozenset):
+    """
+    Split the storage trees into independent (directory, blobs) jobs: one
+    per first-level shard directory, so the walk runs in parallel.
+    """
+    jobs = []
+    for root in storage.roots:
+        for top in _list_dirs(root):
+            if os.path.basename(top) == TEMP_DIR_NAME:
+                # Leftovers of interrupted uploads
+                jobs.append((top, False))
+            else:
+                jobs.append((top, True))
+    for root in LEGACY_ROOTS:
+        if os.path.abspath(root) in skip:
+            continue
+        jobs.append((root, False))
+    return jobs
+
+
+def _list_dirs(root: str) -> list[str]:
+    try:
+        return [entry.path for entry in os.scandir(root) if entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+
+
+def _is_referenced(file: _File, references: ReferenceSet) -> bool:
+    if file.sha256 is not None:
+        return references.has_blob(file.sha256)
+    return references.has_path(file.path)
+
+
+def _is_temporary(path: str) -> bool:
+    return os.path.basename(os.path.dirname(path)) == TEMP_DIR_NAME
+
+
+def _delete_batch(batch: list[_File], cutoff: float, counts: BlobCounts) -> tuple[int, int]:
+    """
+    Delete a batch of orphans and the blob rows left behind for them.
+
+    Every file is stat'ed again first: one that was re-uploaded meanwhile
+    has a fresh mtime and is kept. Blob files are only deleted once
+    claim_blob has locked their row and found no reference counted since
+    the collection started, and the rows stay locked until the files are
+    gone.
+
+    Returns:
+        A tuple (files deleted, bytes reclaimed)
+    """
+    still_old = []
+    for file in batch:
+        try:
+            if os.stat(file.path).st_mtime < cutoff:
+                still_old.append(file)
+        except FileNotFoundError:
+            continue
+
+    deleted = reclaimed = 0
+    with Session(engine) as session:
+        for file in still_old:
+            # Also drops the rows of blobs whose owners were deleted without
+            # releasing them, unless an upload counted a reference since
+            if file.sha256 is not None and not claim_blob(session, file.sha256, counts.get(file.sha256)):
+                continue
+            try:
+                os.remove(file.path)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                logger.exception("Could not delete orphaned media file %s", file.path)
+                continue
+            deleted += 1
+            reclaimed += file.size
+        session.commit()
+    return deleted, reclaimed
+
+
+def collect_garbage(
+    dry_run: bool = False,
+    grace_seconds: float = GRACE_SECONDS,
+    batch_size: int = DELETE_BATCH_SIZE,
+    max_deletes_per_second: float = MAX_DELETES_PER_SECOND,
+    threads: int = SCAN_THREADS
+) -> dict:
+    """
+    Delete media files that no row references any more.
+
+    Loads every referenced URL, walks the storage roots and the legacy
+    upload directories in parallel, and deletes unreferenced files older
+    than the grace period in rate-limited batches. Stale temporary files
+    of interrupted uploads are removed too; resumable upload sessions are
+    left to their own cleanup.
+
+    Args:
+        dry_run: Only report what would be deleted
+        grace_seconds: Minimum age of a file before it can be deleted
+        batch_size: Files deleted per batch
+        max_deletes_per_second: Upper bound on the deletion rate
+        threads: Parallel directory walkers
+
+    Returns:
+        A report with counts and the bytes reclaimed (or reclaimable)
+    """
+    started = time.monotonic()
+    cutoff = time.time() - grace_seconds
+    # Counts before references: an upload committed between the two reads
+    # is among the references, and one committed later raises its count
+    # above the snapshot, so claim_blob keeps it
+    counts = load_blob_counts()
+    references = load_references()
+
+    # Never walk into the media store or upload sessions from the legacy roots
+    skip = frozenset(os.path.abspath(path) for path in (*storage.roots, UPLOAD_SESSIONS_DIR))
+    report = {
+        "dry_run": dry_run,
+        "references": len(references),
+        "scanned": 0,
+        "referenced": 0,
+        "too_recent": 0,
+        "orphaned": 0,
+        "orphaned_bytes": 0,
+        "deleted": 0,
+        "reclaimed_bytes": 0,
+    }
+
+    batch = []
+    batch_started = time.monotonic()
+
+    def flush():
+        nonlocal batch, batch_started
+        if not batch:
+            return
+        if not dry_run:
+            deleted, reclaimed = _delete_batch(batch, cutoff, counts)
+            report["deleted"] += deleted
+            report["reclaimed_bytes"] += reclaimed
+            # Rate limit so the collector never saturates the disks
+            minimum = len(batch) / max_deletes_per_second
+            elapsed = time.monotonic() - batch_started
+            if elapsed < minimum:
+                time.sleep(minimum - elapsed)
+        batch = []
+        batch_started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="media-gc") as pool:
+        scans = [pool.submit(_scan, directory, skip, blobs) for directory, blobs in _scan_jobs(skip)]
+        for scan in scans:
+            for file in scan.result():
+                report["scanned"] += 1
+                if not _is_temporary(file.path) and _is_referenced(file, references):
+                    report["referenced"] += 1
+                    continue
+                if file.mtime >= cutoff:
+                    report["too_recent"] += 1
+                    continue
+                report["orphaned"] += 1
+                report["orphaned_bytes"] += file.size
+                batch.append(file)
+                if len(batch) >= batch_size:
+                    flush()
+        flush()
+
+    report["seconds"] = round(time.monotonic() - started, 3)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete media files no longer referenced by the database")
+    parser.add_argument("--dry-run", action="store_true", help="report without deleting")
+    parser.add_argument("--grace-hours", type=float, default=GRACE_SECONDS / 3600, help="minimum file age")
+    parser.add_argument("--batch-size", type=int, default=DELETE_BATCH_SIZE)
+    parser.add_argument("--rate", type=float, default=MAX_DELETES_PER_SECOND, help="maximum deletes per second")
+    parser.add_argument("--threads", type=int, default=SCAN_THREADS, help="parallel directory walkers")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(collect_garbage(
+        dry_run=args.dry_run,
+        grace_seconds=args.grace_hours * 3600,
+        batch_size=args.batch_size,
+        max_deletes_per_second=args.rate,
+        threads=args.threads
+    ), indent=2))
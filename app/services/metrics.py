@@ -0,0 +1,398 @@
+# app/services/metrics.py
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Workers write their snapshot for the other workers this often
+FLUSH_SECONDS = 5
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name: (type, label names, help[, buckets])
+FAMILIES = {
+    "http_requests_total": ("counter", ("method", "route", "status"), "HTTP requests handled"),
+    "http_requests_in_flight": ("gauge", (), "HTTP requests being handled"),
+    "http_request_duration_seconds": (
+        "histogram", ("method", "route"), "Time from request start to the last response byte", LATENCY_BUCKETS
+    ),
+    "http_response_size_bytes": ("histogram", ("method", "route"), "Response body size", SIZE_BUCKETS),
+    "http_request_db_seconds": (
+        "histogram", ("method", "route"), "Database time spent by one request", LATENCY_BUCKETS
+    ),
+    "http_request_db_queries": (
+        "histogram", ("method", "route"), "Database queries run by one request", QUERY_COUNT_BUCKETS
+    ),
+}
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram, Prometheus style.
+
+    No lock: each instance is updated from one thread (the event loop for
+    request metrics); a lost update under contention only skews a count.
+    """
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def state(self) -> list:
+        return [list(self.counts), self.sum]
+
+    def snapshot(self) -> dict:
+        buckets = {}
+        total = 0
+        for bound, count in zip((*self.bounds, "+Inf"), self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {"buckets": buckets, "count": total, "sum": round(self.sum, 6)}
+
+
+class RequestMetrics:
+    """
+    HTTP metrics of this process.
+
+    Only the event loop thread updates them (the middleware records each
+    request once it has completed), so no locks are taken on the request
+    path. ``state`` is a JSON-friendly copy used to merge the workers.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self._values = {name: {} for name in FAMILIES}
+
+    def _histogram(self, name: str, labels: tuple) -> Histogram:
+        family = self._values[name]
+        histogram = family.get(labels)
+        if histogram is None:
+            histogram = family[labels] = Histogram(FAMILIES[name][3])
+        return histogram
+
+    def observe(self, method: str, route: str, status: int, seconds: float, size: int,
+                db_seconds: float, db_queries: int):
+        requests = self._values["http_requests_total"]
+        key = (method, route, str(status))
+        requests[key] = requests.get(key, 0) + 1
+        labels = (method, route)
+        self._histogram("http_request_duration_seconds", labels).observe(seconds)
+        self._histogram("http_response_size_bytes", labels).observe(size)
+        self._histogram("http_request_db_seconds", labels).observe(db_seconds)
+        self._histogram("http_request_db_queries", labels).observe(db_queries)
+
+    def state(self) -> dict:
+        state = {"http_requests_in_flight": [[[], self.in_flight]]}
+        for name, family in self._values.items():
+            kind = FAMILIES[name][0]
+            state[name] = [
+                [list(labels), value.state() if kind == "histogram" else value]
+                for labels, value in family.items()
+            ]
+        return state
+
+
+request_metrics = RequestMetrics()
+_collectors = []
+
+
+def register_collector(families: dict, collect):
+    """
+    Add metric families kept by another component of this process.
+
+    Args:
+        families: Definitions in the FAMILIES format
+        collect: Returns their current values in the ``RequestMetrics.state`` format
+    """
+    FAMILIES.update(families)
+    _collectors.append(collect)
+
+
+def local_state() -> dict:
+    """Every metric of this process; call from the event loop"""
+    state = request_metrics.state()
+    for collect in _collectors:
+        state.update(collect())
+    return state
+
+
+class RequestDbUsage:
+    """Database time and statements of one request, and its query budget"""
+
+    __slots__ = ("seconds", "queries", "budget", "route")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+        # Set by the query_budget dependency of the matched route
+        self.budget: Optional[int] = None
+        self.route: Optional[str] = None
+
+
+# The middleware puts the request's usage in a context variable; it follows
+# the request into the threadpool that runs sync routes and dependencies
+_request_db: contextvars.ContextVar[Optional[RequestDbUsage]] = contextvars.ContextVar("request_db", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if _request_db.get() is not None:
+        conn.info["metrics_query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    usage = _request_db.get()
+    if usage is None:
+        return
+    started = conn.info.pop("metrics_query_started", None)
+    if started is not None:
+        usage.seconds += time.perf_counter() - started
+    usage.queries += 1
+
+
+def current_db_usage() -> Optional[RequestDbUsage]:
+    """Database usage of the current request so far, None outside requests"""
+    return _request_db.get()
+
+
+def _route_label(scope) -> str:
+    # The route template, not the raw path, so ids do not explode the label set
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unmatched")
+    # Mounted apps such as the static files set the mount point instead
+    return scope.get("root_path") or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, response size, status and
+    database usage of every HTTP request.
+
+    Latency runs until the last body byte is handed to the server, so
+    streaming responses are measured in full. File responses sent via the
+    zero-copy extensions report their Content-Length.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        usage = RequestDbUsage()
+        token = _request_db.set(usage)
+        status_code = 500
+        declared_size = None
+        sent = 0
+        file_send = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, declared_size, sent, file_send
+            kind = message["type"]
+            if kind == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-length":
+                        declared_size = int(value)
+                        break
+            elif kind == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif kind in ("http.response.zerocopysend", "http.response.pathsend"):
+                file_send = True
+            await send(message)
+
+        self.metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.in_flight -= 1
+            _request_db.reset(token)
+            size = declared_size if file_send and declared_size is not None else sent
+            self.metrics.observe(
+                scope["method"], _route_label(scope), status_code,
+                time.perf_counter() - started, size, usage.seconds, usage.queries
+            )
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def merge_states(states: list[tuple[dict, bool]]) -> dict:
+    """
+    Sum the states of several processes.
+
+    Args:
+        states: (state, alive) pairs; gauges of dead processes are dropped,
+            their counters and histograms are kept so totals never go back
+
+    Returns:
+        ``{name: {labels: value}}`` with histograms as [counts, sum]
+    """
+    merged = {name: {} for name in FAMILIES}
+    for state, alive in states:
+        for name, entries in state.items():
+            definition = FAMILIES.get(name)
+            if definition is None or (definition[0] == "gauge" and not alive):
+                continue
+            family = merged[name]
+            for labels, value in entries:
+                key = tuple(labels)
+                if definition[0] == "histogram":
+                    counts, total = family.get(key, ([0] * len(value[0]), 0.0))
+                    family[key] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+                else:
+                    family[key] = family.get(key, 0) + value
+    return merged
+
+
+def render(merged: dict, extra: str = "") -> str:
+    """Prometheus text exposition of merged states, followed by ``extra``"""
+    lines = []
+    for name, family in merged.items():
+        kind, label_names, help_text = FAMILIES[name][:3]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind != "histogram":
+            for labels, value in sorted(family.items()):
+                lines.append(f"{name}{_labels(label_names, labels)} {value}")
+            continue
+        bounds = FAMILIES[name][3]
+        for labels, (counts, total) in sorted(family.items()):
+            cumulative = 0
+            for bound, count in zip((*bounds, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(label_names, labels)} {total}")
+            lines.append(f"{name}_count{_labels(label_names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n" + extra
+
+
+def render_gauge(name: str, help_text: str, label_names: tuple, values: dict) -> str:
+    """Exposition of a gauge computed at scrape time, e.g. from the database"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in sorted(values.items()):
+        lines.append(f"{name}{_labels(label_names, labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsExporter:
+    """
+    Shares this worker's metrics with the other workers of a server.
+
+    Under gunicorn every worker has its own counters. With a metrics
+    directory configured, each worker writes a snapshot there every few
+    seconds and ``/metrics`` in any worker sums all snapshots with its own
+    live state. Empty the directory when the server starts, as stale
+    files of a previous deployment would be summed too.
+    """
+
+    def __init__(self, directory: Optional[str], flush_seconds: float = FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._task = None
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def _write(self, state: dict):
+        pid = os.getpid()
+        temp_path = self._path(pid) + ".tmp"
+        with open(temp_path, "w") as snapshot:
+            json.dump({"pid": pid, "state": state}, snapshot)
+        os.replace(temp_path, self._path(pid))
+
+    async def flush(self):
+        if self.directory:
+            # The state is copied on the event loop; only the write is offloaded
+            state = local_state()
+            await asyncio.to_thread(self._write, state)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to write metrics snapshot")
+
+    def start(self):
+        if self.directory and self._task is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self.flush()
+
+    def collect(self, own_state: dict) -> dict:
+        """Merge this worker's live state with the other workers' snapshots (blocking I/O)"""
+        states = [(own_state, True)]
+        if self.directory:
+            own_pid = os.getpid()
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, name)) as snapshot:
+                        data = json.load(snapshot)
+                except (OSError, ValueError):
+                    continue
+                if data.get("pid") == own_pid:
+                    continue
+                states.append((data.get("state", {}), _alive(data.get("pid", 0))))
+        return merge_states(states)
+
+
+metrics_exporter = MetricsExporter(settings.metrics_dir)
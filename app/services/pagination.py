@@ -0,0 +1,33 @@
+# app/services/pagination.py
+import base64
+from datetime import datetime
+
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """
+    Encode the position of the last returned row as an opaque cursor.
+
+    Args:
+        created_at: Creation time of the last row on the page
+        item_id: Primary key of the last row, used as a tie-breaker
+
+    Returns:
+        A URL-safe cursor string
+    """
+    raw = f"{created_at.isoformat()}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(item_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
@@ -0,0 +1,294 @@
+# app/services/profiler.py
+"""
+Opt-in sampling profiler for single requests.
+
+A request is profiled when it carries a valid signed X-Profile header
+(PROFILE_SECRET) or is picked at random (PROFILE_SAMPLE_RATE). While it
+runs, a sampler thread reads the stacks of the threads executing the
+route's endpoint or dependencies every PROFILE_INTERVAL seconds; the
+statement being executed is added as a leaf frame, so driver time shows
+up per SQL statement. The result is written to PROFILE_DIR as a
+speedscope file (https://www.speedscope.app) named in the response's
+X-Profile-File header.
+
+With neither setting configured the middleware passes requests straight
+through and no SQL hooks are installed.
+
+Samples are attributed by code, not by request: concurrent requests
+running the same route's functions add to the profile too, so profile on
+a quiet instance or accept the blend.
+
+    python -m app.services.profiler --sign 600   # header valid for 10 minutes
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_FILE_HEADER = b"x-profile-file"
+# Longest SQL statement kept in a frame name
+SQL_FRAME_LENGTH = 160
+
+
+def sign_profile_request(valid_seconds: int, secret: Optional[str] = None) -> str:
+    """
+    X-Profile header value that enables profiling until it expires.
+
+    Args:
+        valid_seconds: How long the value is accepted
+        secret: Signing secret, PROFILE_SECRET by default
+
+    Returns:
+        ``"<expires>.<signature>"``
+    """
+    expires = str(int(time.time()) + valid_seconds)
+    signature = hmac.new((secret or settings.profile_secret).encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def _valid_signature(value: str) -> bool:
+    expires, _, signature = value.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(settings.profile_secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def _route_codes(route) -> frozenset:
+    """Code objects of a route's endpoint and all its dependencies"""
+    codes = set()
+    pending = [route.dependant]
+    while pending:
+        dependant = pending.pop()
+        code = getattr(dependant.call, "__code__", None)
+        if code is not None:
+            codes.add(code)
+        pending.extend(dependant.dependencies)
+    return frozenset(codes)
+
+
+class RequestProfile:
+    """Samples of one profiled request, in speedscope's shared-frame form"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.frames = []
+        self._frame_index = {}
+        self.samples = []
+        self.weights = []
+        self.sql_samples = 0
+        self.file_name = None
+        self._codes = None
+
+    def _frame(self, key, name, file=None, line=None) -> int:
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            frame = {"name": name}
+            if file is not None:
+                frame.update(file=file, line=line)
+            self.frames.append(frame)
+        return index
+
+    def sample(self, thread_frames: dict, statements: dict, weight: float):
+        if self._codes is None:
+            # The route is known once the router has matched the request
+            route = self.scope.get("route")
+            if route is None or not hasattr(route, "dependant"):
+                return
+            self._codes = _route_codes(route)
+        for thread_id, frame in thread_frames.items():
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if self._codes.isdisjoint(codes):
+                continue
+            stack = [self._frame(code, code.co_qualname, code.co_filename, code.co_firstlineno) for code in reversed(codes)]
+            statement = statements.get(thread_id)
+            if statement is not None:
+                stack.append(self._frame(("sql", statement), f"SQL {statement}"))
+                self.sql_samples += 1
+            self.samples.append(stack)
+            self.weights.append(weight)
+
+    def speedscope(self, name: str) -> dict:
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "app.services.profiler",
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(self.weights),
+                "samples": self.samples,
+                "weights": self.weights,
+            }],
+        }
+
+
+class Sampler:
+    """
+    One thread sampling the stacks of the whole process for every request
+    being profiled; it runs only while there is at least one.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.active = set()
+        # Thread id -> SQL statement it is executing, for the leaf frames
+        self.statements = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self.active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: RequestProfile):
+        with self._lock:
+            self.active.discard(profile)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        previous = time.perf_counter()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                profiles = list(self.active)
+                if not profiles:
+                    self._thread = None
+                    return
+            now = time.perf_counter()
+            thread_frames = sys._current_frames()
+            thread_frames.pop(own_id, None)
+            statements = dict(self.statements)
+            for profile in profiles:
+                profile.sample(thread_frames, statements, now - previous)
+            previous = now
+            # Do not keep the sampled frames, and their locals, alive
+            del thread_frames
+
+
+sampler = Sampler(settings.profile_interval)
+
+
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    if sampler.active:
+        sampler.statements[threading.get_ident()] = " ".join(statement.split())[:SQL_FRAME_LENGTH]
+
+
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    sampler.statements.pop(threading.get_ident(), None)
+
+
+def _statement_failed(context):
+    sampler.statements.pop(threading.get_ident(), None)
+
+
+def profiling_enabled() -> bool:
+    return bool(settings.profile_secret) or settings.profile_sample_rate > 0
+
+
+def _file_name(scope, elapsed: float) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope["path"]
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    return f"{stamp}-{scope['method']}-{slug}-{elapsed * 1000:.0f}ms.speedscope.json"
+
+
+def _write_profile(path: str, document: dict):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as output:
+        json.dump(document, output)
+    os.replace(temp_path, path)
+
+
+class ProfilerMiddleware:
+    """
+    Pure ASGI middleware profiling the requests selected by a signed
+    X-Profile header or the sampling rate.
+    """
+
+    def __init__(self, app, directory: Optional[str] = None):
+        self.app = app
+        self.directory = directory or settings.profile_dir
+        self.enabled = profiling_enabled()
+        if self.enabled and not event.contains(Engine, "before_cursor_execute", _statement_started):
+            event.listen(Engine, "before_cursor_execute", _statement_started)
+            event.listen(Engine, "after_cursor_execute", _statement_finished)
+            event.listen(Engine, "handle_error", _statement_failed)
+
+    def _selected(self, scope) -> bool:
+        if settings.profile_secret:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return _valid_signature(value.decode("latin-1"))
+        return random.random() < settings.profile_sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Named before the body is sent; the duration is as of the headers
+                profile.file_name = _file_name(scope, time.perf_counter() - started)
+                message["headers"] = [*message.get("headers", ()), (PROFILE_FILE_HEADER, profile.file_name.encode())]
+            await send(message)
+
+        sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.remove(profile)
+            file_name = profile.file_name or _file_name(scope, time.perf_counter() - started)
+            document = profile.speedscope(f"{scope['method']} {scope['path']}")
+            try:
+                await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+                await asyncio.to_thread(_write_profile, os.path.join(self.directory, file_name), document)
+            except OSError:
+                logger.exception("Failed to write profile %s", file_name)
+            else:
+                logger.info(
+                    "Profiled %s %s: %d samples (%d in SQL) in %s",
+                    scope["method"], scope["path"], len(profile.samples), profile.sql_samples, file_name
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sign X-Profile headers for request profiling")
+    parser.add_argument("--sign", type=int, metavar="SECONDS", required=True, help="validity of the header")
+    args = parser.parse_args()
+    if not settings.profile_secret:
+        parser.error("PROFILE_SECRET is not set")
+    print(f"X-Profile: {sign_profile_request(args.sign)}")
@@ -0,0 +1,344 @@
+# app/services/purger.py
+import argparse
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import delete, func, or_, tuple_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.model import Comment, Follow, Post, PostVote, PurgeTask, Reel, ReelVote, User
+from app.services.file_upload import release_media
+from app.services.jobs import enqueue
+from app.services.relationship_cache import relationship_cache
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per transaction
+PURGE_BATCH_SIZE = 1000
+# Pause between batches so a large purge leaves room for request traffic
+BATCH_PAUSE_SECONDS = 0.05
+# A purge job hands its worker back after this long and queues a follow-up
+PURGE_SLICE_SECONDS = 30
+# Wait before retrying after a failed batch
+RETRY_SECONDS = 30
+
+
+# Scopes: the posts and reels removed along with the deleted entity
+
+def _posts_of(task: PurgeTask):
+    if task.entity == "post":
+        return select(Post.id).where(Post.id == task.entity_id)
+    return select(Post.id).where(Post.owner_id == task.entity_id)
+
+
+def _reels_of(task: PurgeTask):
+    if task.entity == "reel":
+        return select(Reel.id).where(Reel.id == task.entity_id)
+    return select(Reel.id).where(Reel.owner_id == task.entity_id)
+
+
+def _delete_keys(session: Session, model, columns, batch) -> list:
+    """Delete the rows whose key ``columns`` are returned by the batch query"""
+    keys = session.exec(batch).all()
+    if keys:
+        if len(columns) == 1:
+            session.exec(delete(model).where(columns[0].in_(keys)))
+        else:
+            session.exec(delete(model).where(tuple_(*columns).in_(keys)))
+    return keys
+
+
+def _recount_comments(session: Session, rows):
+    """Recompute the counters of the posts, reels and threads that lost comments in rows"""
+    post_ids = {row.post_id for row in rows if row.post_id is not None}
+    reel_ids = {row.reel_id for row in rows if row.reel_id is not None}
+    parent_ids = {row.parent_id for row in rows if getattr(row, "parent_id", None) is not None}
+    if post_ids:
+        count = select(func.count(Comment.id)).where(Comment.post_id == Post.id).correlate(Post).scalar_subquery()
+        session.exec(update(Post).where(Post.id.in_(post_ids)).values(comment_count=count))
+    if reel_ids:
+        count = select(func.count(Comment.id)).where(Comment.reel_id == Reel.id).correlate(Reel).scalar_subquery()
+        session.exec(update(Reel).where(Reel.id.in_(reel_ids)).values(comment_count=count))
+    if parent_ids:
+        replies = aliased(Comment)
+        count = select(func.count(replies.id)).where(replies.parent_id == Comment.id).correlate(Comment).scalar_subquery()
+        session.exec(update(Comment).where(Comment.id.in_(parent_ids)).values(reply_count=count))
+
+
+# Steps: each deletes at most ``limit`` rows and returns how many it found;
+# zero means the step is complete
+
+def _post_votes(session: Session, task: PurgeTask, limit: int) -> int:
+    batch = select(PostVote.post_id, PostVote.user_id).where(PostVote.post_id.in_(_posts_of(task))).limit(limit)
+    return len(_delete_keys(session, PostVote, (PostVote.post_id, PostVote.user_id), batch))
+
+
+def _post_replies(session: Session, task: PurgeTask, limit: int) -> int:
+    # Replies before top-level comments, so a database-side cascade never
+    # turns one batch into many more rows
+    batch = select(Comment.id).where(Comment.post_id.in_(_posts_of(task)), Comment.parent_id.is_not(None)).limit(limit)
+    return len(_delete_keys(session, Comment, (Comment.id,), batch))
+
+
+def _post_comments(session: Session, task: PurgeTask, limit: int) -> int:
+    batch = select(Comment.id).where(Comment.post_id.in_(_posts_of(task))).limit(limit)
+    return len(_delete_keys(session, Comment, (Comment.id,), batch))
+
+
+def _posts(session: Session, task: PurgeTask, limit: int) -> int:
+    return len(_delete_keys(session, Post, (Post.id,), _posts_of(task).limit(limit)))
+
+
+def _reel_votes(session: Session, task: PurgeTask, limit: int) -> int:
+    batch = select(ReelVote.reel_id, ReelVote.user_id).where(ReelVote.reel_id.in_(_reels_of(task))).limit(limit)
+    return len(_delete_keys(session, ReelVote, (ReelVote.reel_id, ReelVote.user_id), batch))
+
+
+def _reel_replies(session: Session, task: PurgeTask, limit: int) -> int:
+    batch = select(Comment.id).where(Comment.reel_id.in_(_reels_of(task)), Comment.parent_id.is_not(None)).limit(limit)
+    return len(_delete_keys(session, Comment, (Comment.id,), batch))
+
+
+def _reel_comments(session: Session, task: PurgeTask, limit: int) -> int:
+    batch = select(Comment.id).where(Comment.reel_id.in_(_reels_of(task))).limit(limit)
+    return len(_delete_keys(session, Comment, (Comment.id,), batch))
+
+
+def _reels(session: Session, task: PurgeTask, limit: int) -> int:
+    scope = _reels_of(task).limit(limit).subquery()
+    rows = session.exec(
+        select(Reel.id, Reel.video_url, Reel.thumbnail_url).where(Reel.id.in_(select(scope.c.id)))
+    ).all()
+    if not rows:
+        return 0
+    # Files are removed after the commit once nothing else references them
+    for _, video_url, thumbnail_url in rows:
+        release_media(session, video_url)
+        release_media(session, thumbnail_url)
+    session.exec(delete(Reel).where(Reel.id.in_([reel_id for reel_id, _, _ in rows])))
+    return len(rows)
+
+
+def _post_votes_cast(session: Session, task: PurgeTask, limit: int) -> int:
+    batch = select(PostVote.post_id, PostVote.user_id).where(PostVote.user_id == task.entity_id).limit(limit)
+    return len(_delete_keys(session, PostVote, (PostVote.post_id, PostVote.user_id), batch))
+
+
+def _reel_votes_cast(session: Session, task: PurgeTask, limit: int) -> int:
+    batch = select(ReelVote.reel_id, ReelVote.user_id).where(ReelVote.user_id == task.entity_id).limit(limit)
+    return len(_delete_keys(session, ReelVote, (ReelVote.reel_id, ReelVote.user_id), batch))
+
+
+def _thread_replies(session: Session, task: PurgeTask, limit: int) -> int:
+    # Other people's replies in threads the user started go with the thread
+    parent = aliased(Comment)
+    rows = session.exec(
+        select(Comment.id, Comment.post_id, Comment.reel_id)
+        .join(parent, Comment.parent_id == parent.id)
+        .where(parent.user_id == task.entity_id)
+        .limit(limit)
+    ).all()
+    if rows:
+        session.exec(delete(Comment).where(Comment.id.in_([row.id for row in rows])))
+        _recount_comments(session, rows)
+    return len(rows)
+
+
+def _comments(session: Session, task: PurgeTask, limit: int) -> int:
+    # The user's comments on content they do not own
+    rows = session.exec(
+        select(Comment.id, Comment.post_id, Comment.reel_id, Comment.parent_id)
+        .where(Comment.user_id == task.entity_id)
+        .limit(limit)
+    ).all()
+    if rows:
+        session.exec(delete(Comment).where(Comment.id.in_([row.id for row in rows])))
+        _recount_comments(session, rows)
+    return len(rows)
+
+
+def _follows(session: Session, task: PurgeTask, limit: int) -> int:
+    batch = select(Follow.follower_id, Follow.following_id).where(
+        or_(Follow.follower_id == task.entity_id, Follow.following_id == task.entity_id)
+    ).limit(limit)
+    keys = _delete_keys(session, Follow, (Follow.follower_id, Follow.following_id), batch)
+    for follower_id, following_id in keys:
+        relationship_cache.invalidate(follower_id, following_id)
+    return len(keys)
+
+
+def _user(session: Session, task: PurgeTask, limit: int) -> int:
+    user = session.get(User, task.entity_id)
+    if user is None:
+        return 0
+    release_media(session, user.profile_picture)
+    release_media(session, user.background_image)
+    for variants in (user.profile_picture_variants, user.background_image_variants):
+        for url in (variants or {}).values():
+            release_media(session, url)
+    # A bulk delete: the ORM would load every relationship to unlink it
+    session.exec(delete(User).where(User.id == task.entity_id))
+    session.expunge(user)
+    return 1
+
+
+_POST_STEPS = {
+    "post_votes": _post_votes,
+    "post_replies": _post_replies,
+    "post_comments": _post_comments,
+    "posts": _posts,
+}
+_REEL_STEPS = {
+    "reel_votes": _reel_votes,
+    "reel_replies": _reel_replies,
+    "reel_comments": _reel_comments,
+    "reels": _reels,
+}
+# Dependent rows first, so no step ever leaves a dangling foreign key
+PURGE_STEPS: dict[str, dict[str, Callable[[Session, PurgeTask, int], int]]] = {
+    "post": _POST_STEPS,
+    "reel": _REEL_STEPS,
+    "user": {
+        **_POST_STEPS,
+        **_REEL_STEPS,
+        "post_votes_cast": _post_votes_cast,
+        "reel_votes_cast": _reel_votes_cast,
+        "thread_replies": _thread_replies,
+        "comments": _comments,
+        "follows": _follows,
+        "user": _user,
+    },
+}
+
+
+def queue_purge(session: Session, entity: str, entity_id: int) -> PurgeTask:
+    """Add a purge task and the job that runs it to the session; both start once the caller commits"""
+    task = PurgeTask(entity=entity, entity_id=entity_id, step=next(iter(PURGE_STEPS[entity])))
+    session.add(task)
+    enqueue(session, "purge")
+    return task
+
+
+class Purger:
+    """
+    Removes deleted users, posts and reels, one batch at a time.
+
+    Deletes only mark the entity and queue a PurgeTask; the "purge" job
+    then walks each task's steps, deleting at most ``batch_size``
+    dependent rows per transaction with plain SQL (no ORM cascades), and
+    records the step and row count on the task in the same transaction,
+    so an interrupted purge resumes where it stopped. Unfinished tasks are
+    served round-robin, least recently advanced first; the task row is
+    locked with SKIP LOCKED so several workers can share the work.
+    """
+
+    def __init__(self, batch_size: int = PURGE_BATCH_SIZE, pause_seconds: float = BATCH_PAUSE_SECONDS):
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.stats = {"batches": 0, "rows": 0, "finished": 0, "failed": 0}
+
+    def run_batch(self) -> bool:
+        """
+        Advance the next unfinished purge by one batch.
+
+        Returns:
+            False when no purge is waiting
+        """
+        with Session(engine) as session:
+            task = session.exec(
+                select(PurgeTask)
+                .where(PurgeTask.finished_at.is_(None), PurgeTask.updated_at <= datetime.utcnow())
+                .order_by(PurgeTask.updated_at, PurgeTask.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).first()
+            if task is None:
+                return False
+            task_id, entity, entity_id, step = task.id, task.entity, task.entity_id, task.step
+            try:
+                self._advance(session, task)
+                session.commit()
+            except Exception as error:
+                session.rollback()
+                self.stats["failed"] += 1
+                logger.exception("Purge of %s %d failed at %s", entity, entity_id, step)
+                self._record_failure(task_id, error)
+        return True
+
+    def _advance(self, session: Session, task: PurgeTask):
+        steps = PURGE_STEPS[task.entity]
+        found = steps[task.step](session, task, self.batch_size)
+        now = datetime.utcnow()
+        if found:
+            task.deleted_rows += found
+            self.stats["rows"] += found
+        else:
+            names = list(steps)
+            position = names.index(task.step) + 1
+            if position < len(names):
+                task.step = names[position]
+            else:
+                task.finished_at = now
+                self.stats["finished"] += 1
+                logger.info("Purged %s %d: %d rows", task.entity, task.entity_id, task.deleted_rows)
+        task.updated_at = now
+        self.stats["batches"] += 1
+
+    def _record_failure(self, task_id: int, error: Exception):
+        # Pushing updated_at into the future delays the retry and lets
+        # other purges go first
+        with Session(engine) as session:
+            task = session.get(PurgeTask, task_id)
+            if task is None:
+                return
+            task.failures += 1
+            task.last_error = repr(error)[:500]
+            task.updated_at = datetime.utcfromtimestamp(time.time() + RETRY_SECONDS)
+            session.commit()
+
+    def run_pending(self, max_seconds: Optional[float] = None) -> bool:
+        """
+        Run batches until no purge is waiting, or for at most ``max_seconds``.
+
+        Returns:
+            True if no purge is waiting any more
+        """
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        while self.run_batch():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+        return True
+
+
+purger = Purger()
+
+
+def purge_status(include_finished: bool = False) -> list[dict]:
+    """Progress of the queued purges, oldest first"""
+    with Session(engine) as session:
+        query = select(PurgeTask).order_by(PurgeTask.id)
+        if not include_finished:
+            query = query.where(PurgeTask.finished_at.is_(None))
+        return [task.model_dump(mode="json") for task in session.exec(query)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Purge deleted users, posts and reels")
+    parser.add_argument("--status", action="store_true", help="print purge progress and exit")
+    parser.add_argument("--all", action="store_true", help="include finished purges in --status")
+    parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.status:
+        print(json.dumps(purge_status(include_finished=args.all), indent=2))
+    else:
+        purger = Purger(batch_size=args.batch_size)
+        purger.run_pending()
+        print(json.dumps(purger.stats))
@@ -0,0 +1,103 @@
+# app/services/query_budget.py
+"""
+Per-route SQL statement budgets and strict relationship loading.
+
+Routes declare how many statements a request may run, whatever the page
+size:
+
+    @router.get("/", dependencies=[query_budget(3)])
+
+The statements are counted by the metrics middleware. With
+QUERY_BUDGET_MODE=raise (tests, ``python -m benchmarks.query_budgets``)
+the statement that goes over the budget raises QueryBudgetExceeded, so
+the traceback points at the loop that issues it; with "warn" it is
+logged once per request; "off" (the default) skips the check.
+
+STRICT_LOADING=true makes every lazy relationship load raise, so
+``post.owner`` in a loop fails instead of silently running a query per row.
+"""
+import logging
+from typing import Optional
+
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, raiseload
+
+from app.config import settings
+from app.services.metrics import current_db_usage
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_MODES = ("off", "warn", "raise")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(max_queries: int):
+    """
+    Route dependency declaring the request's SQL statement budget.
+
+    The budget covers the whole request, including the statements of the
+    authentication dependency.
+
+    Args:
+        max_queries: Statements the request may run
+
+    Returns:
+        A dependency for the route's ``dependencies`` list
+    """
+    async def declare_query_budget(request: Request):
+        usage = current_db_usage()
+        if usage is not None:
+            usage.budget = max_queries
+            usage.route = f"{request.method} {request.scope['route'].path}"
+
+    # Read by the budget checker to list the declared budgets
+    declare_query_budget.max_queries = max_queries
+    return Depends(declare_query_budget)
+
+
+def route_query_budget(route) -> Optional[int]:
+    """The budget declared on a route, or None"""
+    for dependency in getattr(route, "dependencies", ()):
+        max_queries = getattr(dependency.dependency, "max_queries", None)
+        if max_queries is not None:
+            return max_queries
+    return None
+
+
+def _check_budget(conn, cursor, statement, parameters, context, executemany):
+    usage = current_db_usage()
+    if usage is None or usage.budget is None or usage.queries < usage.budget:
+        return
+    message = (
+        f"{usage.route} ran more than its budget of {usage.budget} queries; "
+        f"next statement: {' '.join(statement.split())[:200]}"
+    )
+    if settings.query_budget_mode == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+    # One warning per request
+    usage.budget = None
+
+
+def _raise_on_lazy_load(execute_state):
+    # Explicit loader options of the statement still take precedence
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and execute_state.all_mappers
+    ):
+        execute_state.statement = execute_state.statement.options(raiseload("*"))
+
+
+if settings.query_budget_mode not in QUERY_BUDGET_MODES:
+    raise ValueError(f"QUERY_BUDGET_MODE must be one of {', '.join(QUERY_BUDGET_MODES)}")
+if settings.query_budget_mode != "off":
+    event.listen(Engine, "before_cursor_execute", _check_budget)
+if settings.strict_loading:
+    event.listen(Session, "do_orm_execute", _raise_on_lazy_load)
@@ -0,0 +1,334 @@
+# app/services/rate_limit.py
+"""
+Token-bucket rate limiting for expensive routes.
+
+A route opts in with a dependency::
+
+    @router.post("/login", dependencies=[rate_limit("login", rate=0.2, burst=10, key="ip", form_field="username")])
+
+Each client (the user of a valid bearer token, otherwise the client IP)
+gets a bucket per limit name that holds up to ``burst`` tokens and refills
+continuously at ``rate`` tokens per second; a request takes one token or
+is rejected with 429 and a Retry-After of the time until it would get one.
+Routes sharing a name share the buckets. A limit may also key on a form
+field, e.g. the username of a login, so clients behind one address (a
+proxy, a NAT) do not exhaust each other's buckets. Every new value gets
+a full bucket, so such a limit is paired with a plain one on the route.
+
+RateLimitMiddleware checks the limits of the matched route before the
+route reads the request body, so a rejected upload is answered before it
+is transferred. Limits keyed on a form field need the body and are
+checked by the dependency.
+
+Buckets live in the worker, in shards with their own locks. With
+RATE_LIMIT_SHARED_PATH set, they live in a memory-mapped file instead, so
+all workers on the host see the same buckets: slots are found by a stable
+hash of the key, shards are locked with fcntl byte-range locks, and when
+a shard's probe window is full the longest idle bucket is reused. Without
+fcntl (Windows) the setting is ignored and buckets stay per worker.
+"""
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: buckets can only be kept per worker
+    fcntl = None
+
+from fastapi import Depends, HTTPException, Request, status
+from jose import JWTError, jwt
+from starlette.routing import Match
+
+from app.config import settings
+from app.services.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+# Token subjects remembered to skip decoding the JWT on every request
+MAX_CACHED_TOKENS = 4096
+# Form field values are cut to this length in bucket keys
+MAX_FIELD_LENGTH = 256
+# Scope key set by RateLimitMiddleware once it checked the route's limits
+CHECKED_SCOPE_KEY = "rate_limit.checked"
+RETRY_DETAIL = "Too many requests, please slow down"
+
+
+class LocalBucketStore:
+    """Buckets of this worker: dicts of key -> [tokens, updated, idle seconds until full]"""
+
+    def __init__(self, shards: int, max_keys: int):
+        self.shards = [{} for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.max_keys_per_shard = max(1, max_keys // shards)
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """
+        Take tokens from a bucket.
+
+        Args:
+            key: Bucket key
+            rate: Tokens added per second
+            burst: Bucket capacity
+            cost: Tokens the request takes
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds until they will be there
+        """
+        index = hash(key) % len(self.shards)
+        shard = self.shards[index]
+        now = time.monotonic()
+        with self.locks[index]:
+            bucket = shard.get(key)
+            if bucket is None:
+                if len(shard) >= self.max_keys_per_shard:
+                    self._sweep(shard, now)
+                bucket = shard[key] = [burst, now, burst / rate]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                return 0.0
+            bucket[0] = tokens
+            return (cost - tokens) / rate
+
+    def _sweep(self, shard: dict, now: float):
+        # A bucket that has refilled is the same as no bucket
+        for key in [key for key, (_, updated, idle) in shard.items() if now - updated >= idle]:
+            del shard[key]
+        if len(shard) >= self.max_keys_per_shard:
+            # Everyone is active: forget the longest idle half
+            for key in sorted(shard, key=lambda key: shard[key][1])[:len(shard) // 2]:
+                del shard[key]
+
+
+class SharedBucketStore:
+    """
+    Buckets shared by the workers of a host through a memory-mapped file.
+
+    The file holds SHARDS x slots_per_shard slots of (key hash, tokens,
+    updated). CLOCK_MONOTONIC is system-wide on Linux, so timestamps are
+    comparable between workers.
+    """
+
+    SLOT = struct.Struct("<Qdd")
+    # Slots looked at for a key before reusing the longest idle one
+    PROBE = 8
+
+    def __init__(self, path: str, shards: int, slots: int):
+        self.shard_count = shards
+        self.slots_per_shard = max(self.PROBE, slots // shards)
+        self.shard_bytes = self.slots_per_shard * self.SLOT.size
+        size = self.shard_bytes * shards
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+        # fcntl locks belong to the process, so threads also need their own
+        self.locks = [threading.Lock() for _ in range(shards)]
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Same as LocalBucketStore.take"""
+        # Zero marks a free slot
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        index = key_hash % self.shard_count
+        start = index * self.shard_bytes
+        first = key_hash // self.shard_count % self.slots_per_shard
+        with self.locks[index]:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.shard_bytes, start)
+            try:
+                now = time.monotonic()
+                offset = None
+                oldest = None
+                for probe in range(self.PROBE):
+                    slot_offset = start + (first + probe) % self.slots_per_shard * self.SLOT.size
+                    slot_hash, tokens, updated = self.SLOT.unpack_from(self.map, slot_offset)
+                    if slot_hash == key_hash:
+                        offset = slot_offset
+                        break
+                    if slot_hash == 0:
+                        updated = -math.inf
+                    if oldest is None or updated < oldest[0]:
+                        oldest = (updated, slot_offset)
+                if offset is None:
+                    offset = oldest[1]
+                    tokens, updated = burst, now
+                tokens = min(burst, tokens + (now - updated) * rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self.SLOT.pack_into(self.map, offset, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.shard_bytes, start)
+        return 0.0 if allowed else (cost - tokens) / rate
+
+
+def _create_store():
+    if settings.rate_limit_shared_path:
+        if fcntl is not None:
+            return SharedBucketStore(settings.rate_limit_shared_path, settings.rate_limit_shards, settings.rate_limit_shared_slots)
+        logger.warning("RATE_LIMIT_SHARED_PATH needs fcntl, which this platform lacks; keeping buckets per worker")
+    return LocalBucketStore(settings.rate_limit_shards, settings.rate_limit_max_keys)
+
+
+bucket_store = _create_store()
+_rejected = {}
+_subjects = {}
+
+
+def _token_subject(token: str) -> str:
+    # Only verified tokens count, or anyone could spread requests over made-up users
+    try:
+        return str(jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]).get("sub") or "")
+    except JWTError:
+        return ""
+
+
+def _client_key(request: Request, by: str) -> str:
+    if by == "user":
+        authorization = request.headers.get("authorization", "")
+        if authorization[:7].lower() == "bearer ":
+            token = authorization[7:]
+            subject = _subjects.get(token)
+            if subject is None:
+                subject = _token_subject(token)
+                if len(_subjects) >= MAX_CACHED_TOKENS:
+                    _subjects.clear()
+                _subjects[token] = subject
+            if subject:
+                return f"user:{subject}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def rate_limit(
+    name: str,
+    rate: float,
+    burst: float,
+    key: str = "user",
+    query_param: Optional[str] = None,
+    form_field: Optional[str] = None,
+):
+    """
+    Route dependency limiting how often a client may call the route.
+
+    Args:
+        name: Limit name; routes with the same name share buckets
+        rate: Requests per second allowed in the long run
+        burst: Requests allowed at once after a quiet period
+        key: "user" to count per authenticated user (falling back to the
+            client IP without a valid token) or "ip" to count per client IP
+        query_param: Only count requests carrying this non-empty query
+            parameter, e.g. "search" on a listing
+        form_field: Also count per value of this form field, e.g.
+            "username" on a login form
+
+    Returns:
+        A dependency for the route's ``dependencies`` list
+    """
+    if key not in ("user", "ip"):
+        raise ValueError(f"Unknown rate limit key {key!r}")
+    _rejected.setdefault(name, 0)
+
+    def take(request: Request, field_value: str = "") -> float:
+        # Seconds until the request would be allowed, 0 if it is
+        if not settings.rate_limit_enabled:
+            return 0.0
+        if query_param is not None and not request.query_params.get(query_param):
+            return 0.0
+        bucket_key = f"{name}:{_client_key(request, key)}"
+        if form_field is not None:
+            bucket_key += f":{field_value[:MAX_FIELD_LENGTH]}"
+        retry_after = bucket_store.take(bucket_key, rate, burst)
+        if retry_after:
+            _rejected[name] += 1
+        return retry_after
+
+    async def check_rate_limit(request: Request):
+        if form_field is None:
+            if request.scope.get(CHECKED_SCOPE_KEY):
+                return
+            retry_after = take(request)
+        else:
+            # Already parsed for the route, Starlette caches the form
+            value = (await request.form()).get(form_field)
+            retry_after = take(request, value if isinstance(value, str) else "")
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=RETRY_DETAIL,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    check_rate_limit.rate_limit = (name, rate, burst)
+    # Checked by RateLimitMiddleware when it does not need the body
+    check_rate_limit.take_before_body = take if form_field is None else None
+    return Depends(check_rate_limit)
+
+
+def _route_limits(scope, cache: dict) -> list:
+    """The limits of the route a request matches that can be checked before its body is read"""
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match != Match.FULL:
+            continue
+        # Routes are unhashable; they live as long as the app
+        limits = cache.get(id(route))
+        if limits is None:
+            limits = cache[id(route)] = [
+                dependency.dependency.take_before_body
+                for dependency in getattr(route, "dependencies", ())
+                if getattr(dependency.dependency, "take_before_body", None) is not None
+            ]
+        return limits
+    return []
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware rejecting rate limited requests before their body is received"""
+
+    def __init__(self, app):
+        self.app = app
+        self._limits = {}
+
+    async def __call__(self, scope, receive, send):
+        if not settings.rate_limit_enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limits = _route_limits(scope, self._limits)
+        if limits:
+            request = Request(scope)
+            for take in limits:
+                retry_after = take(request)
+                if retry_after:
+                    body = json.dumps({"detail": RETRY_DETAIL}).encode()
+                    await send({
+                        "type": "http.response.start",
+                        "status": 429,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            (b"retry-after", str(math.ceil(retry_after)).encode()),
+                        ],
+                    })
+                    await send({"type": "http.response.body", "body": body})
+                    return
+            scope[CHECKED_SCOPE_KEY] = True
+        await self.app(scope, receive, send)
+
+
+register_collector(
+    {"rate_limited_total": ("counter", ("limit",), "Requests rejected with 429 by a rate limit")},
+    lambda: {"rate_limited_total": [[[name], count] for name, count in _rejected.items()]},
+)
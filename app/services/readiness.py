@@ -0,0 +1,107 @@
+# app/services/readiness.py
+"""
+Whether this worker should get traffic, reported on GET /ready.
+
+A worker warms up before it serves: it opens WARMUP_CONNECTIONS pooled
+database connections, so the first requests do not pay for connecting,
+and loads the username index, so mention autocomplete does not fall back
+to LIKE scans. If the database is unreachable, the worker starts anyway.
+It reports "warming" and retries the warm-up in the background. Under
+app.serve, a worker that got SIGTERM reports "draining" while it finishes
+its requests.
+"""
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import engine
+from app.services.username_index import username_index
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 5
+
+
+def warm_pool(connections: int):
+    """
+    Open pooled connections at once and hand them back to the pool.
+
+    Args:
+        connections: Connections to open, capped at the pool size
+    """
+    size = getattr(engine.pool, "size", None)
+    count = min(connections, size()) if size else 1
+    opened = []
+    try:
+        for _ in range(count):
+            connection = engine.connect()
+            opened.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in opened:
+            connection.close()
+
+
+def warm_up(timeout: float):
+    """Fill the database pool and load in-memory caches; raises if the database is unreachable"""
+    deadline = time.monotonic() + timeout
+    warm_pool(settings.warmup_connections)
+    if not username_index.wait_loaded(max(0.0, deadline - time.monotonic())):
+        # Only slower autocomplete until it loads, not a reason to refuse traffic
+        logger.warning("Username index still loading after warm-up timeout")
+
+
+class Readiness:
+    """Lifecycle of the worker: starting, warming, ready, draining"""
+
+    def __init__(self):
+        self.state = "starting"
+        self.detail = None
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start_draining(self):
+        self.state = "draining"
+        self.detail = None
+
+    async def warm_up(self):
+        """Warm up once, and keep retrying in the background if that fails"""
+        if not await self._attempt():
+            self._task = asyncio.get_running_loop().create_task(self._retry())
+
+    async def _attempt(self) -> bool:
+        if self.state == "draining":
+            return True
+        self.state = "warming"
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.to_thread(warm_up, settings.warmup_timeout), settings.warmup_timeout + 1)
+        except Exception as error:
+            self.detail = str(error) or type(error).__name__
+            logger.warning("Warm-up failed, retrying in %ss: %s", RETRY_SECONDS, self.detail)
+            return False
+        if self.state == "warming":
+            self.state = "ready"
+            self.detail = None
+        logger.info("Warm-up finished in %.2fs", time.perf_counter() - started)
+        return True
+
+    async def _retry(self):
+        while True:
+            await asyncio.sleep(RETRY_SECONDS)
+            if await self._attempt():
+                return
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+readiness = Readiness()
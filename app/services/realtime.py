@@ -0,0 +1,226 @@
+# app/services/realtime.py
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Events are collected per connection and flushed once per tick
+TICK_SECONDS = 0.05
+# Limits that keep one slow or greedy client from growing without bound
+MAX_TOPICS_PER_CONNECTION = 200
+MAX_PENDING_EVENTS = 500
+# Flushed batches waiting for a connection's sender; a client that falls
+# further behind, or takes longer for one send, is closed
+MAX_QUEUED_BATCHES = 20
+SEND_TIMEOUT_SECONDS = 5
+# "Try again later": the client may reconnect and resubscribe
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+
+def post_topic(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def reel_topic(reel_id: int) -> str:
+    return f"reel:{reel_id}"
+
+
+class LocalBroker:
+    """
+    In-process broker: every published event is delivered straight back to
+    this worker.
+
+    A cross-worker broker (Redis pub/sub, Postgres LISTEN/NOTIFY, ...) has
+    the same interface: ``start`` receives the callback to invoke for events
+    coming from any worker, ``publish`` sends an event to all workers.
+    """
+
+    # Only this worker can have subscribers, so publishers may skip work for
+    # topics nobody here is watching
+    is_local = True
+
+    def __init__(self):
+        self._deliver: Optional[Callable[[str, dict], None]] = None
+
+    def start(self, deliver: Callable[[str, dict], None]):
+        self._deliver = deliver
+
+    def publish(self, topic: str, event: dict):
+        if self._deliver is not None:
+            self._deliver(topic, event)
+
+    def stop(self):
+        self._deliver = None
+
+
+class _Connection:
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.topics = set()
+        # Coalesce key -> event, in arrival order
+        self.pending = {}
+        # Batches handed over by the flush loop; None tells the sender to close
+        self.queue = asyncio.Queue(MAX_QUEUED_BATCHES)
+        self.sender: Optional[asyncio.Task] = None
+        self.closing = False
+
+
+def _consume_result(task: asyncio.Future):
+    # Sends left running after a timeout fail later; that is expected
+    if not task.cancelled():
+        task.exception()
+
+
+class RealtimeHub:
+    """
+    Fan-out of item events to subscribed WebSocket connections.
+
+    ``publish`` is safe to call from the threadpool that runs the sync
+    routes; delivery and all connection state live on the event loop.
+    Events with the same coalesce key that arrive within one tick are
+    merged, so a burst of votes sends only the latest count. Each tick
+    hands every connection its batch without waiting; a task per
+    connection sends them, so a stalled client only delays itself and is
+    closed once it falls too far behind.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or LocalBroker()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._subscriptions: dict[str, set] = {}
+        self._dirty = set()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.broker.start(self._deliver_threadsafe)
+        self._flush_task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self):
+        self.broker.stop()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._loop = None
+
+    def is_watched(self, topic: str) -> bool:
+        """Whether an event for this topic can reach any subscriber"""
+        if not getattr(self.broker, "is_local", False):
+            return True
+        return topic in self._subscriptions
+
+    def publish(self, topic: str, event: dict):
+        """Publish an event for a topic to every worker"""
+        if self._loop is None or not self.is_watched(topic):
+            return
+        try:
+            self.broker.publish(topic, event)
+        except Exception:
+            # Realtime delivery is best effort and must never fail a write
+            logger.exception("Failed to publish realtime event for %s", topic)
+
+    def _deliver_threadsafe(self, topic: str, event: dict):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._deliver, topic, event)
+
+    def _deliver(self, topic: str, event: dict):
+        connections = self._subscriptions.get(topic)
+        if not connections:
+            return
+        key = (topic, event.get("type"), event.get("coalesce_key"))
+        message = {k: v for k, v in event.items() if k != "coalesce_key"}
+        message["topic"] = topic
+        for connection in connections:
+            pending = connection.pending
+            pending.pop(key, None)
+            pending[key] = message
+            if len(pending) > MAX_PENDING_EVENTS:
+                # Drop the oldest event for clients that cannot keep up
+                pending.pop(next(iter(pending)))
+            self._dirty.add(connection)
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(TICK_SECONDS)
+            if not self._dirty:
+                continue
+            dirty, self._dirty = self._dirty, set()
+            for connection in dirty:
+                self._flush(connection)
+
+    def _flush(self, connection: _Connection):
+        events = list(connection.pending.values())
+        connection.pending.clear()
+        if not events or connection.closing:
+            return
+        queue = connection.queue
+        if queue.full():
+            # Too far behind: drop its backlog and have its sender close it
+            logger.info("Closing a realtime connection that cannot keep up")
+            connection.closing = True
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+            return
+        queue.put_nowait(events)
+
+    async def _send_forever(self, connection: _Connection):
+        websocket = connection.websocket
+        while True:
+            events = await connection.queue.get()
+            if events is None:
+                break
+            # Waited for but never cancelled: a frame cut short would
+            # corrupt the stream
+            send = asyncio.ensure_future(websocket.send_json({"events": events}))
+            send.add_done_callback(_consume_result)
+            await asyncio.wait((send,), timeout=SEND_TIMEOUT_SECONDS)
+            if not send.done():
+                logger.info("Closing a stalled realtime connection")
+                break
+            if send.cancelled() or send.exception() is not None:
+                # The socket is gone; the receive loop ends on its own
+                self.disconnect(connection)
+                return
+        self.disconnect(connection)
+        try:
+            await websocket.close(code=SLOW_CLIENT_CLOSE_CODE)
+        except Exception:
+            logger.debug("Failed to close a slow realtime connection", exc_info=True)
+
+    def connect(self, websocket: WebSocket) -> _Connection:
+        connection = _Connection(websocket)
+        connection.sender = asyncio.get_running_loop().create_task(self._send_forever(connection))
+        return connection
+
+    def disconnect(self, connection: _Connection):
+        connection.closing = True
+        for topic in list(connection.topics):
+            self.unsubscribe(connection, topic)
+        self._dirty.discard(connection)
+        if connection.sender is not None and connection.sender is not asyncio.current_task():
+            connection.sender.cancel()
+
+    def subscribe(self, connection: _Connection, topic: str) -> bool:
+        if topic in connection.topics:
+            return True
+        if len(connection.topics) >= MAX_TOPICS_PER_CONNECTION:
+            return False
+        connection.topics.add(topic)
+        self._subscriptions.setdefault(topic, set()).add(connection)
+        return True
+
+    def unsubscribe(self, connection: _Connection, topic: str):
+        connection.topics.discard(topic)
+        connections = self._subscriptions.get(topic)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._subscriptions[topic]
+
+
+realtime_hub = RealtimeHub()
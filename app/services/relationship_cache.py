@@ -0,0 +1,91 @@
+# app/services/relationship_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+# How long a cached follow state stays valid. Follows made through another
+# worker are only seen here once the entry expires.
+RELATIONSHIP_TTL_SECONDS = 30
+# Number of viewers kept in memory and targets kept per viewer
+MAX_CACHED_VIEWERS = 10_000
+MAX_TARGETS_PER_VIEWER = 1_000
+
+
+class RelationshipCache:
+    """
+    Small per-viewer cache of follow state.
+
+    Stores both positive and negative results, keyed by the viewing user, as
+    ``target_id -> (follows, followed_by, expires_at)``.
+    """
+
+    def __init__(self, ttl=RELATIONSHIP_TTL_SECONDS, max_viewers=MAX_CACHED_VIEWERS,
+                 max_targets=MAX_TARGETS_PER_VIEWER):
+        self.ttl = ttl
+        self.max_viewers = max_viewers
+        self.max_targets = max_targets
+        self._viewers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, viewer_id: int, target_ids):
+        """
+        Look up cached follow state for several targets.
+
+        Returns:
+            A tuple ``(found, missing)`` where ``found`` maps target id to
+            ``(follows, followed_by)`` and ``missing`` lists the ids that
+            need to be read from the database.
+        """
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            entries = self._viewers.get(viewer_id)
+            if entries is not None:
+                self._viewers.move_to_end(viewer_id)
+            for target_id in target_ids:
+                entry = entries.get(target_id) if entries is not None else None
+                if entry is not None and entry[2] > now:
+                    found[target_id] = (entry[0], entry[1])
+                else:
+                    missing.append(target_id)
+        return found, missing
+
+    def set_many(self, viewer_id: int, states: dict):
+        """Store ``target_id -> (follows, followed_by)`` for a viewer."""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            entries = self._viewers.get(viewer_id)
+            if entries is None:
+                entries = OrderedDict()
+                self._viewers[viewer_id] = entries
+                if len(self._viewers) > self.max_viewers:
+                    self._viewers.popitem(last=False)
+            else:
+                self._viewers.move_to_end(viewer_id)
+            for target_id, (follows, followed_by) in states.items():
+                entries[target_id] = (follows, followed_by, expires_at)
+                entries.move_to_end(target_id)
+            while len(entries) > self.max_targets:
+                entries.popitem(last=False)
+
+    def invalidate(self, follower_id: int, following_id: int):
+        """Drop cached state for a follow edge, seen from both sides."""
+        with self._lock:
+            for viewer_id, target_id in ((follower_id, following_id), (following_id, follower_id)):
+                entries = self._viewers.get(viewer_id)
+                if entries is not None:
+                    entries.pop(target_id, None)
+
+    def forget_target(self, target_id: int):
+        """Drop cached state about a user for every viewer, e.g. once it is deleted."""
+        with self._lock:
+            for entries in self._viewers.values():
+                entries.pop(target_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._viewers.clear()
+
+
+relationship_cache = RelationshipCache()
@@ -0,0 +1,313 @@
+# app/services/resumable_upload.py
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sessions are locked with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+from app.config import settings
+from app.services.file_upload import UPLOAD_CHUNK_SIZE, FileTooLargeError
+from app.services.video_metadata import VideoMetadata, VideoMetadataError, probe_video
+
+# Upload sessions live on local disk so any worker on the host can continue
+# them. Keep this on the same filesystem as the media store (or its first
+# root, when sharded) so that finalizing is a rename rather than a copy,
+# and out of the directories served as static files: partial uploads and
+# their metadata are private until finalized.
+UPLOAD_SESSIONS_DIR = settings.upload_sessions_dir
+# Sessions untouched for this long are garbage collected
+STALE_SESSION_SECONDS = 24 * 60 * 60
+
+DATA_FILE = "data.part"
+# The data file is renamed to this while a finalize is in progress
+FINALIZING_FILE = "data.final"
+META_FILE = "meta.json"
+
+class UploadNotFoundError(Exception):
+    """The upload session does not exist or belongs to someone else"""
+
+
+class UploadBusyError(Exception):
+    """Another request is currently writing to this upload session"""
+
+
+class OffsetMismatchError(Exception):
+    """A chunk was sent for an offset other than the current one"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class UploadIncompleteError(Exception):
+    """Finalize was called before all bytes were received"""
+
+    def __init__(self, offset: int, size: int):
+        super().__init__(f"Upload has {offset} of {size} bytes")
+        self.offset = offset
+        self.size = size
+
+
+def _session_dir(upload_id: str) -> str:
+    # upload ids are generated by us; reject anything that is not a plain hex id
+    if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+        raise UploadNotFoundError(upload_id)
+    return os.path.join(UPLOAD_SESSIONS_DIR, upload_id)
+
+
+def create_session(owner_id: int, filename: str, size: int) -> str:
+    """
+    Start a resumable upload of ``size`` bytes.
+
+    Returns:
+        The id of the new upload session
+    """
+    upload_id = uuid.uuid4().hex
+    directory = _session_dir(upload_id)
+    os.makedirs(directory)
+    with open(os.path.join(directory, DATA_FILE), "wb"):
+        pass
+    _write_meta(upload_id, {"owner_id": owner_id, "filename": filename, "size": size, "created_at": time.time()})
+    return upload_id
+
+
+def _write_meta(upload_id: str, meta: dict):
+    directory = _session_dir(upload_id)
+    temp_path = os.path.join(directory, META_FILE + ".tmp")
+    with open(temp_path, "w") as meta_file:
+        json.dump({k: v for k, v in meta.items() if k not in ("offset", "upload_id")}, meta_file)
+    # Readers never see a half-written file
+    os.replace(temp_path, os.path.join(directory, META_FILE))
+
+
+def get_session(upload_id: str, owner_id: int) -> dict:
+    """
+    Return the session metadata with the current ``offset`` added.
+
+    Raises:
+        UploadNotFoundError: If there is no such session for this owner
+    """
+    directory = _session_dir(upload_id)
+    try:
+        with open(os.path.join(directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        offset = os.path.getsize(os.path.join(directory, DATA_FILE))
+    except (OSError, ValueError):
+        raise UploadNotFoundError(upload_id)
+    if meta["owner_id"] != owner_id:
+        raise UploadNotFoundError(upload_id)
+    meta["offset"] = offset
+    meta["upload_id"] = upload_id
+    return meta
+
+
+def _lock_or_busy(file, upload_id: str):
+    try:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            # Locks the first byte, which only the lock holder reads; closing releases it
+            position = file.tell()
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            file.seek(position)
+    except (BlockingIOError, PermissionError):
+        file.close()
+        raise UploadBusyError(upload_id)
+
+
+class ChunkWriter:
+    """
+    Appends one chunk to an upload session.
+
+    Holds an exclusive lock on the session's data file for its lifetime, so
+    two workers can never interleave writes. Data is buffered and written
+    in UPLOAD_CHUNK_SIZE pieces; whatever was written before a dropped
+    connection stays, and the client resumes from the new offset.
+
+    On close the video header is probed, until it has been found, so
+    unusable videos can be rejected long before the upload completes.
+    """
+
+    def __init__(self, upload_id: str, owner_id: int, offset: int):
+        meta = get_session(upload_id, owner_id)
+        self.upload_id = upload_id
+        self.size = meta["size"]
+        self._meta = meta
+        # r+b rather than ab: never recreate a data file claimed by finalize
+        try:
+            self._file = open(os.path.join(_session_dir(upload_id), DATA_FILE), "r+b")
+        except FileNotFoundError:
+            raise UploadNotFoundError(upload_id)
+        _lock_or_busy(self._file, upload_id)
+        self._buffer = bytearray()
+        # Re-read the offset now that we hold the lock
+        self.offset = self._file.seek(0, os.SEEK_END)
+        self._start_offset = self.offset
+        if offset != self.offset:
+            self.close()
+            raise OffsetMismatchError(self.offset)
+
+    def add(self, data: bytes) -> Optional[bytes]:
+        """
+        Buffer data and return a block to write once enough has accumulated.
+
+        Raises:
+            FileTooLargeError: If the data goes past the declared size
+        """
+        if self.offset + len(self._buffer) + len(data) > self.size:
+            raise FileTooLargeError(self.size)
+        self._buffer += data
+        if len(self._buffer) < UPLOAD_CHUNK_SIZE:
+            return None
+        block, self._buffer = bytes(self._buffer), bytearray()
+        return block
+
+    def write(self, block: bytes):
+        self._file.write(block)
+        self.offset += len(block)
+
+    def close(self) -> int:
+        """Write any buffered data, probe the video, release the lock and return the new offset"""
+        try:
+            if self._buffer:
+                self.write(bytes(self._buffer))
+                self._buffer = bytearray()
+            self._file.flush()
+            self._probe_video()
+        finally:
+            self._file.close()
+        return self.offset
+
+    @property
+    def video(self) -> Optional[VideoMetadata]:
+        """The video's metadata once its header has arrived"""
+        video = self._meta.get("video")
+        if video is None or "error" in video:
+            return None
+        return VideoMetadata.from_dict(video)
+
+    @property
+    def video_error(self) -> Optional[str]:
+        """Why the data is not a usable video, if that is already known"""
+        return (self._meta.get("video") or {}).get("error")
+
+    def _probe_video(self):
+        if "video" in self._meta or self.offset == self._start_offset:
+            return
+        try:
+            metadata = probe_video(self._file, self.offset, complete=self.offset == self.size)
+        except VideoMetadataError as e:
+            self._meta["video"] = {"error": str(e)}
+        else:
+            if metadata is None:
+                # The header is further into the file
+                return
+            self._meta["video"] = metadata.to_dict()
+        # Still under the data file lock, so no other writer races this
+        _write_meta(self.upload_id, self._meta)
+
+
+def claim_for_finalize(upload_id: str, owner_id: int):
+    """
+    Check that an upload is complete, claim it and hash its data.
+
+    The data file is renamed before hashing, so concurrent finalize calls
+    and late chunks for the same session fail instead of racing.
+
+    Returns:
+        A tuple (data_path, size, sha256 hex digest, filename, video) where
+        video is the metadata recorded while uploading, or None
+
+    Raises:
+        UploadIncompleteError: If not all bytes have been received
+        UploadBusyError: If another request is finalizing this upload
+    """
+    meta = get_session(upload_id, owner_id)
+    if meta["offset"] != meta["size"]:
+        raise UploadIncompleteError(meta["offset"], meta["size"])
+
+    directory = _session_dir(upload_id)
+    data_path = os.path.join(directory, FINALIZING_FILE)
+    try:
+        data_file = open(os.path.join(directory, DATA_FILE), "rb")
+    except FileNotFoundError:
+        raise UploadBusyError(upload_id)
+
+    with data_file:
+        # Refuse while a chunk is being written, then take the file away from future writers
+        _lock_or_busy(data_file, upload_id)
+        if fcntl is not None:
+            try:
+                os.rename(os.path.join(directory, DATA_FILE), data_path)
+            except FileNotFoundError:
+                raise UploadBusyError(upload_id)
+    if fcntl is None:
+        # Windows cannot rename an open file, so ours is closed first; the
+        # rename then fails instead while a writer has the file open
+        try:
+            os.rename(os.path.join(directory, DATA_FILE), data_path)
+        except (FileNotFoundError, PermissionError):
+            raise UploadBusyError(upload_id)
+
+    digest = hashlib.sha256()
+    with open(data_path, "rb") as data_file:
+        while True:
+            chunk = data_file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    video = meta.get("video")
+    if video is not None and "error" not in video:
+        video = VideoMetadata.from_dict(video)
+    else:
+        video = None
+    return data_path, meta["size"], digest.hexdigest(), meta["filename"], video
+
+
+def release_claim(upload_id: str):
+    """Undo claim_for_finalize after a failed finalize so it can be retried"""
+    directory = _session_dir(upload_id)
+    try:
+        os.rename(os.path.join(directory, FINALIZING_FILE), os.path.join(directory, DATA_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def delete_session(upload_id: str):
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+
+
+def collect_stale_sessions(max_age: float = STALE_SESSION_SECONDS) -> int:
+    """
+    Remove upload sessions that have not received data for ``max_age`` seconds.
+
+    Returns:
+        The number of sessions removed
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(UPLOAD_SESSIONS_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        try:
+            last_write = os.stat(os.path.join(entry.path, DATA_FILE)).st_mtime
+        except FileNotFoundError:
+            last_write = entry.stat().st_mtime
+        if last_write < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,160 @@
+# app/services/schema_upgrade.py
+"""
+Bring an existing database up to date with the models.
+
+create_all only creates missing tables; it never changes tables that
+already exist. Columns and indexes added to existing tables are listed
+here and applied on startup, right after create_all: a missing column is
+added with ALTER TABLE ... ADD COLUMN and backfilled, a missing index is
+created. Every step first looks at the live schema, so running the
+upgrade again, or from several workers at once, is harmless. To run it
+by hand before a deploy:
+
+    python -m app.services.schema_upgrade
+"""
+import logging
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateIndex
+
+from app.model import Comment, Post, Reel, User
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnUpgrade(NamedTuple):
+    model: type
+    name: str
+    # Constraints after the type, e.g. "NOT NULL DEFAULT 0"
+    constraints: str = ""
+    # Run once when the column was added, to fill it for existing rows
+    backfill: Optional[Callable[[], object]] = None
+
+
+class IndexUpgrade(NamedTuple):
+    model: type
+    name: str
+
+
+def _repair_comment_counts():
+    # Imported here: the counters service imports the engine from app.database
+    from app.services.counters import repair_comment_counts
+
+    return repair_comment_counts()
+
+
+COLUMNS = (
+    # Threaded comments with denormalized counts
+    ColumnUpgrade(Post, "comment_count", "NOT NULL DEFAULT 0", _repair_comment_counts),
+    ColumnUpgrade(Reel, "comment_count", "NOT NULL DEFAULT 0", _repair_comment_counts),
+    ColumnUpgrade(Comment, "parent_id", "REFERENCES comment (id) ON DELETE CASCADE"),
+    ColumnUpgrade(Comment, "reply_count", "NOT NULL DEFAULT 0", _repair_comment_counts),
+    # Video header metadata; NULL for reels uploaded before it was read
+    ColumnUpgrade(Reel, "width"),
+    ColumnUpgrade(Reel, "height"),
+    ColumnUpgrade(Reel, "codec"),
+    # Resized picture variants; NULL until generated, clients use the original
+    ColumnUpgrade(User, "profile_picture_variants"),
+    ColumnUpgrade(User, "background_image_variants"),
+    # Soft delete; NULL keeps every existing row visible
+    ColumnUpgrade(User, "deleted_at"),
+    ColumnUpgrade(Post, "deleted_at"),
+    ColumnUpgrade(Reel, "deleted_at"),
+)
+
+INDEXES = (
+    # Keyset pagination of comments and replies
+    IndexUpgrade(Comment, "ix_comment_post_thread"),
+    IndexUpgrade(Comment, "ix_comment_reel_thread"),
+    IndexUpgrade(Comment, "ix_comment_parent_created"),
+    # Username autocomplete
+    IndexUpgrade(User, "ix_user_username_lower_prefix"),
+)
+
+
+def _add_column(engine, upgrade: ColumnUpgrade) -> bool:
+    table = upgrade.model.__table__
+    preparer = engine.dialect.identifier_preparer
+    column_type = table.c[upgrade.name].type.compile(dialect=engine.dialect)
+    statement = (
+        f"ALTER TABLE {preparer.format_table(table)} "
+        f"ADD COLUMN {preparer.quote(upgrade.name)} {column_type} {upgrade.constraints}"
+    ).rstrip()
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(statement))
+    except SQLAlchemyError:
+        # Another worker may have added it in the meantime
+        if _has_column(engine, upgrade):
+            return False
+        raise
+    return True
+
+
+def _has_column(engine, upgrade: ColumnUpgrade) -> bool:
+    table = upgrade.model.__table__.name
+    return upgrade.name in {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+def _has_index(engine, table: str, name: str) -> bool:
+    # Reflection skips expression indexes on SQLite, so ask the catalog
+    if engine.dialect.name == "sqlite":
+        query = text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name")
+    elif engine.dialect.name == "postgresql":
+        query = text("SELECT 1 FROM pg_indexes WHERE indexname = :name")
+    else:
+        return name in {index["name"] for index in inspect(engine).get_indexes(table)}
+    with engine.connect() as connection:
+        return connection.execute(query, {"name": name}).first() is not None
+
+
+def upgrade_schema(engine) -> list[str]:
+    """
+    Add the listed columns and indexes that the database is missing.
+
+    Args:
+        engine: Engine of the database to upgrade; its tables must exist
+
+    Returns:
+        Descriptions of the steps that were applied, empty when up to date
+    """
+    applied = []
+    backfills = []
+    inspector = inspect(engine)
+    columns = {}
+    for upgrade in COLUMNS:
+        table = upgrade.model.__table__.name
+        if table not in columns:
+            columns[table] = {column["name"] for column in inspector.get_columns(table)}
+        if upgrade.name in columns[table]:
+            continue
+        if _add_column(engine, upgrade):
+            applied.append(f"added column {table}.{upgrade.name}")
+            if upgrade.backfill is not None and upgrade.backfill not in backfills:
+                backfills.append(upgrade.backfill)
+
+    for backfill in backfills:
+        applied.append(f"backfilled with {backfill.__name__.lstrip('_')}: {backfill()}")
+
+    for upgrade in INDEXES:
+        table = upgrade.model.__table__
+        if _has_index(engine, table.name, upgrade.name):
+            continue
+        index = next(index for index in table.indexes if index.name == upgrade.name)
+        # IF NOT EXISTS: another worker may create it between the check and here
+        with engine.begin() as connection:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+        applied.append(f"created index {upgrade.name}")
+
+    for step in applied:
+        logger.info("Schema upgrade: %s", step)
+    return applied
+
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    print("\n".join(upgrade_schema(engine)) or "Schema is up to date")
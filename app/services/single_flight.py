@@ -0,0 +1,129 @@
+# app/services/single_flight.py
+"""
+Single-flight coalescing of identical reads within a worker.
+
+When many requests ask for the same hot row at once (a viral post,
+/posts/latest on app open), the first runs the query and the others wait
+for its result instead of each running the same query on its own
+connection. With SINGLE_FLIGHT_WINDOW above zero, a finished result is
+also handed to identical calls arriving up to that many seconds later.
+
+Results are shared between requests, so they must be built from the
+rows inside the call (not ORM objects of the leader's session) and never
+be modified afterwards.
+
+Coalescing gives up read-your-writes. A request that joins a call
+started before it gets that call's result, which may predate a write
+committed in between, even the caller's own (edit a post, then re-read
+it). With a window, results can be that much older again. Only use it
+for reads where such a result is acceptable, and keep reads that must
+see a write, such as the response of the write itself, out of it.
+"""
+import threading
+import time
+from typing import Callable, Hashable, Optional, TypeVar
+
+from app.config import settings
+from app.services.metrics import register_collector
+
+T = TypeVar("T")
+
+# Finished calls kept for the window are swept once there are this many
+SWEEP_THRESHOLD = 10_000
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "finished_at")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.finished_at: Optional[float] = None
+
+
+class SingleFlight:
+    """
+    Shares one execution of a call among concurrent identical calls.
+
+    Calls run in the threadpool, so waiting is done on threading events.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._calls = {}
+        self._lock = threading.Lock()
+        # name -> [executed, coalesced]
+        self._counts = {}
+
+    def do(self, name: str, params: Hashable, fn: Callable[[], T]) -> T:
+        """
+        Run fn, or wait for the result of an identical call already running.
+
+        Args:
+            name: Name of the query, also the metrics label
+            params: Parameters of the query; together with name, the key
+            fn: Runs the query and returns an immutable result
+
+        Returns:
+            The result of fn, possibly from another request's call
+        """
+        if not settings.single_flight:
+            return fn()
+        key = (name, params)
+        with self._lock:
+            counts = self._counts.setdefault(name, [0, 0])
+            call = self._calls.get(key)
+            if call is not None and call.finished_at is not None and time.monotonic() - call.finished_at > self.window:
+                call = None
+            leader = call is None
+            if leader:
+                if len(self._calls) >= SWEEP_THRESHOLD:
+                    self._sweep()
+                call = self._calls[key] = _Call()
+                counts[0] += 1
+            else:
+                counts[1] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                call.finished_at = time.monotonic()
+                # Failures are not reused, and without a window nothing is
+                if (call.error is not None or self.window <= 0) and self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _sweep(self):
+        now = time.monotonic()
+        for key in [
+            key for key, call in self._calls.items()
+            if call.finished_at is not None and now - call.finished_at > self.window
+        ]:
+            del self._calls[key]
+
+    def metrics_state(self) -> dict:
+        counts = list(self._counts.items())
+        return {
+            "single_flight_executions_total": [[[name], executed] for name, (executed, _) in counts],
+            "single_flight_coalesced_total": [[[name], coalesced] for name, (_, coalesced) in counts],
+        }
+
+
+single_flight = SingleFlight(settings.single_flight_window)
+
+register_collector({
+    "single_flight_executions_total": ("counter", ("query",), "Coalescable queries actually executed"),
+    "single_flight_coalesced_total": ("counter", ("query",), "Queries answered with another request's result"),
+}, single_flight.metrics_state)
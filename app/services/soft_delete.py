@@ -0,0 +1,55 @@
+# app/services/soft_delete.py
+from datetime import datetime
+from typing import Optional, Union
+
+from sqlmodel import Session, select
+
+from app.model import Post, Reel, User
+from app.services.purger import queue_purge
+
+_ENTITY_NAMES = {User: "user", Post: "post", Reel: "reel"}
+
+
+def mark_deleted(session: Session, entity: Union[User, Post, Reel]):
+    """
+    Hide a user, post or reel from reads and queue its purge.
+
+    Nothing else is touched in the request: votes, comments, follows and
+    owned content are removed later by the purger in small batches, once
+    the caller commits. A user's email and phone number are released at
+    once, so they can be registered again before the purge.
+    """
+    entity.deleted_at = datetime.utcnow()
+    if isinstance(entity, User):
+        entity.email = f"deleted-{entity.id}@deleted.invalid"
+        entity.phone_number = None
+    session.add(entity)
+    queue_purge(session, _ENTITY_NAMES[type(entity)], entity.id)
+
+
+def get_visible_user(session: Session, user_id: int) -> Optional[User]:
+    """The user, or None if it does not exist or was deleted"""
+    user = session.get(User, user_id)
+    if user is None or user.deleted_at is not None:
+        return None
+    return user
+
+
+def get_visible_post(session: Session, post_id: int) -> Optional[Post]:
+    """The post, or None if it, or its owner, was deleted"""
+    query = select(Post).join(User, User.id == Post.owner_id).where(
+        Post.id == post_id,
+        Post.deleted_at.is_(None),
+        User.deleted_at.is_(None)
+    )
+    return session.exec(query).first()
+
+
+def get_visible_reel(session: Session, reel_id: int) -> Optional[Reel]:
+    """The reel, or None if it, or its owner, was deleted"""
+    query = select(Reel).join(User, User.id == Reel.owner_id).where(
+        Reel.id == reel_id,
+        Reel.deleted_at.is_(None),
+        User.deleted_at.is_(None)
+    )
+    return session.exec(query).first()
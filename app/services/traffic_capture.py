@@ -0,0 +1,214 @@
+# app/services/traffic_capture.py
+"""
+Sampled capture of production traffic for replay (benchmarks/replay.py).
+
+With CAPTURE_DIR set, CAPTURE_SAMPLE_RATE of the HTTP requests are
+recorded as one JSON line each: time, method, route template, path,
+query parameters, a keyed hash of the token's subject, status, response
+size and duration. JSON bodies up to CAPTURE_BODY_LIMIT bytes keep their
+numbers, booleans and nulls (ids, so the access skew survives) while
+strings are reduced to their length; other bodies are recorded by size
+only. Query parameter values are redacted the same way: numbers and
+lists of numbers are kept, anything else (search terms, cursors) becomes
+its length.
+
+Each worker appends to its own gzip file, a member per flush, and starts
+a new file past CAPTURE_FILE_BYTES; the oldest files beyond
+CAPTURE_KEEP_FILES are deleted.
+"""
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from jose import JWTError, jwt
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+FILE_PREFIX = "capture-"
+FILE_SUFFIX = ".jsonl.gz"
+FLUSH_SECONDS = 1.0
+# Records kept in memory at most; beyond this, samples are dropped
+MAX_PENDING = 10000
+# Query parameter values kept as they are: numbers and comma-separated lists of them
+_NUMBERS = re.compile(r"-?\d+(\.\d+)?(,-?\d+(\.\d+)?)*")
+
+
+def subject_hash(authorization: Optional[str]) -> Optional[str]:
+    """
+    Keyed hash of the subject of a bearer token, stable across requests.
+
+    The signature is not verified; the hash only groups requests by user.
+    """
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        subject = jwt.get_unverified_claims(authorization[7:]).get("sub")
+    except JWTError:
+        return "invalid"
+    if subject is None:
+        return None
+    return hmac.new(settings.secret_key.encode(), str(subject).encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def redact_body(value):
+    """Keep the shape, numbers, booleans and nulls of a JSON body; strings become their length"""
+    if isinstance(value, dict):
+        return {key: redact_body(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact_body(item) for item in value]
+    if isinstance(value, str):
+        return {"$len": len(value)}
+    return value
+
+
+def redact_query(query_string: str) -> list:
+    """Query parameters as [name, value] pairs; values other than numbers become their length"""
+    return [
+        [name, value if _NUMBERS.fullmatch(value) else {"$len": len(value)}]
+        for name, value in parse_qsl(query_string, keep_blank_values=True)
+    ]
+
+
+def _capture_files(directory: str) -> list[str]:
+    names = [name for name in os.listdir(directory) if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX)]
+    return sorted((os.path.join(directory, name) for name in names), key=os.path.getmtime)
+
+
+class TrafficRecorder:
+    """Buffers records on the event loop and appends them to disk in a thread"""
+
+    def __init__(self, directory: Optional[str], file_bytes: int, keep_files: int):
+        self.directory = directory
+        self.file_bytes = file_bytes
+        self.keep_files = keep_files
+        self.pending = []
+        self.dropped = 0
+        self._path = None
+        self._task = None
+
+    def record(self, entry: dict):
+        if len(self.pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self.pending.append(entry)
+
+    def _new_path(self) -> str:
+        return os.path.join(self.directory, f"{FILE_PREFIX}{os.getpid()}-{int(time.time() * 1000)}{FILE_SUFFIX}")
+
+    def _write(self, lines: list[str]):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._path is None or (os.path.exists(self._path) and os.path.getsize(self._path) >= self.file_bytes):
+            self._path = self._new_path()
+            for old_path in _capture_files(self.directory)[:-self.keep_files]:
+                os.remove(old_path)
+        with gzip.open(self._path, "at") as output:
+            output.write("".join(lines))
+
+    async def flush(self):
+        if not self.pending:
+            return
+        entries, self.pending = self.pending, []
+        lines = [json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries]
+        await asyncio.to_thread(self._write, lines)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except OSError:
+                logger.exception("Failed to write captured traffic")
+
+    def start(self):
+        if self.directory and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self.flush()
+            if self.dropped:
+                logger.warning("Dropped %d captured requests: the writer fell behind", self.dropped)
+
+
+traffic_recorder = TrafficRecorder(settings.capture_dir, settings.capture_file_bytes, settings.capture_keep_files)
+
+
+class TrafficCaptureMiddleware:
+    """Pure ASGI middleware recording a sample of the requests"""
+
+    def __init__(self, app, recorder: TrafficRecorder = traffic_recorder):
+        self.app = app
+        self.recorder = recorder
+        self.enabled = bool(recorder.directory) and settings.capture_sample_rate > 0
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or random.random() >= settings.capture_sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        keep_body = content_type.startswith("application/json")
+        body = []
+        body_size = 0
+        status_code = 500
+        sent = 0
+
+        async def receive_wrapper():
+            nonlocal body_size, keep_body
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                body_size += len(chunk)
+                if keep_body and body_size <= settings.capture_body_limit:
+                    body.append(chunk)
+                else:
+                    keep_body = False
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code, sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            route = scope.get("route")
+            entry = {
+                "ts": round(started_at, 3),
+                "method": scope["method"],
+                "route": getattr(route, "path", None),
+                "path": scope["path"],
+                "query": redact_query(scope.get("query_string", b"").decode("latin-1")),
+                "subject": subject_hash(headers.get(b"authorization", b"").decode("latin-1")),
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "response_bytes": sent,
+                "body_bytes": body_size,
+                "content_type": content_type.split(";")[0] or None,
+            }
+            if keep_body and body:
+                try:
+                    entry["body"] = redact_body(json.loads(b"".join(body)))
+                except ValueError:
+                    pass
+            self.recorder.record(entry)
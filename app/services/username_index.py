@@ -0,0 +1,205 @@
+# app/services/username_index.py
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.model import User
+
+logger = logging.getLogger(__name__)
+
+# Pull users created by other workers this often
+REFRESH_SECONDS = 5
+# Rebuild from scratch this often so names changed on other workers become
+# searchable; their old names and deleted users are dropped at search time
+REBUILD_SECONDS = 60 * 60
+LOAD_BATCH_SIZE = 10_000
+# Checking a page against the database drops stale entries from the index;
+# scan again this many times to refill the page
+MAX_SEARCH_ROUNDS = 3
+
+
+def _key(username: str) -> str:
+    return username.lower()
+
+
+class UsernameIndex:
+    """
+    Sorted in-memory array of usernames for case-insensitive prefix search.
+
+    Names are kept sorted by their lowercase form, with user ids in a
+    parallel array, so a lookup is two binary searches plus a short scan.
+    Writes from this worker are applied immediately; a background thread
+    pulls new users from the database every few seconds and rebuilds the
+    whole array periodically. Renames and deletes made by other workers
+    are only seen by the rebuild, so ``search`` checks its hits against
+    the database by primary key and repairs the entries that changed.
+    Until the first load finishes, ``search`` returns None and callers
+    fall back to the database.
+    """
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, rebuild_seconds=REBUILD_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._names: list[str] = []
+        self._ids = array("q")
+        self._max_id = 0
+        self._loaded = False
+        self._loaded_event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def wait_loaded(self, timeout: float) -> bool:
+        """Start the loader and wait up to timeout seconds for the first load"""
+        self.start()
+        return self._loaded_event.wait(timeout)
+
+    def start(self):
+        """Start the background loader once"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="username-index", daemon=True)
+            self._thread.start()
+
+    def search(self, session: Session, prefix: str, limit: int):
+        """
+        Return up to ``limit`` ``(id, username)`` pairs starting with prefix,
+        or None when the index is not loaded yet.
+
+        Args:
+            session: Session used to check the hits against the database
+            prefix: Case-insensitive username prefix
+            limit: Maximum number of users to return
+
+        Returns:
+            Users that still exist under the indexed name, or None
+        """
+        if not self._loaded:
+            self.start()
+            return None
+        for _ in range(MAX_SEARCH_ROUNDS):
+            candidates = self._scan(prefix, limit)
+            if not candidates:
+                return []
+            current = dict(session.exec(
+                select(User.id, User.username).where(
+                    User.id.in_([user_id for user_id, _ in candidates]),
+                    User.deleted_at.is_(None)
+                )
+            ).all())
+            matches = [(user_id, name) for user_id, name in candidates if current.get(user_id) == name]
+            if len(matches) == len(candidates):
+                return matches
+            with self._lock:
+                for user_id, name in candidates:
+                    if current.get(user_id) != name:
+                        self._delete(user_id, name)
+                        if user_id in current:
+                            self._insert(user_id, current[user_id])
+        return matches
+
+    def _scan(self, prefix: str, limit: int):
+        prefix = _key(prefix)
+        matches = []
+        with self._lock:
+            names, ids = self._names, self._ids
+            position = bisect_left(names, prefix, key=_key)
+            while position < len(names) and len(matches) < limit:
+                name = names[position]
+                if not _key(name).startswith(prefix):
+                    break
+                matches.append((ids[position], name))
+                position += 1
+        return matches
+
+    def add(self, user_id: int, username: str):
+        with self._lock:
+            if not self._loaded:
+                return
+            self._insert(user_id, username)
+
+    def remove(self, user_id: int, username: str):
+        with self._lock:
+            if self._loaded:
+                self._delete(user_id, username)
+
+    def rename(self, user_id: int, old_username: str, new_username: str):
+        with self._lock:
+            if self._loaded:
+                self._delete(user_id, old_username)
+                self._insert(user_id, new_username)
+
+    def _insert(self, user_id: int, username: str):
+        position = bisect_right(self._names, _key(username), key=_key)
+        self._names.insert(position, username)
+        self._ids.insert(position, user_id)
+
+    def _delete(self, user_id: int, username: str):
+        key = _key(username)
+        position = bisect_left(self._names, key, key=_key)
+        end = bisect_right(self._names, key, key=_key)
+        while position < end:
+            if self._ids[position] == user_id:
+                del self._names[position]
+                del self._ids[position]
+                return
+            position += 1
+
+    def _load_all(self):
+        rows = []
+        max_id = 0
+        with Session(engine) as session:
+            query = select(User.id, User.username).where(
+                User.deleted_at.is_(None)
+            ).execution_options(yield_per=LOAD_BATCH_SIZE)
+            for user_id, username in session.exec(query):
+                rows.append((_key(username), username, user_id))
+                max_id = max(max_id, user_id)
+        rows.sort()
+        names = [username for _, username, _ in rows]
+        ids = array("q", (user_id for _, _, user_id in rows))
+        with self._lock:
+            self._names, self._ids, self._max_id = names, ids, max_id
+            self._loaded = True
+        self._loaded_event.set()
+        logger.info("Username index loaded with %d users", len(names))
+
+    def _load_new(self):
+        with Session(engine) as session:
+            rows = session.exec(
+                select(User.id, User.username, User.deleted_at).where(User.id > self._max_id).order_by(User.id)
+            ).all()
+        if not rows:
+            return
+        with self._lock:
+            for user_id, username, deleted_at in rows:
+                # Users created by this worker are already present
+                self._delete(user_id, username)
+                if deleted_at is None:
+                    self._insert(user_id, username)
+                self._max_id = max(self._max_id, user_id)
+
+    def _run(self):
+        last_rebuild = None
+        while True:
+            try:
+                if last_rebuild is None or time.monotonic() - last_rebuild >= self.rebuild_seconds:
+                    self._load_all()
+                    last_rebuild = time.monotonic()
+                else:
+                    self._load_new()
+            except Exception:
+                logger.exception("Failed to refresh username index")
+            time.sleep(self.refresh_seconds)
+
+
+username_index = UsernameIndex()
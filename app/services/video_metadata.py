@@ -0,0 +1,251 @@
+# app/services/video_metadata.py
+import os
+import struct
+from typing import BinaryIO, NamedTuple, Optional
+
+# Header boxes are tiny; anything bigger is not a file we want to trust
+_MAX_HEADER_BOX = 64 * 1024
+# Enough of an AVI file to cover the hdrl list
+_AVI_HEADER_BYTES = 64 * 1024
+
+
+class VideoMetadata(NamedTuple):
+    duration: float  # Seconds
+    width: Optional[int]
+    height: Optional[int]
+    codec: Optional[str]  # Sample entry / FourCC, e.g. "avc1", "hvc1", "H264"
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "VideoMetadata":
+        return cls(**data)
+
+
+class VideoMetadataError(Exception):
+    """The file is not a video whose metadata we can read"""
+
+
+class IncompleteMetadataError(VideoMetadataError):
+    """The metadata lies beyond the bytes available so far"""
+
+
+class _Reader:
+    """Positioned reads bounded by the number of bytes available"""
+
+    def __init__(self, file: BinaryIO, available: int):
+        self.file = file
+        self.available = available
+
+    def read(self, offset: int, size: int) -> bytes:
+        if offset + size > self.available:
+            raise IncompleteMetadataError(f"Need bytes up to {offset + size}, have {self.available}")
+        self.file.seek(offset)
+        data = self.file.read(size)
+        if len(data) != size:
+            raise IncompleteMetadataError(f"Short read at offset {offset}")
+        return data
+
+
+def _boxes(reader: _Reader, start: int, end: int):
+    """
+    Yield ``(type, payload_start, payload_end)`` for the boxes in [start, end),
+    reading only their 8 or 16 byte headers.
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack(">I4s", reader.read(offset, 8))
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", reader.read(offset + 8, 8))
+            header = 16
+        elif size == 0:
+            # The box runs to the end of its parent (or of the file)
+            size = end - offset
+        if size < header:
+            raise VideoMetadataError(f"Invalid size for box {box_type!r} at offset {offset}")
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _payload(reader: _Reader, start: int, end: int) -> bytes:
+    if end - start > _MAX_HEADER_BOX:
+        raise VideoMetadataError("Header box too large")
+    return reader.read(start, end - start)
+
+
+def _parse_mvhd(data: bytes):
+    """Return (timescale, duration) from a movie header"""
+    if data[0] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, 12)
+    return timescale, duration
+
+
+def _parse_tkhd(data: bytes):
+    """Return the display (width, height) from a track header"""
+    # Width and height are the last two 16.16 fixed-point fields
+    width, height = struct.unpack_from(">II", data, len(data) - 8)
+    return width >> 16, height >> 16
+
+
+def _parse_stsd(data: bytes):
+    """Return (codec, coded width, coded height) of the first sample entry"""
+    entry_count = struct.unpack_from(">I", data, 4)[0]
+    if entry_count == 0 or len(data) < 16:
+        return None, None, None
+    codec = data[12:16].decode("latin-1").strip("\x00 ") or None
+    # Visual sample entries store width and height 24 bytes into the entry payload
+    if len(data) >= 16 + 28:
+        width, height = struct.unpack_from(">HH", data, 16 + 24)
+        return codec, width, height
+    return codec, None, None
+
+
+def _parse_track(reader: _Reader, start: int, end: int):
+    """Return (handler, width, height, codec) for one trak box"""
+    handler = codec = None
+    width = height = None
+    coded_width = coded_height = None
+    for box_type, payload_start, payload_end in _boxes(reader, start, end):
+        if box_type == b"tkhd":
+            width, height = _parse_tkhd(_payload(reader, payload_start, payload_end))
+        elif box_type == b"mdia":
+            for mdia_type, mdia_start, mdia_end in _boxes(reader, payload_start, payload_end):
+                if mdia_type == b"hdlr":
+                    handler = _payload(reader, mdia_start, mdia_end)[8:12]
+                elif mdia_type == b"minf":
+                    for minf_type, minf_start, minf_end in _boxes(reader, mdia_start, mdia_end):
+                        if minf_type != b"stbl":
+                            continue
+                        for stbl_type, stbl_start, stbl_end in _boxes(reader, minf_start, minf_end):
+                            if stbl_type == b"stsd":
+                                codec, coded_width, coded_height = _parse_stsd(
+                                    _payload(reader, stbl_start, stbl_end)
+                                )
+    # Prefer the display size; fall back to the coded size
+    return handler, width or coded_width, height or coded_height, codec
+
+
+def _parse_moov(reader: _Reader, start: int, end: int) -> VideoMetadata:
+    timescale = duration = None
+    fragment_duration = None
+    video = None
+    for box_type, payload_start, payload_end in _boxes(reader, start, end):
+        if box_type == b"mvhd":
+            timescale, duration = _parse_mvhd(_payload(reader, payload_start, payload_end))
+        elif box_type == b"trak" and video is None:
+            track = _parse_track(reader, payload_start, payload_end)
+            if track[0] == b"vide":
+                video = track
+        elif box_type == b"mvex":
+            # Fragmented files may leave mvhd empty and put the total in mehd
+            for mvex_type, mvex_start, mvex_end in _boxes(reader, payload_start, payload_end):
+                if mvex_type == b"mehd":
+                    data = _payload(reader, mvex_start, mvex_end)
+                    fragment_duration = struct.unpack_from(">Q" if data[0] == 1 else ">I", data, 4)[0]
+
+    if not timescale:
+        raise VideoMetadataError("Missing movie header")
+    if video is None:
+        raise VideoMetadataError("No video track")
+    _, width, height, codec = video
+    return VideoMetadata(
+        duration=(duration or fragment_duration or 0) / timescale,
+        width=width or None,
+        height=height or None,
+        codec=codec
+    )
+
+
+def _parse_iso_bmff(reader: _Reader) -> VideoMetadata:
+    for box_type, payload_start, payload_end in _boxes(reader, 0, reader.available):
+        if box_type == b"moov":
+            return _parse_moov(reader, payload_start, payload_end)
+        if payload_end > reader.available:
+            # Usually mdat before moov: the movie header comes after this box
+            raise IncompleteMetadataError(f"Box {box_type!r} ends past the available data")
+    raise IncompleteMetadataError("No moov box found")
+
+
+def _parse_avi(reader: _Reader) -> VideoMetadata:
+    # RIFF 'AVI ' -> LIST 'hdrl' -> avih, then LIST 'strl' -> strh per stream
+    data = reader.read(0, min(reader.available, _AVI_HEADER_BYTES))
+    position = data.find(b"avih")
+    if position < 0 or position + 8 + 40 > len(data):
+        if reader.available < _AVI_HEADER_BYTES:
+            raise IncompleteMetadataError("AVI main header not received yet")
+        raise VideoMetadataError("Missing AVI main header")
+    (micro_sec_per_frame, _, _, _, total_frames, _, _, _, width, height) = struct.unpack_from(
+        "<10I", data, position + 8
+    )
+    # The first stream header with type 'vids' names the video codec
+    codec = None
+    stream = data.find(b"strh", position)
+    while 0 <= stream and stream + 16 <= len(data):
+        if data[stream + 8:stream + 12] == b"vids":
+            codec = data[stream + 12:stream + 16].decode("latin-1").strip("\x00 ") or None
+            break
+        stream = data.find(b"strh", stream + 4)
+    return VideoMetadata(
+        duration=micro_sec_per_frame * total_frames / 1_000_000,
+        width=width or None,
+        height=height or None,
+        codec=codec
+    )
+
+
+def parse_video_metadata(file: BinaryIO, available: Optional[int] = None) -> VideoMetadata:
+    """
+    Read duration, dimensions and codec from an MP4/MOV (ISO-BMFF) or AVI file.
+
+    Only box headers and the few small header boxes are read; everything
+    else, including the media data and sample tables, is skipped with a
+    seek. This makes the cost independent of the file size.
+
+    Args:
+        file: A seekable binary file object
+        available: Number of bytes present so far, for files still being
+            uploaded. Defaults to the whole file.
+
+    Returns:
+        The video's metadata
+
+    Raises:
+        IncompleteMetadataError: If the metadata lies beyond ``available``
+        VideoMetadataError: If the file is not a readable video
+    """
+    if available is None:
+        available = file.seek(0, os.SEEK_END)
+    reader = _Reader(file, available)
+    signature = reader.read(0, 12)
+    if signature[:4] == b"RIFF" and signature[8:12] == b"AVI ":
+        return _parse_avi(reader)
+    if signature[4:8] not in (b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"):
+        raise VideoMetadataError("Not an MP4, MOV or AVI file")
+    return _parse_iso_bmff(reader)
+
+
+def probe_video(file: BinaryIO, available: Optional[int] = None, complete: bool = True) -> Optional[VideoMetadata]:
+    """
+    parse_video_metadata for files that may still be arriving.
+
+    Returns None when more data is needed and ``complete`` is False; once
+    the file is complete, missing metadata is an error.
+    """
+    try:
+        return parse_video_metadata(file, available)
+    except IncompleteMetadataError:
+        if complete:
+            raise VideoMetadataError("Video metadata not found")
+        return None
+    except (struct.error, IndexError):
+        raise VideoMetadataError("Corrupt video header")
+
+
+def probe_video_path(path: str) -> VideoMetadata:
+    """Read the metadata of a complete video file on disk"""
+    with open(path, "rb") as file:
+        return probe_video(file)
@@ -0,0 +1,57 @@
+# app/tasks.py
+"""
+Background tasks run by the job workers.
+
+Importing this module registers them; routes enqueue them by name with
+``app.services.jobs.enqueue`` in their own transaction.
+"""
+import logging
+from typing import Optional
+
+from app.config import settings
+from app.services import media_gc
+from app.services.counters import repair_comment_counts
+from app.services.jobs import prune_jobs, submit, task
+from app.services.purger import PURGE_SLICE_SECONDS, purger
+from app.services.resumable_upload import collect_stale_sessions
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+
+# Deleted content is already hidden, but its rows hold disk and keep the
+# email of a deleted user taken, so purges go before maintenance work.
+# The periodic run picks up batches that failed and are due for a retry.
+@task("purge", priority=10, timeout=5 * MINUTE, every=MINUTE)
+def purge():
+    if not purger.run_pending(max_seconds=PURGE_SLICE_SECONDS):
+        # Hand the worker back to other jobs; the follow-up continues
+        submit("purge")
+
+
+@task("repair_counters", priority=-10, timeout=HOUR, every=DAY)
+def repair_counters():
+    logger.info("Comment counter repair: %s", repair_comment_counts())
+
+
+# Report only, unless MEDIA_GC_DELETE is set or the caller asks for a real run
+@task("media_gc", priority=-20, max_attempts=2, timeout=6 * HOUR, every=DAY)
+def collect_media_garbage(dry_run: Optional[bool] = None):
+    if dry_run is None:
+        dry_run = not settings.media_gc_delete
+    logger.info("Media garbage collection: %s", media_gc.collect_garbage(dry_run=dry_run))
+
+
+@task("upload_sessions_gc", priority=-20, timeout=HOUR, every=10 * MINUTE)
+def collect_upload_sessions():
+    removed = collect_stale_sessions()
+    if removed:
+        logger.info("Removed %d stale upload sessions", removed)
+
+
+@task("prune_jobs", priority=-30, timeout=HOUR, every=HOUR)
+def prune_finished_jobs():
+    logger.info("Job pruning: %s", prune_jobs())
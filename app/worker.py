@@ -0,0 +1,58 @@
+# app/worker.py
+"""
+Dedicated background job worker, run next to the API processes.
+
+    python -m app.worker --concurrency 4
+    python -m app.worker --stats
+    python -m app.worker --enqueue repair_counters --payload '{}'
+
+Set JOB_WORKER_IN_APP=false on the API when dedicated workers run, so
+request processes do not run jobs themselves.
+"""
+import argparse
+import json
+import logging
+import signal
+import threading
+
+import app.tasks  # noqa: F401  (registers the tasks)
+from app.services.jobs import TASKS, JobWorker, queue_metrics, submit
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs run at once")
+    parser.add_argument("--poll", type=float, default=1.0, help="seconds between polls when idle")
+    parser.add_argument("--drain-seconds", type=float, default=30, help="wait for running jobs on shutdown")
+    parser.add_argument("--no-schedule", action="store_true", help="do not enqueue periodic tasks")
+    parser.add_argument("--stats", action="store_true", help="print queue depth per task and exit")
+    parser.add_argument("--enqueue", choices=sorted(TASKS), help="enqueue one job and exit")
+    parser.add_argument("--payload", default="{}", help="JSON keyword arguments for --enqueue")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.stats:
+        print(json.dumps(queue_metrics(), indent=2))
+        return
+    if args.enqueue:
+        submit(args.enqueue, json.loads(args.payload))
+        return
+
+    worker = JobWorker(concurrency=args.concurrency, poll_seconds=args.poll, schedule=not args.no_schedule)
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    worker.start()
+    logger.info("Job worker %s running %s", worker.name, ", ".join(sorted(TASKS)))
+    while not stopping.wait(1):
+        pass
+    logger.info("Stopping, waiting up to %ss for running jobs", args.drain_seconds)
+    worker.stop(timeout=args.drain_seconds)
+    logger.info("Job stats: %s", json.dumps(worker.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# benchmarks/common.py
+"""Helpers shared by the benchmark scripts."""
+import math
+import uuid
+
+import httpx
+
+TEST_PASSWORD = "Bench!Passw0rd"
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers (0 < fraction <= 1)"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    return {
+        "count": len(samples),
+        "p50_ms": _ms(percentile(samples, 0.50)),
+        "p95_ms": _ms(percentile(samples, 0.95)),
+        "p99_ms": _ms(percentile(samples, 0.99)),
+        "max_ms": _ms(max(samples) if samples else None),
+    }
+
+
+def _ms(value):
+    return None if value is None else round(value * 1000, 3)
+
+
+async def create_user_and_login(client: httpx.AsyncClient, prefix: str = "bench"):
+    """Register a throwaway user and return (user_id, auth headers)"""
+    username = f"{prefix}_{uuid.uuid4().hex[:12]}"
+    response = await client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": TEST_PASSWORD,
+        "password_confirm": TEST_PASSWORD,
+        "phone_number": None,
+    })
+    response.raise_for_status()
+    user_id = response.json()["id"]
+    response = await client.post("/users/login", data={"username": username, "password": TEST_PASSWORD})
+    response.raise_for_status()
+    return user_id, {"Authorization": f"Bearer {response.json()['access_token']}"}
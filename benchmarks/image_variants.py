@@ -0,0 +1,82 @@
+# benchmarks/image_variants.py
+"""
+Measure image variant generation throughput.
+
+Generates synthetic photos of --width x --height and renders the profile
+picture variants of --images of them through a process pool at each
+worker count, printing images per second and per-image latency as JSON.
+
+    python -m benchmarks.image_variants --images 64 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from app.services.image_processing import VARIANT_SPECS, render_variants
+from benchmarks.common import summarize
+
+
+def _make_photo(path, width, height, seed):
+    # Noise over a gradient compresses roughly like a real photo
+    noise = Image.effect_noise((width, height), 40 + seed % 20)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    Image.merge("RGB", (noise, gradient, noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT))).save(
+        path, "JPEG", quality=90
+    )
+
+
+def _timed_render(path, specs, temp_dir):
+    started = time.perf_counter()
+    variants = render_variants(path, specs, temp_dir)
+    elapsed = time.perf_counter() - started
+    for variant in variants:
+        os.remove(variant.temp_path)
+    return elapsed, sum(variant.size for variant in variants)
+
+
+def main(args):
+    specs = VARIANT_SPECS[args.field]
+    work_dir = tempfile.mkdtemp(prefix="variants-bench-")
+    try:
+        sources = []
+        for index in range(min(args.images, 8)):
+            path = os.path.join(work_dir, f"photo-{index}.jpg")
+            _make_photo(path, args.width, args.height, index)
+            sources.append(path)
+        jobs = [sources[index % len(sources)] for index in range(args.images)]
+        input_bytes = sum(os.path.getsize(path) for path in jobs)
+
+        report = {"config": vars(args), "source_mb": round(os.path.getsize(sources[0]) / 1e6, 2), "runs": []}
+        for workers in args.workers:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Warm the workers up so process start-up is not measured
+                list(pool.map(_timed_render, sources[:workers], [specs] * workers, [work_dir] * workers))
+                started = time.perf_counter()
+                results = list(pool.map(_timed_render, jobs, [specs] * len(jobs), [work_dir] * len(jobs)))
+                elapsed = time.perf_counter() - started
+            report["runs"].append({
+                "workers": workers,
+                "images_per_s": round(len(jobs) / elapsed, 2),
+                "input_mb_per_s": round(input_bytes / elapsed / 1e6, 2),
+                "output_bytes_per_image": sum(size for _, size in results) // len(results),
+                "per_image": summarize([duration for duration, _ in results]),
+            })
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=64, help="images per run")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--field", choices=sorted(VARIANT_SPECS), default="profile_picture")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="process counts to compare")
+    main(parser.parse_args())
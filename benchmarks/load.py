@@ -0,0 +1,345 @@
+# benchmarks/load.py
+"""
+End-to-end load test of the API with a mixed workload.
+
+Seeds users, posts, reels, comments, votes and follows through the API,
+then runs the workload mix for --duration seconds at each --concurrency
+level (one client per simulated user) and prints throughput and latency
+percentiles per operation as JSON. Seeding and operation choice are
+driven by --seed, so two runs against the same build do the same work;
+save the output and compare runs with jq or a spreadsheet.
+
+With --boot, a uvicorn server is started on a throwaway SQLite database
+(or --database-url) and stopped afterwards; otherwise --base-url must
+point at a running server, preferably on a freshly migrated database,
+started with RATE_LIMIT_ENABLED=false (every client logs in from here).
+
+    python -m benchmarks.load --boot --concurrency 1 8 32 --duration 20 --output run.json
+    python -m benchmarks.load --base-url http://127.0.0.1:8000 --mix feed=10 login=0 upload=0
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.common import TEST_PASSWORD, create_user_and_login, summarize
+from benchmarks.video_metadata import build_mp4
+
+# Relative weight of each operation in the mix
+DEFAULT_MIX = {
+    "feed": 30,
+    "post_by_id": 20,
+    "reel_by_id": 10,
+    "comments": 15,
+    "vote": 10,
+    "follow": 5,
+    "login": 2,
+    "upload": 1,
+}
+
+
+class Dataset:
+    """Ids created by the seeding phase"""
+
+    def __init__(self):
+        self.user_ids = []
+        self.post_ids = []
+        self.reel_ids = []
+
+
+class Client:
+    """One simulated user: its own identity, random stream and toggle state"""
+
+    def __init__(self, http, user_id, username, headers, rng):
+        self.http = http
+        self.user_id = user_id
+        self.username = username
+        self.headers = headers
+        self.rng = rng
+        self.following = set()
+
+
+def _unique_video(rng, size_kb):
+    # A random free box keeps the content-addressed store from deduplicating uploads
+    tail = rng.randbytes(16)
+    return build_mp4(12.0, media_size=size_kb * 1024) + struct.pack(">I4s", 8 + len(tail), b"free") + tail
+
+
+async def _feed(client, data, args):
+    return await client.http.get(
+        "/posts/", headers=client.headers,
+        params={"limit": args.page_size, "skip": client.rng.randrange(max(1, len(data.post_ids) - args.page_size))}
+    )
+
+
+async def _post_by_id(client, data, args):
+    return await client.http.get(f"/posts/{client.rng.choice(data.post_ids)}", headers=client.headers)
+
+
+async def _reel_by_id(client, data, args):
+    return await client.http.get(f"/reels/{client.rng.choice(data.reel_ids)}", headers=client.headers)
+
+
+async def _comments(client, data, args):
+    # Comments are seeded on the first posts, so most pages are not empty
+    post_id = data.post_ids[min(len(data.post_ids) - 1, int(client.rng.expovariate(0.2)))]
+    return await client.http.get(f"/posts/{post_id}/comments", headers=client.headers)
+
+
+async def _vote(client, data, args):
+    # The vote route toggles: a second vote on the same post removes it
+    return await client.http.post("/vote/", headers=client.headers, json={"post_id": client.rng.choice(data.post_ids)})
+
+
+async def _follow(client, data, args):
+    user_id = client.rng.choice(data.user_ids)
+    if user_id in client.following:
+        client.following.discard(user_id)
+        return await client.http.post(f"/users/unfollow/{user_id}", headers=client.headers)
+    client.following.add(user_id)
+    return await client.http.post(f"/users/follow/{user_id}", headers=client.headers)
+
+
+async def _login(client, data, args):
+    return await client.http.post("/users/login", data={"username": client.username, "password": TEST_PASSWORD})
+
+
+async def _upload(client, data, args):
+    return await client.http.post(
+        "/reels/", headers=client.headers, data={"title": "load test"},
+        files={"video_file": ("load.mp4", _unique_video(client.rng, args.upload_kb), "video/mp4")},
+    )
+
+
+OPERATIONS = {
+    "feed": _feed,
+    "post_by_id": _post_by_id,
+    "reel_by_id": _reel_by_id,
+    "comments": _comments,
+    "vote": _vote,
+    "follow": _follow,
+    "login": _login,
+    "upload": _upload,
+}
+
+
+async def _register(http, prefix):
+    user_id, headers = await create_user_and_login(http, prefix)
+    me = await http.get("/users/me", headers=headers)
+    return user_id, me.json()["username"], headers
+
+
+async def _gather_limited(coroutines, limit):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+async def seed(http, args, rng) -> tuple[Dataset, list]:
+    """Create the content users and their content, and one user per client"""
+    data = Dataset()
+    authors = await _gather_limited([_register(http, "load_author") for _ in range(args.users)], 8)
+    data.user_ids = [user_id for user_id, _, _ in authors]
+
+    async def create_post(index):
+        _, _, headers = authors[index % len(authors)]
+        response = await http.post("/posts/", headers=headers, json={"title": f"load post {index}", "content": "x" * 280})
+        response.raise_for_status()
+        return response.json()["id"]
+
+    async def create_reel(index):
+        _, _, headers = authors[index % len(authors)]
+        response = await http.post(
+            "/reels/", headers=headers, data={"title": f"load reel {index}"},
+            files={"video_file": ("seed.mp4", _unique_video(rng, args.upload_kb), "video/mp4")},
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    data.post_ids = await _gather_limited([create_post(index) for index in range(args.posts)], 16)
+    data.reel_ids = await _gather_limited([create_reel(index) for index in range(args.reels)], 4)
+
+    # Comments pile up on the first posts, like on popular ones
+    async def create_comment(index):
+        _, _, headers = authors[index % len(authors)]
+        post_id = data.post_ids[min(len(data.post_ids) - 1, int(rng.expovariate(0.2)))]
+        response = await http.post(f"/posts/{post_id}/comment", headers=headers, json={"content": f"comment {index}"})
+        response.raise_for_status()
+
+    await _gather_limited([create_comment(index) for index in range(args.comments)], 16)
+
+    clients = await _gather_limited([_register(http, "load_client") for _ in range(max(args.concurrency))], 8)
+    return data, clients
+
+
+async def _worker(client, data, args, names, weights, deadline, warmup_until, results):
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            return
+        name = client.rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await OPERATIONS[name](client, data, args)
+            failed = response.is_error
+        except httpx.HTTPError:
+            failed = True
+        if started < warmup_until:
+            continue
+        samples, errors = results.setdefault(name, ([], [0]))
+        if failed:
+            errors[0] += 1
+        else:
+            samples.append(time.perf_counter() - started)
+
+
+async def run_level(base_url, data, clients, concurrency, args, mix) -> dict:
+    names, weights = zip(*((name, weight) for name, weight in mix.items() if weight > 0))
+    limits = httpx.Limits(max_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as http:
+        simulated = [
+            Client(http, user_id, username, headers, random.Random(f"{args.seed}-{concurrency}-{index}"))
+            for index, (user_id, username, headers) in enumerate(clients[:concurrency])
+        ]
+        started = time.perf_counter()
+        warmup_until = started + args.warmup
+        deadline = warmup_until + args.duration
+        results = {}
+        await asyncio.gather(*(
+            _worker(client, data, args, names, weights, deadline, warmup_until, results) for client in simulated
+        ))
+
+    operations = {}
+    total = 0
+    for name in names:
+        samples, errors = results.get(name, ([], [0]))
+        total += len(samples)
+        operations[name] = {
+            **summarize(samples),
+            "errors": errors[0],
+            "per_second": round(len(samples) / args.duration, 2),
+        }
+    return {"concurrency": concurrency, "requests_per_second": round(total / args.duration, 2), "operations": operations}
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def boot_server(args, work_dir):
+    """Start uvicorn on a fresh database; returns (process, base URL)"""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(work_dir, 'load.db')}",
+        STORAGE_ROOTS=json.dumps([os.path.join(work_dir, "media")]),
+        LOG_LEVEL="WARNING",
+        RATE_LIMIT_ENABLED="false",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.server_workers), "--no-access-log"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("server did not start within 60 seconds")
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_mix(pairs):
+    mix = dict(DEFAULT_MIX)
+    for pair in pairs:
+        name, _, weight = pair.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+async def main(args):
+    mix = _parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix="load_")
+    process = None
+    try:
+        base_url = args.base_url
+        if args.boot:
+            process, base_url = boot_server(args, work_dir)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120) as http:
+            seeding_started = time.perf_counter()
+            data, clients = await seed(http, args, rng)
+            seed_seconds = time.perf_counter() - seeding_started
+        levels = [await run_level(base_url, data, clients, concurrency, args, mix) for concurrency in args.concurrency]
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "revision": _git_revision(),
+        "config": {**vars(args), "mix": mix},
+        "seed_seconds": round(seed_seconds, 2),
+        "levels": levels,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--boot", action="store_true", help="start a server on a fresh database")
+    parser.add_argument("--database-url", help="database of the booted server, default a temporary SQLite file")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="clients per level")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds before each level")
+    parser.add_argument("--users", type=int, default=20, help="users owning the seeded content")
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--reels", type=int, default=20)
+    parser.add_argument("--comments", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--upload-kb", type=int, default=256, help="size of uploaded videos")
+    parser.add_argument("--mix", nargs="*", default=[], metavar="OP=WEIGHT", help="override operation weights")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the report to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,118 @@
+# benchmarks/media_delivery.py
+"""
+Compare video delivery through /media with the /uploads static mount.
+
+Uploads one reel, then downloads it concurrently through both paths,
+first as whole files and then as random 1 MB Range requests like a
+seeking player makes. Prints throughput and latency as JSON. With
+--server-pid (a server on this host, single worker) it also reports the
+server's CPU seconds per GB delivered, read from /proc/<pid>/stat.
+
+    python -m benchmarks.media_delivery --base-url http://127.0.0.1:8000 \
+        --server-pid 12345 --size-mb 50 --clients 16 --duration 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+
+from benchmarks.common import create_user_and_login, summarize
+from benchmarks.video_metadata import build_mp4
+
+RANGE_SIZE = 1024 * 1024
+
+
+def _cpu_seconds(pid):
+    """User + system CPU time of a process and its reaped children"""
+    if pid is None:
+        return None
+    with open(f"/proc/{pid}/stat") as stat_file:
+        # The command name may contain spaces; fields start after the last ')'
+        fields = stat_file.read().rsplit(")", 1)[1].split()
+    utime, stime, cutime, cstime = (int(value) for value in fields[11:15])
+    return (utime + stime + cutime + cstime) / os.sysconf("SC_CLK_TCK")
+
+
+async def _client(client, url, size, use_ranges, stop_at, samples, counters):
+    while time.perf_counter() < stop_at:
+        headers = {}
+        if use_ranges:
+            start = random.randrange(0, max(1, size - RANGE_SIZE))
+            headers["Range"] = f"bytes={start}-{start + RANGE_SIZE - 1}"
+        started = time.perf_counter()
+        received = 0
+        async with client.stream("GET", url, headers=headers) as response:
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+        if response.status_code not in (200, 206):
+            counters["errors"] += 1
+            continue
+        samples.append(time.perf_counter() - started)
+        counters["bytes"] += received
+
+
+async def _run_phase(args, url, size, use_ranges):
+    samples = []
+    counters = {"bytes": 0, "errors": 0}
+    limits = httpx.Limits(max_connections=args.clients + 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=300, limits=limits) as client:
+        cpu_before = _cpu_seconds(args.server_pid)
+        started = time.perf_counter()
+        stop_at = started + args.duration
+        await asyncio.gather(*(
+            _client(client, url, size, use_ranges, stop_at, samples, counters)
+            for _ in range(args.clients)
+        ))
+        elapsed = time.perf_counter() - started
+        cpu_after = _cpu_seconds(args.server_pid)
+
+    gigabytes = counters["bytes"] / 1e9
+    report = {
+        "requests": summarize(samples),
+        "errors": counters["errors"],
+        "mb_per_s": round(counters["bytes"] / elapsed / 1e6, 2),
+    }
+    if cpu_before is not None and gigabytes:
+        report["server_cpu_s_per_gb"] = round((cpu_after - cpu_before) / gigabytes, 3)
+    return report
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=300) as client:
+        _, headers = await create_user_and_login(client)
+        payload = build_mp4(60.0, media_size=args.size_mb * 1024 * 1024)
+        response = await client.post(
+            "/reels/",
+            headers=headers,
+            data={"title": "benchmark video"},
+            files={"video_file": ("bench.mp4", payload, "video/mp4")},
+        )
+        response.raise_for_status()
+        video_url = response.json()["video_url"]
+
+    # The same file through the dedicated route and through the generic mount
+    media_url = video_url
+    static_url = "/uploads/media/" + video_url.split("/media/", 1)[1]
+    size = len(payload)
+
+    report = {"config": vars(args), "media_url": media_url}
+    for name, url in (("static_mount", static_url), ("media_route", media_url)):
+        report[name] = {
+            "full": await _run_phase(args, url, size, use_ranges=False),
+            "ranges": await _run_phase(args, url, size, use_ranges=True),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--server-pid", type=int, help="pid of the server process, for CPU accounting")
+    parser.add_argument("--size-mb", type=int, default=50, help="size of the test video")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent downloaders")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per phase")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,157 @@
+# benchmarks/query_budgets.py
+"""
+Check the SQL statement budgets declared on the routes.
+
+Builds a throwaway SQLite database with --rows posts, reels, comments
+and follows spread over many owners, then calls every covered route at a
+page size of 1 and of --page-size with QUERY_BUDGET_MODE=raise and
+STRICT_LOADING=true. A route fails when it goes over its budget, makes a
+lazy relationship load, or runs more statements for the larger page (an
+N+1 loop). Prints the statement counts as JSON and exits non-zero on any
+failure, so it can run in CI.
+
+    python -m benchmarks.query_budgets --rows 40 --page-size 25
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+
+def _configure(work_dir):
+    # Settings are read when the app is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'budgets.db')}"
+    os.environ["QUERY_BUDGET_MODE"] = "raise"
+    os.environ["STRICT_LOADING"] = "true"
+    os.environ["JOB_WORKER_IN_APP"] = "false"
+
+
+def _seed(rows):
+    from sqlmodel import Session
+
+    from app.database import engine
+    from app.model import Comment, Follow, Post, PostVote, Reel, ReelVote, User
+
+    with Session(engine) as session:
+        users = [
+            User(username=f"budget_{index}", email=f"budget_{index}@example.com", password="unused")
+            for index in range(rows + 1)
+        ]
+        session.add_all(users)
+        session.flush()
+        viewer, owners = users[0], users[1:]
+        posts = [Post(title=f"post {index}", content="budget", owner_id=owner.id) for index, owner in enumerate(owners)]
+        reels = [
+            Reel(title=f"reel {index}", video_url="/media/unused.mp4", duration=10, owner_id=owner.id)
+            for index, owner in enumerate(owners)
+        ]
+        session.add_all(posts + reels)
+        session.flush()
+        session.add_all(PostVote(user_id=owner.id, post_id=posts[0].id) for owner in owners)
+        session.add_all(ReelVote(user_id=owner.id, reel_id=reels[0].id) for owner in owners)
+        comments = [Comment(content="budget", user_id=owner.id, post_id=posts[0].id) for owner in owners]
+        comments += [Comment(content="budget", user_id=owner.id, reel_id=reels[0].id) for owner in owners]
+        session.add_all(comments)
+        session.flush()
+        session.add_all(
+            Comment(content="reply", user_id=owner.id, post_id=posts[0].id, parent_id=comments[0].id) for owner in owners
+        )
+        session.add_all(Follow(follower_id=owner.id, following_id=viewer.id) for owner in owners)
+        session.add_all(Follow(follower_id=viewer.id, following_id=owner.id) for owner in owners)
+        posts[0].comment_count = reels[0].comment_count = comments[0].reply_count = len(owners)
+        session.commit()
+        return viewer.username, posts[0].id, reels[0].id, comments[0].id
+
+
+def _cases(post_id, reel_id, comment_id):
+    # (route template, URL, whether it takes a page size)
+    return [
+        ("/posts/", "/posts/", True),
+        ("/posts/latest", "/posts/latest", False),
+        ("/posts/{id}", f"/posts/{post_id}", False),
+        ("/reels/", "/reels/", True),
+        ("/reels/{id}", f"/reels/{reel_id}", False),
+        ("/posts/{post_id}/comments", f"/posts/{post_id}/comments", True),
+        ("/reels/{reel_id}/comments", f"/reels/{reel_id}/comments", True),
+        ("/comments/{comment_id}/replies", f"/comments/{comment_id}/replies", True),
+        ("/users/followers", "/users/followers", False),
+        ("/users/following", "/users/following", False),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=40, help="owners, and rows per table")
+    parser.add_argument("--page-size", type=int, default=25)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="query_budgets_")
+    try:
+        _configure(work_dir)
+        report, failures = run(args.rows, args.page_size)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps({"routes": report, "failures": failures}, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+def run(rows, page_size):
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from app.database import create_db_and_tables
+    from app.main import app
+    from app.routes.auth import create_access_token
+    from app.services.query_budget import route_query_budget
+
+    create_db_and_tables()
+    username, post_id, reel_id, comment_id = _seed(rows)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+
+    statements = [0]
+
+    def count(*_):
+        statements[0] += 1
+
+    event.listen(Engine, "after_cursor_execute", count)
+    client = TestClient(app)
+    budgets = {
+        (method, route.path): route_query_budget(route)
+        for route in app.routes
+        for method in getattr(route, "methods", ())
+        if route_query_budget(route) is not None
+    }
+
+    report, failures = {}, []
+    covered = set()
+    for template, url, paged in _cases(post_id, reel_id, comment_id):
+        budget = budgets.get(("GET", template))
+        covered.add(("GET", template))
+        counts = {}
+        for size in ((1, page_size) if paged else (None,)):
+            statements[0] = 0
+            try:
+                response = client.get(url, headers=headers, params={"limit": size} if size else None)
+                status = response.status_code
+            except Exception as exc:
+                # Budget overruns and lazy loads raise inside the app
+                failures.append(f"GET {template}: {type(exc).__name__}: {exc}")
+                continue
+            counts[size or "-"] = statements[0]
+            if status != 200:
+                failures.append(f"GET {template}: status {status}")
+        report[f"GET {template}"] = {"budget": budget, "queries": counts}
+        if budget is None:
+            failures.append(f"GET {template}: no query budget declared")
+        if paged and len(set(counts.values())) > 1:
+            failures.append(f"GET {template}: statement count grows with the page size {counts}")
+    for method, template in sorted(set(budgets) - covered):
+        failures.append(f"{method} {template}: budget declared but not covered here")
+    return report, failures
+
+
+if __name__ == "__main__":
+    main()
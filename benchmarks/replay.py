@@ -0,0 +1,231 @@
+# benchmarks/replay.py
+"""
+Replay captured production traffic against a staging server.
+
+Reads the files written by the traffic capture middleware
+(app/services/traffic_capture.py), re-issues the requests open-loop at
+their original spacing divided by --speedup, and prints per-route latency
+percentiles of the capture (server-side time in production) next to the
+replay (client-side time, so run it close to the server). With
+--baseline, the percentiles are also compared with an earlier replay
+report, which is the way to check a change: replay the same capture
+before and after it.
+
+Each captured user (subject hash) is mapped to one of --users accounts
+created on the target, so per-user skew is kept. Logins are replayed as
+logins of the mapped account, JSON bodies and query parameters are
+rebuilt with their original ids and string lengths, and multipart
+uploads are skipped.
+Writes are replayed too: point this at staging, never production. The
+replay comes from one IP, so run staging with RATE_LIMIT_ENABLED=false.
+
+    python -m benchmarks.replay captures/ --base-url http://staging:8000 --speedup 4 --output after.json
+    python -m benchmarks.replay captures/ --methods GET --baseline before.json
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import os
+import time
+import zlib
+
+import httpx
+
+from benchmarks.common import TEST_PASSWORD, create_user_and_login, summarize
+
+
+def load_captures(paths, methods=None, routes=None, limit=None) -> list[dict]:
+    """Captured requests from files or directories, in time order"""
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))) if os.path.isdir(path) else [path])
+    entries = []
+    for file_path in files:
+        try:
+            with gzip.open(file_path, "rt") as capture:
+                entries.extend(json.loads(line) for line in capture if line.strip())
+        except (EOFError, zlib.error):
+            # The last member of a file being written may be cut short
+            pass
+    entries = [
+        entry for entry in entries
+        if (not methods or entry["method"] in methods) and (not routes or entry["route"] in routes)
+    ]
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries[:limit] if limit else entries
+
+
+def rebuild_body(value):
+    """Inverse of redact_body: strings come back as filler of the same length"""
+    if isinstance(value, dict):
+        if set(value) == {"$len"}:
+            return "x" * value["$len"]
+        return {key: rebuild_body(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rebuild_body(item) for item in value]
+    return value
+
+
+def rebuild_query(query):
+    """Inverse of redact_query, as pairs for httpx; older captures stored the raw query string"""
+    if isinstance(query, str):
+        return query or None
+    return [(name, rebuild_body(value)) for name, value in query or ()]
+
+
+class Identities:
+    """Maps captured subjects onto accounts created on the target server"""
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self._assigned = {}
+
+    def account(self, subject):
+        if subject is None or subject == "invalid" or not self.accounts:
+            return None
+        if subject not in self._assigned:
+            self._assigned[subject] = self.accounts[len(self._assigned) % len(self.accounts)]
+        return self._assigned[subject]
+
+
+async def create_accounts(client, count):
+    async def create():
+        _, headers = await create_user_and_login(client, "replay")
+        me = await client.get("/users/me", headers=headers)
+        return me.json()["username"], headers
+
+    semaphore = asyncio.Semaphore(8)
+
+    async def limited():
+        async with semaphore:
+            return await create()
+
+    return await asyncio.gather(*(limited() for _ in range(count)))
+
+
+async def _send(client, entry, identities):
+    """Issue one captured request; returns the response, or None when skipped"""
+    account = identities.account(entry.get("subject"))
+    headers = {"Authorization": account[1]["Authorization"]} if account else {}
+    url = entry["path"]
+    params = rebuild_query(entry.get("query"))
+    if entry["path"] == "/users/login" and entry["method"] == "POST":
+        if account is None:
+            return None
+        return await client.post(url, params=params, data={"username": account[0], "password": TEST_PASSWORD})
+    if (entry.get("content_type") or "").startswith("multipart/"):
+        return None
+    if "body" in entry:
+        return await client.request(entry["method"], url, params=params, headers=headers, json=rebuild_body(entry["body"]))
+    return await client.request(entry["method"], url, params=params, headers=headers)
+
+
+async def replay(entries, base_url, speedup, max_in_flight, identities) -> dict:
+    results = {}
+    skipped = 0
+    max_lag = 0.0
+    semaphore = asyncio.Semaphore(max_in_flight)
+    limits = httpx.Limits(max_connections=max_in_flight)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def issue(entry):
+            nonlocal skipped
+            key = f"{entry['method']} {entry['route'] or entry['path']}"
+            result = results.setdefault(key, {"samples": [], "errors": 0, "status_mismatch": 0})
+            try:
+                started = time.perf_counter()
+                response = await _send(client, entry, identities)
+                elapsed = time.perf_counter() - started
+            except httpx.HTTPError:
+                result["errors"] += 1
+                return
+            finally:
+                semaphore.release()
+            if response is None:
+                skipped += 1
+                return
+            result["samples"].append(elapsed)
+            if response.status_code // 100 != entry["status"] // 100:
+                result["status_mismatch"] += 1
+
+        tasks = []
+        first_ts = entries[0]["ts"]
+        started = time.perf_counter()
+        for entry in entries:
+            # Open loop: requests go out on the captured schedule even if the server falls behind
+            due = started + (entry["ts"] - first_ts) / speedup
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await semaphore.acquire()
+            max_lag = max(max_lag, time.perf_counter() - due)
+            tasks.append(asyncio.create_task(issue(entry)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+    return {"results": results, "skipped": skipped, "max_schedule_lag_s": round(max_lag, 3), "wall_seconds": round(wall, 2)}
+
+
+def _ratio(new, old):
+    return round(new / old, 2) if new is not None and old else None
+
+
+def build_report(entries, replayed, baseline=None) -> dict:
+    captured = {}
+    for entry in entries:
+        captured.setdefault(f"{entry['method']} {entry['route'] or entry['path']}", []).append(entry["duration_ms"] / 1000)
+
+    routes = {}
+    for key, result in sorted(replayed["results"].items()):
+        replay_summary = summarize(result["samples"])
+        capture_summary = summarize(captured.get(key, []))
+        route = {
+            "captured": capture_summary,
+            "replayed": replay_summary,
+            "errors": result["errors"],
+            "status_mismatch": result["status_mismatch"],
+            "p95_vs_captured": _ratio(replay_summary["p95_ms"], capture_summary["p95_ms"]),
+        }
+        previous = (baseline or {}).get("routes", {}).get(key)
+        if previous:
+            route["vs_baseline"] = {
+                name: _ratio(replay_summary[name], previous["replayed"][name]) for name in ("p50_ms", "p95_ms", "p99_ms")
+            }
+        routes[key] = route
+    return {key: value for key, value in replayed.items() if key != "results"} | {"routes": routes}
+
+
+async def main(args):
+    entries = load_captures(args.captures, args.methods, args.routes, args.limit)
+    if not entries:
+        raise SystemExit("no captured requests match")
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        accounts = await create_accounts(client, args.users)
+    replayed = await replay(entries, args.base_url, args.speedup, args.max_in_flight, Identities(accounts))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    report = {"config": vars(args), "requests": len(entries), **build_report(entries, replayed, baseline)}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("captures", nargs="+", help="capture files or directories")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speedup", type=float, default=1.0, help="replay this many times faster")
+    parser.add_argument("--users", type=int, default=50, help="accounts standing in for the captured users")
+    parser.add_argument("--methods", nargs="*", help="only these methods, e.g. GET")
+    parser.add_argument("--routes", nargs="*", help="only these route templates, e.g. /posts/")
+    parser.add_argument("--limit", type=int, help="replay at most this many requests")
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--baseline", help="earlier replay report to compare with")
+    parser.add_argument("--output", help="also write the report to this file")
+    asyncio.run(main(parser.parse_args()))
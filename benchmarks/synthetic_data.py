@@ -0,0 +1,324 @@
+# benchmarks/synthetic_data.py
+"""
+Generate and bulk-load a realistic synthetic dataset.
+
+Creates users, follows, posts, reels, votes and comments consistent with
+app/model.py, with the skew of a real social network: a few users have
+most of the followers and write most of the content, a few posts get
+most of the votes and comments, and reply threads have a long tail.
+Everything is generated with numpy in memory, then loaded with COPY on
+Postgres or batched executemany on SQLite, in foreign key order.
+Denormalized counters (comment_count, reply_count) are filled in
+consistently.
+
+Every user gets the same password (benchmarks.common.TEST_PASSWORD),
+hashed once, so loading skips bcrypt and the load benchmark can log in as
+any of them (usernames are synth_<id>). New ids start after the current
+maximum, so loading into a non-empty database appends.
+
+    python -m benchmarks.synthetic_data --users 160000   # about 10M rows
+    python -m benchmarks.synthetic_data --users 1000 --database-url sqlite:///local.db
+"""
+import argparse
+import csv
+import io
+import json
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, func, select
+
+from app.model import Comment, Follow, Post, PostVote, Reel, ReelVote, User
+from benchmarks.common import TEST_PASSWORD
+
+SECONDS_PER_DAY = 86400
+# Shown in content so generated rows are easy to tell apart
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip"
+).split()
+
+
+def power_law_weights(rng, n: int, alpha: float) -> np.ndarray:
+    """
+    Probabilities proportional to 1 / rank ** alpha, in random order.
+
+    Args:
+        rng: numpy Generator
+        n: Number of items
+        alpha: Skew; around 1 gives the usual "top 1% gets half" shape
+
+    Returns:
+        Probabilities of the n items, summing to 1
+    """
+    weights = 1.0 / np.arange(1, n + 1) ** alpha
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _text_pool(rng, size: int, min_words: int, max_words: int) -> np.ndarray:
+    lengths = rng.integers(min_words, max_words + 1, size)
+    return np.array([" ".join(rng.choice(WORDS, length)) for length in lengths])
+
+
+def _after(rng, start: np.ndarray, mean_seconds: float, now: float) -> np.ndarray:
+    # Exponential delays after an event, never in the future
+    return np.minimum(start + rng.exponential(mean_seconds, len(start)), now)
+
+
+def _unique_pairs(left: np.ndarray, right: np.ndarray, distinct: bool = False):
+    """Drop duplicate (left, right) pairs, and pairs of equal values if distinct"""
+    keep = left != right if distinct else np.ones(len(left), dtype=bool)
+    keys = np.unique((left[keep].astype(np.int64) << 32) | right[keep].astype(np.int64))
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+def _timestamps(seconds: np.ndarray) -> np.ndarray:
+    # The text form SQLAlchemy writes for DateTime columns on both databases
+    as_text = np.datetime_as_string((seconds * 1e6).astype("datetime64[us]"), unit="us")
+    return np.char.replace(as_text, "T", " ")
+
+
+class Table:
+    """Generated rows of one table as named column arrays"""
+
+    def __init__(self, model, columns: dict, nullable: tuple = ()):
+        self.name = model.__tablename__
+        self.columns = columns
+        # Integer columns where a negative value stands for NULL
+        self.nullable = nullable
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def rows(self, start: int, stop: int):
+        values = []
+        for name, column in self.columns.items():
+            chunk = column[start:stop].tolist()
+            if name in self.nullable:
+                chunk = [None if value < 0 else value for value in chunk]
+            values.append(chunk)
+        return zip(*values)
+
+
+def generate(args, first_ids: dict) -> list[Table]:
+    """
+    Build the dataset in memory.
+
+    Args:
+        args: Parsed command line options with the scale and skew settings
+        first_ids: First free id per model
+
+    Returns:
+        The tables in an order that satisfies the foreign keys
+    """
+    from app.routes.auth import get_password_hash
+
+    rng = np.random.default_rng(args.seed)
+    now = time.time()
+    user_count = args.users
+
+    # Users joined over --days; activity (writing, voting) and popularity
+    # (being followed) are both power-law and independent of each other
+    user_ids = first_ids["user"] + np.arange(user_count)
+    user_created = np.sort(rng.uniform(now - args.days * SECONDS_PER_DAY, now, user_count))
+    activity = power_law_weights(rng, user_count, args.skew)
+    popularity = power_law_weights(rng, user_count, args.skew + 0.3)
+    names = np.char.add("synth_", user_ids.astype(str))
+    users = Table(User, {
+        "id": user_ids,
+        "username": names,
+        "email": np.char.add(names, "@example.com"),
+        "password": np.full(user_count, get_password_hash(TEST_PASSWORD)),
+        "created_at": _timestamps(user_created),
+    })
+
+    follower, following = _unique_pairs(
+        rng.choice(user_count, int(user_count * args.follows_per_user), p=activity),
+        rng.choice(user_count, int(user_count * args.follows_per_user), p=popularity),
+        distinct=True,
+    )
+    follows = Table(Follow, {"follower_id": user_ids[follower], "following_id": user_ids[following]})
+
+    def content(model, per_user: float):
+        count = int(user_count * per_user)
+        owner = rng.choice(user_count, count, p=activity)
+        created = user_created[owner] + rng.random(count) * (now - user_created[owner])
+        order = np.argsort(created)
+        return first_ids[model.__tablename__] + np.arange(count), owner[order], created[order]
+
+    post_ids, post_owner, post_created = content(Post, args.posts_per_user)
+    reel_ids, reel_owner, reel_created = content(Reel, args.reels_per_user)
+    post_popularity = power_law_weights(rng, len(post_ids), args.skew)
+    reel_popularity = power_law_weights(rng, len(reel_ids), args.skew)
+
+    def votes(model, column, popularity, count):
+        voter, target = _unique_pairs(
+            rng.choice(user_count, count, p=activity),
+            rng.choice(len(popularity), count, p=popularity),
+        )
+        return Table(model, {"user_id": user_ids[voter], column: target})
+
+    post_votes = votes(PostVote, "post_id", post_popularity, int(len(post_ids) * args.votes_per_post))
+    post_votes.columns["post_id"] = post_ids[post_votes.columns["post_id"]]
+    reel_votes = votes(ReelVote, "reel_id", reel_popularity, int(len(reel_ids) * args.votes_per_post))
+    reel_votes.columns["reel_id"] = reel_ids[reel_votes.columns["reel_id"]]
+
+    # Top-level comments go to popular posts and reels; replies pile onto
+    # a few threads, so some threads run to thousands of replies
+    comment_count = int(len(post_ids) * args.comments_per_post)
+    top_count = int(comment_count * (1 - args.reply_share))
+    on_reel = rng.random(top_count) < args.reel_comment_share
+    top_post = np.where(on_reel, -1, rng.choice(len(post_ids), top_count, p=post_popularity))
+    top_reel = np.where(on_reel, rng.choice(len(reel_ids), top_count, p=reel_popularity), -1)
+    top_created = _after(rng, np.where(on_reel, reel_created[top_reel], post_created[top_post]), SECONDS_PER_DAY, now)
+    order = np.argsort(top_created)
+    top_post, top_reel, top_created = top_post[order], top_reel[order], top_created[order]
+
+    reply_count = comment_count - top_count
+    parent = rng.choice(top_count, reply_count, p=power_law_weights(rng, top_count, args.skew))
+    reply_created = _after(rng, top_created[parent], SECONDS_PER_DAY / 4, now)
+    order = np.argsort(reply_created)
+    parent, reply_created = parent[order], reply_created[order]
+
+    comment_ids = first_ids["comment"] + np.arange(comment_count)
+    item_post = np.concatenate([top_post, top_post[parent]])
+    item_reel = np.concatenate([top_reel, top_reel[parent]])
+    texts = _text_pool(rng, 512, 3, 40)
+    comments = Table(Comment, {
+        "id": comment_ids,
+        "content": texts[rng.integers(len(texts), size=comment_count)],
+        "created_at": _timestamps(np.concatenate([top_created, reply_created])),
+        "user_id": user_ids[rng.choice(user_count, comment_count, p=activity)],
+        "post_id": np.where(item_post < 0, -1, post_ids[item_post]),
+        "reel_id": np.where(item_reel < 0, -1, reel_ids[item_reel]),
+        "parent_id": np.concatenate([np.full(top_count, -1), comment_ids[parent]]),
+        "reply_count": np.concatenate([np.bincount(parent, minlength=top_count), np.zeros(reply_count, dtype=np.int64)]),
+    }, nullable=("post_id", "reel_id", "parent_id"))
+
+    # Every comment, reply or not, counts towards its post or reel
+    titles = _text_pool(rng, 256, 2, 8)
+    bodies = _text_pool(rng, 512, 5, 80)
+    posts = Table(Post, {
+        "id": post_ids,
+        "title": titles[rng.integers(len(titles), size=len(post_ids))],
+        "content": bodies[rng.integers(len(bodies), size=len(post_ids))],
+        "published": np.ones(len(post_ids), dtype=bool),
+        "created_at": _timestamps(post_created),
+        "owner_id": user_ids[post_owner],
+        "comment_count": np.bincount(item_post[item_post >= 0], minlength=len(post_ids)),
+    })
+    reels = Table(Reel, {
+        "id": reel_ids,
+        "title": titles[rng.integers(len(titles), size=len(reel_ids))],
+        "video_url": np.char.add(np.char.add("/media/synthetic/", reel_ids.astype(str)), ".mp4"),
+        "duration": rng.integers(5, 111, len(reel_ids)),
+        "width": np.full(len(reel_ids), 1080),
+        "height": np.full(len(reel_ids), 1920),
+        "codec": np.full(len(reel_ids), "avc1"),
+        "created_at": _timestamps(reel_created),
+        "owner_id": user_ids[reel_owner],
+        "comment_count": np.bincount(item_reel[item_reel >= 0], minlength=len(reel_ids)),
+    })
+    return [users, follows, posts, reels, post_votes, reel_votes, comments]
+
+
+def _copy_postgres(raw, quote, table: Table, batch_size: int):
+    cursor = raw.cursor()
+    statement = f"COPY {quote(table.name)} ({', '.join(table.columns)}) FROM STDIN WITH (FORMAT csv)"
+    for start in range(0, len(table), batch_size):
+        buffer = io.StringIO()
+        # Unquoted empty fields are NULL in COPY's csv format
+        csv.writer(buffer).writerows(table.rows(start, start + batch_size))
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+    if "id" in table.columns:
+        # Explicit ids do not advance the serial sequence
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{quote(table.name)}', 'id'), max(id)) FROM {quote(table.name)}"
+        )
+
+
+def _insert_sqlite(raw, quote, table: Table, batch_size: int):
+    cursor = raw.cursor()
+    placeholders = ", ".join("?" for _ in table.columns)
+    statement = f"INSERT INTO {quote(table.name)} ({', '.join(table.columns)}) VALUES ({placeholders})"
+    for start in range(0, len(table), batch_size):
+        cursor.executemany(statement, table.rows(start, start + batch_size))
+
+
+def load(engine, tables: list[Table], batch_size: int) -> dict:
+    """Load the tables, one transaction each; returns rows and seconds per table"""
+    postgres = engine.dialect.name == "postgresql"
+    quote = engine.dialect.identifier_preparer.quote
+    report = {}
+    raw = engine.raw_connection()
+    try:
+        if not postgres:
+            raw.cursor().execute("PRAGMA synchronous = OFF")
+        for table in tables:
+            started = time.perf_counter()
+            (_copy_postgres if postgres else _insert_sqlite)(raw, quote, table, batch_size)
+            raw.commit()
+            report[table.name] = {"rows": len(table), "seconds": round(time.perf_counter() - started, 2)}
+        if postgres:
+            raw.cursor().execute("ANALYZE")
+            raw.commit()
+    finally:
+        raw.close()
+    return report
+
+
+def _first_ids(engine) -> dict:
+    with engine.connect() as connection:
+        return {
+            model.__tablename__: (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+            for model in (User, Post, Reel, Comment)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", help="target database, default the app's")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--follows-per-user", type=float, default=20)
+    parser.add_argument("--posts-per-user", type=float, default=5)
+    parser.add_argument("--reels-per-user", type=float, default=0.5)
+    parser.add_argument("--votes-per-post", type=float, default=8, help="for reels too")
+    parser.add_argument("--comments-per-post", type=float, default=6)
+    parser.add_argument("--reply-share", type=float, default=0.4, help="fraction of comments that are replies")
+    parser.add_argument("--reel-comment-share", type=float, default=0.2, help="fraction of threads on reels")
+    parser.add_argument("--skew", type=float, default=1.1, help="power-law exponent of activity and popularity")
+    parser.add_argument("--days", type=float, default=365, help="time span of the data")
+    parser.add_argument("--batch-size", type=int, default=50000, help="rows per COPY or executemany")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--create-tables", action="store_true", help="create missing tables first")
+    args = parser.parse_args()
+    if args.users * args.reels_per_user < 1 or args.users * args.posts_per_user < 1:
+        parser.error("the dataset needs at least one post and one reel")
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        from app.database import engine
+    if args.create_tables:
+        from sqlmodel import SQLModel
+        SQLModel.metadata.create_all(engine)
+
+    started = time.perf_counter()
+    tables = generate(args, _first_ids(engine))
+    generated = time.perf_counter()
+    report = load(engine, tables, args.batch_size)
+    finished = time.perf_counter()
+    rows = sum(table["rows"] for table in report.values())
+    print(json.dumps({
+        "tables": report,
+        "rows": rows,
+        "generate_seconds": round(generated - started, 2),
+        "load_seconds": round(finished - generated, 2),
+        "rows_per_second": round(rows / (finished - started)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/upload_concurrency.py
+"""
+Measure read latency while reels are being uploaded.
+
+Runs concurrent POST /reels/ uploads next to concurrent GET /posts/latest
+reads against a running server and prints read latency with and without
+the upload load as JSON. Blocking file I/O on the event loop shows up as
+a large gap between the two. Start the server with
+RATE_LIMIT_ENABLED=false, or the upload rate limit rejects most uploads.
+
+    python -m benchmarks.upload_concurrency --base-url http://127.0.0.1:8000 \
+        --uploads 8 --readers 32 --size-mb 40 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import create_user_and_login, summarize
+from benchmarks.video_metadata import build_mp4
+
+
+async def _reader(client, headers, stop_at, samples):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        await client.get("/posts/latest", headers=headers)
+        samples.append(time.perf_counter() - started)
+
+
+async def _uploader(client, headers, stop_at, payload, samples, failures):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        response = await client.post(
+            "/reels/",
+            headers=headers,
+            data={"title": "benchmark upload"},
+            files={"video_file": ("bench.mp4", payload, "video/mp4")},
+        )
+        if response.status_code == 201:
+            samples.append(time.perf_counter() - started)
+        else:
+            failures.append(response.status_code)
+
+
+async def _run_phase(base_url, headers, readers, uploads, payload, duration):
+    read_samples, upload_samples, failures = [], [], []
+    limits = httpx.Limits(max_connections=readers + uploads + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        stop_at = time.perf_counter() + duration
+        tasks = [_reader(client, headers, stop_at, read_samples) for _ in range(readers)]
+        tasks += [_uploader(client, headers, stop_at, payload, upload_samples, failures) for _ in range(uploads)]
+        await asyncio.gather(*tasks)
+    return {
+        "reads": summarize(read_samples),
+        "uploads": summarize(upload_samples),
+        "upload_failures": len(failures),
+        "upload_mb_per_s": round(len(upload_samples) * len(payload) / duration / 1e6, 2),
+    }
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        _, headers = await create_user_and_login(client)
+        # GET /posts/latest needs at least one post
+        await client.post("/posts/", headers=headers, json={"title": "bench", "content": "bench"})
+
+    payload = build_mp4(60.0, media_size=args.size_mb * 1024 * 1024)
+    report = {
+        "config": vars(args),
+        "reads_only": await _run_phase(args.base_url, headers, args.readers, 0, payload, args.duration),
+        "reads_with_uploads": await _run_phase(args.base_url, headers, args.readers, args.uploads, payload, args.duration),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--uploads", type=int, default=8, help="concurrent uploaders")
+    parser.add_argument("--readers", type=int, default=32, help="concurrent readers")
+    parser.add_argument("--size-mb", type=int, default=40, help="size of each uploaded video")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per phase")
+    asyncio.run(main(parser.parse_args()))
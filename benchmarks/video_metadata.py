@@ -0,0 +1,87 @@
+# benchmarks/video_metadata.py
+"""
+Time video metadata extraction.
+
+Parses the given files, or a synthetic MP4 of --size-mb with the moov box
+after the media data (the worst case for a reader that does not seek),
+and prints the metadata and per-parse timings as JSON.
+
+    python -m benchmarks.video_metadata --size-mb 50 --iterations 1000
+    python -m benchmarks.video_metadata path/to/video.mp4
+"""
+import argparse
+import json
+import os
+import struct
+import tempfile
+import time
+
+from app.services.video_metadata import parse_video_metadata
+from benchmarks.common import percentile
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _full_box(box_type: bytes, payload: bytes, version: int = 0) -> bytes:
+    return _box(box_type, struct.pack(">I", version << 24) + payload)
+
+
+def build_mp4(duration: float, width: int = 1080, height: int = 1920, codec: bytes = b"avc1",
+              media_size: int = 0, moov_first: bool = False) -> bytes:
+    """A minimal MP4 with one video track and ``media_size`` bytes of mdat"""
+    timescale = 1000
+    mvhd = _full_box(b"mvhd", struct.pack(">IIII", 0, 0, timescale, int(duration * timescale)) + bytes(80))
+    tkhd = _full_box(b"tkhd", bytes(76) + struct.pack(">II", width << 16, height << 16))
+    hdlr = _full_box(b"hdlr", struct.pack(">I4s", 0, b"vide") + bytes(12) + b"video\x00")
+    entry = _box(codec, bytes(6) + struct.pack(">H", 1) + bytes(16) + struct.pack(">HH", width, height) + bytes(50))
+    stsd = _full_box(b"stsd", struct.pack(">I", 1) + entry)
+    # A large sample table the parser has to skip over
+    stsz = _full_box(b"stsz", struct.pack(">II", 0, 30 * int(duration)) + bytes(4 * 30 * int(duration)))
+    stbl = _box(b"stbl", stsd + stsz)
+    mdia = _box(b"mdia", hdlr + _box(b"minf", stbl))
+    moov = _box(b"moov", mvhd + _box(b"trak", tkhd + mdia))
+    ftyp = _box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2avc1mp41")
+    mdat_header = struct.pack(">I4s", 8 + media_size, b"mdat")
+    if moov_first:
+        return ftyp + moov + mdat_header + bytes(media_size)
+    return ftyp + mdat_header + bytes(media_size) + moov
+
+
+def _time_parse(path, iterations):
+    samples = []
+    with open(path, "rb") as file:
+        metadata = parse_video_metadata(file)
+        for _ in range(iterations):
+            started = time.perf_counter()
+            parse_video_metadata(file)
+            samples.append(time.perf_counter() - started)
+    return {
+        "file": path,
+        "size_bytes": os.path.getsize(path),
+        "metadata": metadata.to_dict(),
+        "p50_us": round(percentile(samples, 0.50) * 1e6, 1),
+        "p99_us": round(percentile(samples, 0.99) * 1e6, 1),
+        "max_us": round(max(samples) * 1e6, 1),
+    }
+
+
+def main(args):
+    results = []
+    for path in args.files:
+        results.append(_time_parse(path, args.iterations))
+    if not args.files:
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as video:
+            video.write(build_mp4(100.0, media_size=args.size_mb * 1024 * 1024))
+            video.flush()
+            results.append(_time_parse(video.name, args.iterations))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="*", help="videos to parse (default: a synthetic MP4)")
+    parser.add_argument("--size-mb", type=int, default=50, help="size of the synthetic MP4")
+    parser.add_argument("--iterations", type=int, default=1000)
+    main(parser.parse_args())